@@ -1,269 +1,125 @@
-from flask import Flask, jsonify, request
-import stripe
-import os
+import logging
 import time
-import traceback
-import json
-import requests
-import base64
-from datetime import datetime, timedelta
+
+_inicio_import = time.perf_counter()
+
+from flask import Flask, jsonify
 from flask_cors import CORS
-from config import STRIPE_SECRET_KEY, STRIPE_PUBLIC_KEY
-import firebase_admin
-from firebase_admin import credentials, firestore
-from routes.webhook_opencode import init_webhook_routes
-from routes.software_personalizado import init_software_personalizado_routes
-from routes.mensalidade import init_mensalidade_routes
+from config import WEBHOOK_ASYNC
+from services.admissao import init_admissao
+from services.firebase import db, verificar_conexao, disjuntor_firestore
+from services.logs import configurar_logs, init_correlacao
+from services.serializacao import init_serializacao
+from services.contas_stripe import contas
+from services.stripe_client import tempo_stripe
+from services.webhook_fila import webhook_fila
+from routes.boleto import init_boleto_routes
+from routes.boleto_eventos import init_boleto_eventos_routes
+from routes.metricas import init_metricas
+from routes.boleto_lote import init_boleto_lote_routes
+from routes.ledger import init_ledger_routes
+from routes.faturas import init_faturas_routes
+from routes.notificacoes import init_notificacoes_routes
+from routes.webhooks import init_webhook_dispatcher
 from tests.webhook_test import init_webhook_tests
 from tests.payment_test import init_payment_tests
 from tests.software_personalizado_test import init_webhook_tests as init_software_tests
 from tests.mensalidade_test import init_mensalidade_tests
 
-
-
-print("\n=== INICIALIZANDO FIREBASE ===")
-try:
-    # Obtém as credenciais da variável de ambiente
-    firebase_credentials = os.getenv('FIREBASE_CREDENTIALS')
-    if not firebase_credentials:
-        raise ValueError("Variável de ambiente FIREBASE_CREDENTIALS não encontrada")
-    
-    # Decodifica as credenciais base64
-    cred_json = base64.b64decode(firebase_credentials).decode('utf-8')
-    cred_dict = json.loads(cred_json)
-    
-    # Inicializa o Firebase Admin com as credenciais
-    cred = credentials.Certificate(cred_dict)
-    print("✅ Credenciais carregadas da variável de ambiente")
-    
-    app = firebase_admin.initialize_app(cred, {
-        'projectId': 'empresa-fe1a8',
-        'databaseURL': 'https://empresa-fe1a8.firebaseio.com'
-    })
-    print("✅ Firebase Admin inicializado com sucesso")
-    
-    # Inicializa o Firestore
-    db = firestore.client(app)
-    db._database = 'empresa'  # Define o banco de dados específico
-    print("✅ Cliente Firestore criado com banco de dados 'empresa'")
-    
-    # Teste de conexão
-    test_ref = db.collection('clientes').limit(1)
-    test_docs = test_ref.get()
-    print("✅ Conexão com Firestore testada com sucesso")
-    
-except Exception as e:
-    print(f"❌ ERRO ao inicializar Firebase: {str(e)}")
-    print(f"Stack trace: {traceback.format_exc()}")
-    raise e
-
-app = Flask(__name__)
-CORS(app)  # Habilita CORS para todas as rotas
-
-# Configuração do Stripe
-stripe.api_key = STRIPE_SECRET_KEY
-
-print("\n=== CONFIGURAÇÃO DO STRIPE ===")
-print("Chave secreta:", stripe.api_key[:10] + "...")
-print("Chave pública:", STRIPE_PUBLIC_KEY[:10] + "...")
-
-# Inicializa as rotas do webhook
-init_webhook_routes(app, db)
-init_software_personalizado_routes(app, db)
-init_mensalidade_routes(app, db)
-init_webhook_tests(app, db)
-init_payment_tests(app)
-init_software_tests(app, db)
-init_mensalidade_tests(app, db)
-
-@app.route('/gerar-boleto', methods=['POST'])
-def gerar_boleto():
-    try:
-        print("\n=== INÍCIO DA REQUISIÇÃO ===")
-        data = request.get_json()
-        print("Dados recebidos:", data)
-        
-        # Validação dos dados
-        valor = data.get('valor')
-        email = data.get('email')
-        nome = data.get('nome')
-        cpf = data.get('cpf')
-        descricao = data.get('descricao', 'Pagamento via Boleto')
-        metadata = data.get('metadata', {})  # Obtém o metadata do payload
-        
-        # Dados do endereço
-        endereco = data.get('endereco', {})
-        rua = endereco.get('rua', 'Rua não informada')
-        numero = endereco.get('numero', 'S/N')
-        complemento = endereco.get('complemento', '')
-        cidade = endereco.get('cidade', 'Cidade não informada')
-        estado = endereco.get('estado', 'Estado não informado')
-        cep = endereco.get('cep', '00000000')
-        
-        if not valor:
-            return jsonify({'erro': 'Valor é obrigatório'}), 400
-        if not email:
-            return jsonify({'erro': 'Email é obrigatório'}), 400
-        if not nome:
-            return jsonify({'erro': 'Nome é obrigatório'}), 400
-        if not cpf:
-            return jsonify({'erro': 'CPF é obrigatório'}), 400
-
-        # Limpa o CPF (remove pontos e traços)
-        cpf_limpo = cpf.replace('.', '').replace('-', '')
-        
-        # Limpa o CEP (remove traço)
-        cep_limpo = cep.replace('-', '')
-        
-        print("\n=== CRIANDO PAGAMENTO ===")
-        print("Metadata que será enviado:", metadata)  # Log do metadata
-        
-        # Cria o pagamento do boleto
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(float(valor) * 100),  # Valor em centavos
-            currency='brl',
-            payment_method_types=['boleto'],
-            payment_method_data={
-                'type': 'boleto',
-                'boleto': {
-                    'tax_id': cpf_limpo
-                },
-                'billing_details': {
-                    'name': nome,
-                    'email': email,
-                    'address': {
-                        'line1': f"{rua}, {numero}",
-                        'line2': complemento,
-                        'city': cidade,
-                        'state': estado,
-                        'postal_code': cep_limpo,
-                        'country': 'BR'
-                    }
-                }
-            },
-            description=descricao,
-            metadata=metadata,  # Adiciona o metadata ao PaymentIntent
-            confirm=True
-        )
-        print("Pagamento criado:", payment_intent.id)
-        print("Metadata do PaymentIntent:", payment_intent.metadata)  # Log do metadata do PaymentIntent
-
-        # Obtém os detalhes do boleto corretamente
-        boleto_display = payment_intent.next_action['boleto_display_details']
-
-        response_data = {
-            'boleto_id': payment_intent.id,
-            'codigo_barras': boleto_display.get('number'),
-            'linha_digitavel': boleto_display.get('line'),
-            'pdf_url': boleto_display.get('hosted_voucher_url'),
-            'valor': valor,
-            'data_vencimento': (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d'),
-            'status': payment_intent.status,
-            'public_key': STRIPE_PUBLIC_KEY,
-            'metadata': payment_intent.metadata,  # Inclui o metadata na resposta
-            'instrucoes': [
-                '1. Copie o código de barras ou linha digitável',
-                '2. Pague em qualquer banco ou lotérica',
-                '3. Ou acesse o PDF do boleto para imprimir',
-                '4. O pagamento será confirmado automaticamente'
-            ]
-        }
-
-        print("\n=== RESPOSTA FINAL ===")
-        print("Dados que serão retornados:", response_data)
-        return jsonify(response_data)
-
-    except stripe.error.StripeError as e:
-        print("\n=== ERRO DO STRIPE ===")
-        print("Tipo do erro:", type(e).__name__)
-        print("Mensagem do erro:", str(e))
+_tempo_import = time.perf_counter() - _inicio_import
+
+logger = logging.getLogger(__name__)
+
+
+def create_app():
+    """Monta a aplicação sem acessar a rede.
+
+    Firestore e Stripe são inicializados no primeiro uso; a conexão com o
+    Firestore é testada em /prontidao e não no boot dos workers.
+    """
+    inicio = time.perf_counter()
+    configurar_logs()
+
+    app = Flask(__name__)
+    init_serializacao(app)  # jsonify/get_json com o backend rápido
+    CORS(app)  # Habilita CORS para todas as rotas
+    init_correlacao(app)
+    init_metricas(app)
+    init_admissao(app)
+
+    # Cada conta Stripe tem o seu cliente (services.contas_stripe); nada usa a chave global da biblioteca
+    for conta in contas:
+        logger.info("Conta Stripe %s configurada (chave pública %s...)", conta.nome, (conta.public_key or '')[:10])
+
+    # Inicializa as rotas
+    init_boleto_routes(app)
+    init_boleto_eventos_routes(app)
+    init_boleto_lote_routes(app)
+    init_ledger_routes(app)
+    init_faturas_routes(app, db)
+    init_notificacoes_routes(app)
+    init_webhook_dispatcher(app, db)
+    init_webhook_tests(app, db)
+    init_payment_tests(app)
+    init_software_tests(app, db)
+    init_mensalidade_tests(app, db)
+
+    # Ingestão assíncrona: os webhooks só gravam na fila e o pool aplica no Firestore.
+    # Também é chamada a cada requisição para recriar as threads em workers
+    # criados por fork depois do create_app (gunicorn --preload).
+    if WEBHOOK_ASYNC:
+        webhook_fila.iniciar()
+
+        @app.before_request
+        def garantir_fila_webhooks():
+            webhook_fila.iniciar()
+
+    @app.route('/webhooks/fila', methods=['GET'])
+    def metricas_fila_webhooks():
         return jsonify({
-            'erro': 'Erro ao gerar boleto',
-            'detalhes': str(e)
-        }), 400
-    except Exception as e:
-        print("\n=== ERRO GERAL ===")
-        print("Tipo do erro:", type(e).__name__)
-        print("Mensagem do erro:", str(e))
+            'modo_assincrono': WEBHOOK_ASYNC,
+            **webhook_fila.metricas()
+        })
+
+    @app.route('/stripe/metricas', methods=['GET'])
+    def metricas_stripe():
+        return jsonify({'chamadas': tempo_stripe.resumo()})
+
+    @app.route('/saude', methods=['GET'])
+    def saude():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/prontidao', methods=['GET'])
+    def prontidao():
+        try:
+            verificar_conexao()
+            status_firestore = 'ok'
+        except Exception as e:
+            logger.warning("Firestore indisponível: %s", str(e))
+            status_firestore = str(e)
+
+        pronto = status_firestore == 'ok'
         return jsonify({
-            'erro': 'Erro interno do servidor',
-            'detalhes': str(e)
-        }), 500 
+            'status': 'pronto' if pronto else 'indisponivel',
+            'firestore': status_firestore,
+            'disjuntores': {
+                **{conta.disjuntor.nome: conta.disjuntor.estado for conta in contas},
+                'firestore': disjuntor_firestore.estado
+            },
+            'inicializacao': app.config['TEMPOS_INICIALIZACAO']
+        }), 200 if pronto else 503
+
+    app.config['TEMPOS_INICIALIZACAO'] = {
+        'import_ms': round(_tempo_import * 1000, 1),
+        'create_app_ms': round((time.perf_counter() - inicio) * 1000, 1)
+    }
+    logger.info("Tempo de inicialização", extra={'tempos': app.config['TEMPOS_INICIALIZACAO']})
+    return app
 
-@app.route('/verificar-boleto/<boleto_id>', methods=['GET'])
-def verificar_boleto(boleto_id):
-    try:
-        print("\n=== VERIFICANDO BOLETO ===")
-        print("ID do boleto:", boleto_id)
-        
-        # Busca o PaymentIntent com expansão do campo charges
-        payment_intent = stripe.PaymentIntent.retrieve(
-            boleto_id,
-            expand=['charges']
-        )
-        print("\n=== DADOS DO PAGAMENTO ===")
-        print("Status do PaymentIntent:", payment_intent.status)
-        print("Tem charges?", hasattr(payment_intent, 'charges'))
-        if hasattr(payment_intent, 'charges'):
-            print("Número de charges:", len(payment_intent.charges.data))
-            for charge in payment_intent.charges.data:
-                print("Status da charge:", charge.status)
-                print("ID da charge:", charge.id)
-        
-        # Obtém os detalhes do boleto
-        charge = payment_intent.charges.data[0] if hasattr(payment_intent, 'charges') and payment_intent.charges.data else None
-        boleto_details = charge.payment_method_details.boleto if charge and hasattr(charge, 'payment_method_details') else None
-        
-        # Verifica se o boleto realmente foi pago
-        is_paid = False
-        if charge:
-            is_paid = charge.status == 'succeeded'
-            print("\n=== STATUS DO PAGAMENTO ===")
-            print("Status da charge:", charge.status)
-            print("Boleto pago:", is_paid)
-        
-        response_data = {
-            'status': 'succeeded' if is_paid else 'requires_action',
-            'valor': payment_intent.amount / 100,  # Converte de centavos para reais
-            'email': payment_intent.receipt_email,
-            'data_criacao': datetime.fromtimestamp(payment_intent.created).strftime('%Y-%m-%d %H:%M:%S'),
-            'data_aprovacao': datetime.fromtimestamp(charge.created).strftime('%Y-%m-%d %H:%M:%S') if charge and is_paid else None,
-            'public_key': STRIPE_PUBLIC_KEY,
-            'boleto': {
-                'codigo_barras': boleto_details.barcode if boleto_details else None,
-                'linha_digitavel': boleto_details.line if boleto_details else None,
-                'pdf_url': boleto_details.hosted_voucher_url if boleto_details else None
-            } if boleto_details else None,
-            'debug_info': {
-                'payment_intent_status': payment_intent.status,
-                'has_charges': hasattr(payment_intent, 'charges'),
-                'charge_status': charge.status if charge else None,
-                'is_paid': is_paid
-            }
-        }
-        
-        print("\n=== RESPOSTA FINAL ===")
-        print("Dados que serão retornados:", response_data)
-        return jsonify(response_data)
-        
-    except stripe.error.StripeError as e:
-        print("\n=== ERRO DO STRIPE ===")
-        print("Tipo do erro:", type(e).__name__)
-        print("Mensagem do erro:", str(e))
-        return jsonify({
-            'erro': 'Erro ao verificar boleto',
-            'detalhes': str(e)
-        }), 400
-    except Exception as e:
-        print("\n=== ERRO GERAL ===")
-        print("Tipo do erro:", type(e).__name__)
-        print("Mensagem do erro:", str(e))
-        return jsonify({
-            'erro': 'Erro interno do servidor',
-            'detalhes': str(e)
-        }), 500
 
+# Instância usada por `gunicorn app:app`
+app = create_app()
 
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,321 @@
+"""Modo ASGI: as rotas de boleto e de webhooks atendidas por handlers assíncronos.
+
+Uso:
+    uvicorn asgi:app --workers 4
+
+/gerar-boleto e /verificar-boleto/<id> falam com o Stripe por httpx, sem
+ocupar uma thread por requisição. /verificar-boleto/<id>/eventos (SSE) também
+não prende uma thread por conexão aberta. Os webhooks validam e aplicam o evento
+com o mesmo código do modo WSGI, numa thread (o SDK do Firestore usado
+pelos handlers é síncrono). As demais rotas são repassadas à aplicação
+Flask.
+"""
+import asyncio
+import logging
+import re
+import time
+import uuid
+
+import stripe
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from config import WEBHOOK_ASYNC, WEBHOOK_MAX_BYTES, SSE_HEARTBEAT, SSE_DURACAO_MAX
+from routes.boleto_eventos import STATUS_FINAIS, SSE_RETRY_MS, CABECALHOS_SSE, formatar_evento
+from routes.metricas import observar_requisicao
+from routes.webhooks import WEBHOOK_ENDPOINTS, checar_cabecalho, receber_webhook
+from services.admissao import limites_admissao, resposta_saturada
+from services.boletos import (
+    validar_boleto, chave_idempotencia, gerar_boleto_idempotente_async, status_boleto, status_obsoleto,
+    MAX_TAMANHO_CHAVE, STRIPE_INDISPONIVEL
+)
+from services.chamada_unica import ChamadaUnicaAsync
+from services.contas_stripe import contas, ContaDesconhecida
+from services.disjuntor import CircuitoAberto
+from services import serializacao
+from services.logs import request_id
+from services.notificacoes import notificacoes
+from services.serializacao import dumps_resposta
+from services.status_cache import status_cache
+from services.status_eventos import status_hub
+from services.webhook_fila import webhook_fila
+
+logger = logging.getLogger(__name__)
+
+VERIFICAR_REGEX = re.compile(r'^/verificar-boleto/([^/]+)$')
+EVENTOS_REGEX = re.compile(r'^/verificar-boleto/([^/]+)/eventos$')
+
+# Consultas simultâneas ao mesmo PaymentIntent esperam a que já está em andamento
+consultas_status = ChamadaUnicaAsync('verificar_boleto')
+
+_wsgi = WsgiToAsgi(flask_app)
+_webhooks = {rota: endpoint for endpoint, rota in WEBHOOK_ENDPOINTS.items()}
+
+
+async def _ler_corpo(receive, limite=None):
+    """Lê o corpo; com `limite`, para de ler logo depois de passá-lo."""
+    partes = []
+    tamanho = 0
+    while True:
+        mensagem = await receive()
+        parte = mensagem.get('body', b'')
+        partes.append(parte)
+        tamanho += len(parte)
+        if not mensagem.get('more_body') or (limite is not None and tamanho > limite):
+            return b''.join(partes)
+
+
+async def _responder(send, dados, status=200, headers=None):
+    corpo = dumps_resposta(dados)
+    cabecalhos = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(corpo)).encode()),
+        # Mesmo comportamento do flask-cors no modo WSGI
+        (b'access-control-allow-origin', b'*'),
+        (b'x-request-id', request_id.get().encode('latin-1', 'replace'))
+    ]
+    for nome, valor in (headers or {}).items():
+        cabecalhos.append((nome.lower().encode('latin-1'), valor.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': cabecalhos})
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+async def _status_cache(metodo, *args):
+    # Com Redis configurado o cache faz rede: não bloqueia o event loop
+    if status_cache.backend:
+        return await asyncio.to_thread(getattr(status_cache, metodo), *args)
+    return getattr(status_cache, metodo)(*args)
+
+
+async def gerar_boleto(headers, corpo):
+    try:
+        data = serializacao.loads(corpo or b'null')
+    except ValueError:
+        return {'erro': 'JSON inválido'}, 400, None
+
+    dados, erro = validar_boleto(data)
+    if erro:
+        return {'erro': erro}, 400, None
+
+    chave = chave_idempotencia(dados, headers.get('idempotency-key'))
+    if len(chave) > MAX_TAMANHO_CHAVE:
+        return {'erro': f'Idempotency-Key deve ter no máximo {MAX_TAMANHO_CHAVE} caracteres'}, 400, None
+
+    conta = contas.da_requisicao(headers, dados['metadata'])
+    response_data, reaproveitado = await gerar_boleto_idempotente_async(chave, dados, conta)
+    return response_data, 200, {'Idempotent-Replayed': 'true'} if reaproveitado else None
+
+
+async def verificar_boleto(headers, boleto_id):
+    return await status_do_boleto(boleto_id, contas.da_requisicao(headers))
+
+
+async def status_do_boleto(boleto_id, conta):
+    response_data = await _status_cache('get', conta.chave_cache(boleto_id))
+    if response_data is not None:
+        logger.debug("Status do boleto %s obtido do cache: %s", boleto_id, response_data['status'])
+        return response_data, 200, None
+    return await consultas_status.executar((conta.nome, boleto_id), lambda: _consultar_status(boleto_id, conta))
+
+
+async def _consultar_status(boleto_id, conta):
+    try:
+        payment_intent = await conta.stripe_async.obter_payment_intent(boleto_id, {'expand': ['charges']})
+    except STRIPE_INDISPONIVEL as e:
+        # Com o Stripe fora, o último status conhecido
+        return status_obsoleto(boleto_id, conta, e), 200, {'X-Status-Obsoleto': 'true'}
+    response_data = status_boleto(payment_intent, conta)
+    await _status_cache('set', conta.chave_cache(boleto_id), response_data)
+
+    logger.info("Boleto %s verificado no Stripe: %s", boleto_id, response_data['status'])
+    return response_data, 200, None
+
+
+async def _atender(send, handler, erro_stripe, *args):
+    try:
+        dados, status, headers = await handler(*args)
+    except ContaDesconhecida as e:
+        dados, status, headers = {'erro': str(e)}, 400, None
+    except CircuitoAberto as e:
+        logger.warning("%s: %s", erro_stripe, str(e))
+        dados, status, headers = {'erro': erro_stripe, 'detalhes': str(e)}, 503, {'Retry-After': e.retry_after_header}
+    except stripe.error.StripeError as e:
+        logger.warning("%s: %s: %s", erro_stripe, type(e).__name__, str(e))
+        dados, status, headers = {'erro': erro_stripe, 'detalhes': str(e)}, 400, None
+    except Exception as e:
+        logger.exception("Erro interno: %s", type(e).__name__)
+        dados, status, headers = {'erro': 'Erro interno do servidor', 'detalhes': str(e)}, 500, None
+    await _responder(send, dados, status, headers)
+
+
+async def _eventos(receive, send, headers, boleto_id):
+    """SSE do status do boleto, com o mesmo protocolo da rota do Flask."""
+    try:
+        conta = contas.da_requisicao(headers)
+    except ContaDesconhecida as e:
+        return await _responder(send, {'erro': str(e)}, 400)
+
+    loop = asyncio.get_running_loop()
+    fila = asyncio.Queue()
+    # O hub entrega na thread de quem publica: repassa para o event loop
+    assinatura = status_hub.inscrever(conta.chave_cache(boleto_id), lambda m: loop.call_soon_threadsafe(fila.put_nowait, m))
+    if assinatura is None:
+        logger.warning("Limite de conexões SSE atingido")
+        return await _responder(send, {'erro': 'Limite de conexões atingido, use /verificar-boleto'}, 503, {
+            'Retry-After': str(SSE_RETRY_MS // 1000)
+        })
+
+    async def desconexao():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    desconectado = asyncio.ensure_future(desconexao())
+    try:
+        try:
+            dados, _, _ = await status_do_boleto(boleto_id, conta)
+        except CircuitoAberto as e:
+            logger.warning("Erro ao verificar boleto: %s", str(e))
+            return await _responder(send, {'erro': 'Erro ao verificar boleto', 'detalhes': str(e)}, 503, {
+                'Retry-After': e.retry_after_header
+            })
+        except stripe.error.StripeError as e:
+            logger.warning("Erro ao verificar boleto: %s: %s", type(e).__name__, str(e))
+            return await _responder(send, {'erro': 'Erro ao verificar boleto', 'detalhes': str(e)}, 400)
+
+        cabecalhos = [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'access-control-allow-origin', b'*'),
+            (b'x-request-id', request_id.get().encode('latin-1', 'replace'))
+        ] + [(nome.lower().encode('latin-1'), valor.encode('latin-1')) for nome, valor in CABECALHOS_SSE.items()]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': cabecalhos})
+
+        async def enviar(texto, fim=False):
+            await send({'type': 'http.response.body', 'body': texto.encode('utf-8'), 'more_body': not fim})
+
+        await enviar(f'retry: {SSE_RETRY_MS}\n\n' + formatar_evento(dados))
+        fim = loop.time() + SSE_DURACAO_MAX
+        while dados['status'] not in STATUS_FINAIS and not desconectado.done():
+            restante = fim - loop.time()
+            if restante <= 0:
+                break
+            proxima = asyncio.ensure_future(fila.get())
+            await asyncio.wait({proxima, desconectado}, timeout=min(SSE_HEARTBEAT, restante),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not proxima.done():
+                proxima.cancel()
+                if not desconectado.done():
+                    await enviar(': ping\n\n')
+                continue
+            mensagem = proxima.result()
+            try:
+                dados = mensagem['dados'] or (await status_do_boleto(boleto_id, conta))[0]
+            except (stripe.error.StripeError, CircuitoAberto) as e:
+                logger.warning("Erro ao verificar boleto: %s: %s", type(e).__name__, str(e))
+                await enviar(formatar_evento({'erro': 'Erro ao verificar boleto', 'detalhes': str(e)}, evento='erro'))
+                break
+            await enviar(formatar_evento(dados))
+        if not desconectado.done():
+            await enviar('', fim=True)
+    finally:
+        status_hub.cancelar(assinatura)
+        desconectado.cancel()
+
+
+async def _webhook(receive, send, headers, endpoint):
+    # Header, timestamp e tamanho declarado são conferidos antes de ler o corpo
+    try:
+        tamanho = int(headers['content-length']) if 'content-length' in headers else None
+    except ValueError:
+        tamanho = None
+    erro, cabecalho = checar_cabecalho(
+        endpoint, contas.segredos_webhook(endpoint), headers.get('stripe-signature'), tamanho
+    )
+    if erro:
+        return await _responder(send, *erro)
+
+    payload = await _ler_corpo(receive, limite=WEBHOOK_MAX_BYTES)
+    resposta, status = await asyncio.to_thread(
+        receber_webhook, flask_app.extensions['webhooks']['db'], flask_app.extensions['webhooks']['idempotencia'],
+        endpoint, payload, cabecalho, headers
+    )
+    await _responder(send, resposta, status)
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            if WEBHOOK_ASYNC:
+                webhook_fila.iniciar()
+            # Cada worker do uvicorn sobe a sua thread de entrega
+            notificacoes.iniciar()
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            for conta in contas:
+                await conta.stripe_async.fechar()
+            await asyncio.to_thread(notificacoes.parar)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return await _wsgi(scope, receive, send)
+
+    metodo = scope['method']
+    caminho = scope['path']
+    verificar = VERIFICAR_REGEX.match(caminho) if metodo == 'GET' else None
+    eventos = EVENTOS_REGEX.match(caminho) if metodo == 'GET' else None
+    webhook = _webhooks.get(caminho) if metodo == 'POST' else None
+    if not (verificar or eventos or webhook or (metodo == 'POST' and caminho == '/gerar-boleto')):
+        return await _wsgi(scope, receive, send)
+
+    headers = {nome.decode('latin-1'): valor.decode('latin-1') for nome, valor in scope['headers']}
+    token = request_id.set(headers.get('x-request-id') or uuid.uuid4().hex)
+    inicio = time.perf_counter()
+    status = [500]
+    duracao = [None]
+
+    async def enviar(mensagem):
+        if mensagem['type'] == 'http.response.start':
+            # Até o início da resposta, como no Flask: um stream SSE não conta o tempo aberto
+            status[0] = mensagem['status']
+            duracao[0] = time.perf_counter() - inicio
+        await send(mensagem)
+
+    # Mesmos nomes de endpoint do Flask, para as séries dos dois modos coincidirem
+    if verificar:
+        endpoint = 'verificar_boleto'
+    elif eventos:
+        endpoint = 'eventos_boleto'
+    elif webhook:
+        endpoint = f'webhook_{webhook}'
+    else:
+        endpoint = 'gerar_boleto'
+
+    # Mesmos limites de concorrência do modo WSGI
+    limite = limites_admissao.get(endpoint)
+    if limite is not None and not limite.entrar():
+        try:
+            await _responder(enviar, *resposta_saturada())
+        finally:
+            observar_requisicao(endpoint, metodo, status[0], time.perf_counter() - inicio)
+            request_id.reset(token)
+        return
+    try:
+        if verificar:
+            await _atender(enviar, verificar_boleto, 'Erro ao verificar boleto', headers, verificar.group(1))
+        elif eventos:
+            await _eventos(receive, enviar, headers, eventos.group(1))
+        elif webhook:
+            await _webhook(receive, enviar, headers, webhook)
+        else:
+            corpo = await _ler_corpo(receive)
+            await _atender(enviar, gerar_boleto, 'Erro ao gerar boleto', headers, corpo)
+    finally:
+        if limite is not None:
+            limite.sair()
+        observar_requisicao(endpoint, metodo, status[0], duracao[0] if duracao[0] is not None else time.perf_counter() - inicio)
+        request_id.reset(token)
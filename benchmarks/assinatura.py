@@ -0,0 +1,84 @@
+"""Throughput da verificação de assinatura dos webhooks, com assinaturas válidas e inválidas.
+
+Não usa rede nem Firestore:
+    python -m benchmarks.assinatura --iteracoes 20000 --tamanho 4096
+
+Compara a verificação da biblioteca do Stripe (stripe.WebhookSignature.verify_header)
+com o caminho rápido de services.assinatura, para um corpo válido, uma
+assinatura forjada e um timestamp expirado (rejeitado antes de olhar o corpo).
+"""
+import argparse
+import json
+import time
+
+import stripe
+
+from services import assinatura
+
+SEGREDO = 'whsec_benchmark'
+
+
+def montar_payload(tamanho):
+    evento = {
+        'id': 'evt_benchmark',
+        'object': 'event',
+        'type': 'payment_intent.succeeded',
+        'data': {'object': {'id': 'pi_benchmark', 'object': 'payment_intent', 'metadata': {}}}
+    }
+    evento['data']['object']['metadata']['preenchimento'] = 'x' * max(0, tamanho - len(json.dumps(evento)))
+    return json.dumps(evento).encode('utf-8')
+
+
+def assinar(payload, timestamp):
+    assinatura_valida = stripe.WebhookSignature._compute_signature(
+        f'{timestamp}.{payload.decode("utf-8")}', SEGREDO
+    )
+    return f't={timestamp},v1={assinatura_valida}'
+
+
+def stripe_sdk(payload, header):
+    stripe.WebhookSignature.verify_header(
+        payload.decode('utf-8'), header, SEGREDO, tolerance=assinatura.WEBHOOK_TOLERANCIA
+    )
+
+
+def caminho_rapido(payload, header):
+    assinatura.verificar(payload, header, SEGREDO)
+
+
+def medir(funcao, payload, header, iteracoes):
+    rejeitadas = 0
+    inicio = time.perf_counter()
+    for _ in range(iteracoes):
+        try:
+            funcao(payload, header)
+        except stripe.error.SignatureVerificationError:
+            rejeitadas += 1
+    duracao = time.perf_counter() - inicio
+    return iteracoes / duracao, rejeitadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da verificação de assinatura dos webhooks')
+    parser.add_argument('--iteracoes', type=int, default=20000)
+    parser.add_argument('--tamanho', type=int, default=4096, help='Tamanho aproximado do corpo em bytes')
+    args = parser.parse_args()
+
+    payload = montar_payload(args.tamanho)
+    agora = int(time.time())
+    cenarios = {
+        'válida': assinar(payload, agora),
+        'forjada': f't={agora},v1={"0" * 64}',
+        'expirada': assinar(payload, agora - 3600)
+    }
+
+    print(f'=== Verificação de assinatura: {len(payload)} bytes, {args.iteracoes} iterações ===')
+    print(f'{"cenário":<10} {"implementação":<16} {"verificações/s":>15} {"rejeitadas":>11}')
+    for nome, header in cenarios.items():
+        for implementacao, funcao in (('stripe', stripe_sdk), ('caminho rápido', caminho_rapido)):
+            por_segundo, rejeitadas = medir(funcao, payload, header, args.iteracoes)
+            print(f'{nome:<10} {implementacao:<16} {por_segundo:>15,.0f} {rejeitadas:>11}')
+
+
+if __name__ == '__main__':
+    main()
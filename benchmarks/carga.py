@@ -0,0 +1,236 @@
+"""Teste de carga da aplicação inteira, sem rede: Stripe e Firestore são locais.
+
+    python -m benchmarks.carga --cenario todos --requisicoes 2000 --concorrencia 32
+    python -m benchmarks.carga --cenario webhooks --latencia-firestore 0.02 --modo asgi
+
+Sobe o Stripe falso (benchmarks.stripe_falso) e a aplicação com o Firestore em
+memória (benchmarks.firestore_falso, ou o emulador com FIRESTORE_EMULATOR_HOST)
+num servidor local, e mede cada cenário pelo HTTP:
+
+- gerar: POST /gerar-boleto, cada requisição com a sua Idempotency-Key
+- verificar: GET /verificar-boleto/<id> num conjunto de boletos, parte deles pagos
+- webhooks: rajada de eventos assinados em /webhook-mensal e /webhook-opencode,
+  com uma fração de reenvios do mesmo evento
+
+Reporta requisições por segundo, latências p50/p95/p99 e as respostas por status.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+SEGREDOS = {
+    'mensalidade': 'whsec_carga_mensal',
+    'opencode': 'whsec_carga_opencode',
+    'software_personalizado': 'whsec_carga_personalizado'
+}
+
+# Precisa vir antes de importar a aplicação: config.py lê o ambiente no import
+os.environ.update({
+    'STRIPE_SECRET_KEY': 'sk_test_carga',
+    'STRIPE_PUBLIC_KEY': 'pk_test_carga',
+    'STRIPE_WEBHOOK_SECRET_MENSAL': SEGREDOS['mensalidade'],
+    'STRIPE_WEBHOOK_SECRET_OPENCODE': SEGREDOS['opencode'],
+    'STRIPE_WEBHOOK_SECRET_PERSONALIZADO': SEGREDOS['software_personalizado'],
+    'IDEMPOTENCIA_BACKEND': 'memoria',
+    'STATUS_CACHE_REDIS_URL': '',
+    # O limite de requisições ao Stripe entra no caminho medido, mas sem segurar a carga
+    'STRIPE_TAXA': '100000',
+    'STRIPE_TAXA_PATH': os.path.join(tempfile.mkdtemp(prefix='carga_'), 'stripe_taxa.db'),
+    'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    # O log de acesso do servidor de desenvolvimento sai em INFO a cada requisição
+    'LOG_NIVEIS': os.getenv('LOG_NIVEIS', 'werkzeug=WARNING')
+})
+
+import requests  # noqa: E402
+
+from benchmarks.firestore_falso import criar_db  # noqa: E402
+from benchmarks.stripe_falso import StripeFalso, evento_assinado  # noqa: E402
+
+CENARIOS = ('gerar', 'verificar', 'webhooks')
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def iniciar_servidor(modo):
+    """Sobe a aplicação numa porta livre e retorna (url, parar)."""
+    if modo == 'asgi':
+        import socket
+        import uvicorn
+        from asgi import app as aplicacao
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            porta = s.getsockname()[1]
+        servidor = uvicorn.Server(uvicorn.Config(aplicacao, host='127.0.0.1', port=porta, log_level='warning'))
+        threading.Thread(target=servidor.run, name='carga-asgi', daemon=True).start()
+        while not servidor.started:
+            time.sleep(0.01)
+
+        def parar():
+            servidor.should_exit = True
+        return f'http://127.0.0.1:{porta}', parar
+
+    from werkzeug.serving import make_server
+    from app import app as aplicacao
+
+    servidor = make_server('127.0.0.1', 0, aplicacao, threaded=True)
+    servidor.request_queue_size = 1024
+    threading.Thread(target=servidor.serve_forever, name='carga-wsgi', daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_port}', servidor.shutdown
+
+
+def executar(nome, requisicoes, concorrencia, url_base):
+    """Dispara `requisicoes` (metodo, caminho, kwargs) com `concorrencia` threads."""
+    local = threading.local()
+    latencias = []
+    status = Counter()
+
+    def enviar(requisicao):
+        metodo, caminho, kwargs = requisicao
+        sessao = getattr(local, 'sessao', None)
+        if sessao is None:
+            sessao = local.sessao = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            codigo = sessao.request(metodo, url_base + caminho, timeout=30, **kwargs).status_code
+        except requests.RequestException as e:
+            codigo = type(e).__name__
+        latencias.append(time.perf_counter() - inicio)
+        status[codigo] += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        list(pool.map(enviar, requisicoes))
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    print(
+        f'{nome:<10} {len(latencias):>7} {len(latencias) / duracao:>9.1f} '
+        f'{percentil(latencias, 50) * 1000:>8.1f} {percentil(latencias, 95) * 1000:>8.1f} '
+        f'{percentil(latencias, 99) * 1000:>8.1f}  '
+        + ' '.join(f'{codigo}={quantidade}' for codigo, quantidade in sorted(status.items(), key=str))
+    )
+    return status
+
+
+def cenario_gerar(total, stripe_falso, db):
+    requisicoes = []
+    for i in range(total):
+        corpo = {
+            'valor': f'{random.randint(10, 500)}.00',
+            'email': f'cliente{i}@exemplo.com',
+            'nome': f'Cliente {i}',
+            'cpf': f'{i:011d}',
+            'endereco': {'cep': '01001-000', 'cidade': 'São Paulo', 'estado': 'SP'}
+        }
+        requisicoes.append(('POST', '/gerar-boleto', {
+            'json': corpo, 'headers': {'Idempotency-Key': f'carga-gerar-{time.time_ns()}-{i}'}
+        }))
+    return requisicoes
+
+
+def cenario_verificar(total, stripe_falso, db, boletos=200, fracao_pagos=0.3):
+    ids = []
+    for i in range(boletos):
+        payment_intent = stripe_falso.criar({'amount': '10000', 'currency': 'brl', 'description': f'Boleto {i}'})
+        if random.random() < fracao_pagos:
+            stripe_falso.pagar(payment_intent['id'])
+        ids.append(payment_intent['id'])
+    return [('GET', f'/verificar-boleto/{random.choice(ids)}', {}) for _ in range(total)]
+
+
+def cenario_webhooks(total, stripe_falso, db, clientes=50, fracao_reenvios=0.2):
+    # Clientes com faturas em aberto (mensalidade) e sem planos (opencode)
+    for c in range(clientes):
+        db.collection('clientes').document(f'cliente_carga_{c}').set({
+            'nome': f'Cliente {c}',
+            'planos': [],
+            'faturas': [{'id': f'fatura_{f}', 'status': 'pendente'} for f in range(20)]
+        })
+
+    eventos = []
+    for i in range(total):
+        cliente_id = f'cliente_carga_{random.randrange(clientes)}'
+        payment_intent = {
+            'id': f'pi_carga{i:08d}', 'object': 'payment_intent', 'amount': 2200,
+            'created': int(time.time()), 'status': 'succeeded'
+        }
+        if i % 2:
+            endpoint, rota = 'mensalidade', '/webhook-mensal'
+            payment_intent['metadata'] = {'cliente_id': cliente_id, 'fatura_id': f'fatura_{random.randrange(20)}'}
+        else:
+            endpoint, rota = 'opencode', '/webhook-opencode'
+            payment_intent['metadata'] = {
+                'tipo_pagamento': 'opencode', 'cliente_id': cliente_id,
+                'projeto_id': f'projeto_{i}', 'projeto_titulo': f'Projeto {i}',
+                'plano_titulo': 'Plano Open Code', 'data_compra': '2025-01-01T00:00:00', 'valor_plano': '22'
+            }
+        corpo, assinatura = evento_assinado(
+            'payment_intent.succeeded', payment_intent, SEGREDOS[endpoint], evento_id=f'evt_carga{i:08d}'
+        )
+        eventos.append(('POST', rota, {
+            'data': corpo, 'headers': {'Stripe-Signature': assinatura, 'Content-Type': 'application/json'}
+        }))
+
+    # Reenvios: o Stripe entrega o mesmo evento de novo, possivelmente ao mesmo tempo
+    eventos += random.sample(eventos, int(len(eventos) * fracao_reenvios))
+    random.shuffle(eventos)
+    return eventos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cenario', choices=CENARIOS + ('todos',), default='todos')
+    parser.add_argument('--requisicoes', type=int, default=1000)
+    parser.add_argument('--concorrencia', type=int, default=16)
+    parser.add_argument('--latencia-stripe', type=float, default=0.0, help='Atraso (s) por chamada ao Stripe falso')
+    parser.add_argument('--latencia-firestore', type=float, default=0.0, help='Atraso (s) por operação no Firestore')
+    parser.add_argument('--modo', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.semente)
+
+    stripe_falso = StripeFalso(args.latencia_stripe).iniciar()
+    os.environ['STRIPE_API_BASE'] = stripe_falso.url
+
+    # Importado só agora para o config.py ver o STRIPE_API_BASE do Stripe falso
+    from services import firebase
+
+    db = criar_db(args.latencia_firestore)
+    firebase._db = db
+
+    url_base, parar = iniciar_servidor(args.modo)
+    cenarios = {'gerar': cenario_gerar, 'verificar': cenario_verificar, 'webhooks': cenario_webhooks}
+    escolhidos = CENARIOS if args.cenario == 'todos' else (args.cenario,)
+
+    print(f'=== Carga ({args.modo}): concorrência {args.concorrencia}, '
+          f'Stripe +{args.latencia_stripe * 1000:.0f}ms, Firestore +{args.latencia_firestore * 1000:.0f}ms ===')
+    print(f'{"cenário":<10} {"req":>7} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}  status')
+    erros = 0
+    try:
+        for nome in escolhidos:
+            requisicoes = cenarios[nome](args.requisicoes, stripe_falso, db)
+            status = executar(nome, requisicoes, args.concorrencia, url_base)
+            # 409 é a resposta esperada a um reenvio que chega durante o processamento
+            erros += sum(
+                quantidade for codigo, quantidade in status.items()
+                if not isinstance(codigo, int) or codigo >= 500
+            )
+    finally:
+        parar()
+        stripe_falso.parar()
+    print(f'Chamadas ao Stripe falso: {stripe_falso.requisicoes}')
+    raise SystemExit(1 if erros else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Firestore em memória com a parte da API usada pelos serviços da aplicação.
+
+Suporta documentos e subcoleções, get/set(merge)/update/create/delete,
+write_option(last_update_time), ArrayUnion, get_all, consultas com where/order_by/
+limit/start_after, batches e transações com checagem otimista de versão
+(que gera Aborted, como o Firestore sob contenção). `latencia` soma um atraso
+a cada operação para simular a ida e volta à rede.
+
+Para medir contra o emulador oficial em vez deste fake, defina
+FIRESTORE_EMULATOR_HOST: `criar_db()` devolve o cliente real nesse caso.
+"""
+import copy
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from google.api_core.exceptions import AlreadyExists, Aborted, FailedPrecondition, NotFound
+from google.cloud.firestore_v1.transforms import ArrayUnion
+
+
+def criar_db(latencia=0.0):
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        from google.cloud import firestore
+        return firestore.Client(project='demo-benchmark')
+    return FirestoreFalso(latencia)
+
+
+def _aplicar(atual, dados):
+    resultado = dict(atual or {})
+    for campo, valor in dados.items():
+        if isinstance(valor, ArrayUnion):
+            lista = list(resultado.get(campo) or [])
+            lista.extend(v for v in valor.values if v not in lista)
+            resultado[campo] = lista
+        else:
+            resultado[campo] = copy.deepcopy(valor)
+    return resultado
+
+
+class _WriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class Snapshot:
+    def __init__(self, reference, dados, versao):
+        self.reference = reference
+        self.id = reference.id
+        self._dados = dados
+        # A versão faz o papel do update_time: muda a cada escrita
+        self.update_time = versao
+
+    @property
+    def exists(self):
+        return self._dados is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._dados) if self._dados is not None else None
+
+    def get(self, campo):
+        return (self._dados or {}).get(campo)
+
+
+class DocumentoFalso:
+    def __init__(self, db, caminho):
+        self._db = db
+        self.path = caminho
+        self.id = caminho.rsplit('/', 1)[-1]
+
+    def collection(self, nome):
+        return ColecaoFalsa(self._db, f'{self.path}/{nome}')
+
+    def get(self, transaction=None, timeout=None, **kwargs):
+        snapshot = self._db._ler(self)
+        if transaction is not None:
+            transaction._lidos.setdefault(self.path, snapshot.update_time)
+        return snapshot
+
+    def set(self, dados, merge=False):
+        self._db._escrever([('set', self, dados, merge, None)])
+
+    def update(self, dados, option=None):
+        self._db._escrever([('update', self, dados, False, option)])
+
+    def create(self, dados):
+        self._db._escrever([('create', self, dados, False, None)])
+
+    def delete(self):
+        self._db._escrever([('delete', self, None, False, None)])
+
+
+class ConsultaFalsa:
+    def __init__(self, db, caminho, filtros=(), ordem=None, limite=None, depois_de=None):
+        self._db = db
+        self._caminho = caminho
+        self._filtros = tuple(filtros)
+        self._ordem = ordem
+        self._limite = limite
+        self._depois_de = depois_de
+
+    def _copiar(self, **kwargs):
+        atual = {
+            'filtros': self._filtros, 'ordem': self._ordem,
+            'limite': self._limite, 'depois_de': self._depois_de
+        }
+        atual.update(kwargs)
+        return ConsultaFalsa(self._db, self._caminho, **atual)
+
+    def where(self, field_path=None, op_string=None, value=None, **kwargs):
+        if op_string != '==':
+            raise NotImplementedError(f'Operador não suportado pelo Firestore falso: {op_string}')
+        return self._copiar(filtros=self._filtros + ((field_path, value),))
+
+    def order_by(self, campo, **kwargs):
+        return self._copiar(ordem=campo)
+
+    def limit(self, quantidade):
+        return self._copiar(limite=quantidade)
+
+    def start_after(self, documento):
+        return self._copiar(depois_de=documento.id)
+
+    def stream(self, transaction=None, **kwargs):
+        snapshots = self._db._listar(self._caminho)
+        restantes = self._limite
+        if self._ordem not in (None, '__name__'):
+            snapshots.sort(key=lambda s: s.get(self._ordem))
+        for snapshot in snapshots:
+            if self._depois_de is not None and snapshot.id <= self._depois_de:
+                continue
+            if all(snapshot.get(campo) == valor for campo, valor in self._filtros):
+                yield snapshot
+                if restantes is not None:
+                    restantes -= 1
+                    if not restantes:
+                        return
+
+    def get(self, transaction=None, timeout=None, **kwargs):
+        return list(self.stream())
+
+
+class ColecaoFalsa(ConsultaFalsa):
+    def __init__(self, db, caminho):
+        super().__init__(db, caminho)
+        self.id = caminho.rsplit('/', 1)[-1]
+
+    def document(self, documento_id=None):
+        # Sem id, gera um aleatório de 20 caracteres como o cliente real
+        documento_id = documento_id or uuid.uuid4().hex[:20]
+        return DocumentoFalso(self._db, f'{self._caminho}/{documento_id}')
+
+
+class BatchFalso:
+    def __init__(self, db):
+        self._db = db
+        self._escritas = []
+
+    def set(self, ref, dados, merge=False):
+        self._escritas.append(('set', ref, dados, merge, None))
+
+    def update(self, ref, dados, option=None):
+        self._escritas.append(('update', ref, dados, False, option))
+
+    def create(self, ref, dados):
+        self._escritas.append(('create', ref, dados, False, None))
+
+    def delete(self, ref):
+        self._escritas.append(('delete', ref, None, False, None))
+
+    def commit(self):
+        escritas, self._escritas = self._escritas, []
+        self._db._escrever(escritas)
+
+
+class TransacaoFalsa(BatchFalso):
+    """Transação otimista: o commit falha com Aborted se algo lido mudou.
+
+    Implementa os métodos privados que `firestore.transactional` chama.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, db, max_attempts=5, read_only=False):
+        super().__init__(db)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._lidos = {}
+
+    def _clean_up(self):
+        self._escritas = []
+        self._lidos = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = next(self._ids)
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        escritas, lidos = self._escritas, self._lidos
+        self._clean_up()
+        self._db._escrever(escritas, lidos)
+        return []
+
+
+class FirestoreFalso:
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.operacoes = 0
+        # caminho -> (dados, versão)
+        self._documentos = {}
+        self._versoes = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def collection(self, nome):
+        return ColecaoFalsa(self, nome)
+
+    def batch(self):
+        return BatchFalso(self)
+
+    def get_all(self, references, transaction=None, **kwargs):
+        for ref in references:
+            yield ref.get(transaction=transaction)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return TransacaoFalsa(self, max_attempts, read_only)
+
+    def write_option(self, last_update_time=None, **kwargs):
+        return _WriteOption(last_update_time)
+
+    def _esperar(self):
+        with self._lock:
+            self.operacoes += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _ler(self, ref):
+        self._esperar()
+        with self._lock:
+            dados, versao = self._documentos.get(ref.path, (None, None))
+            return Snapshot(ref, copy.deepcopy(dados), versao)
+
+    def _listar(self, caminho_colecao):
+        self._esperar()
+        prefixo = caminho_colecao + '/'
+        with self._lock:
+            return [
+                Snapshot(DocumentoFalso(self, caminho), copy.deepcopy(dados), versao)
+                for caminho, (dados, versao) in sorted(self._documentos.items())
+                if caminho.startswith(prefixo) and '/' not in caminho[len(prefixo):]
+            ]
+
+    def _escrever(self, escritas, lidos=None):
+        """Aplica as escritas de forma atômica, como um commit do Firestore."""
+        self._esperar()
+        with self._lock:
+            for caminho, versao in (lidos or {}).items():
+                if self._documentos.get(caminho, (None, None))[1] != versao:
+                    raise Aborted('Documento alterado durante a transação')
+
+            novos = {}
+            for operacao, ref, dados, merge, option in escritas:
+                atual, versao = novos.get(ref.path) or self._documentos.get(ref.path, (None, None))
+                if operacao == 'create' and atual is not None:
+                    raise AlreadyExists(f'Documento já existe: {ref.path}')
+                if operacao == 'update':
+                    if atual is None:
+                        raise NotFound(f'Documento não encontrado: {ref.path}')
+                    if option is not None and option.last_update_time != versao:
+                        raise FailedPrecondition(f'Documento alterado desde a leitura: {ref.path}')
+                if operacao == 'delete':
+                    novos[ref.path] = (None, None)
+                elif operacao == 'set' and not merge:
+                    novos[ref.path] = (_aplicar(None, dados), None)
+                else:
+                    novos[ref.path] = (_aplicar(atual, dados), None)
+
+            for caminho, (dados, _) in novos.items():
+                if dados is None:
+                    self._documentos.pop(caminho, None)
+                else:
+                    self._documentos[caminho] = (dados, next(self._versoes))
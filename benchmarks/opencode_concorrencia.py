@@ -0,0 +1,82 @@
+"""Throughput de compras OpenCode simultâneas para um mesmo cliente.
+
+Roda contra o emulador do Firestore (nunca contra produção):
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.opencode_concorrencia --compras 200 --concorrencia 16
+
+Cada compra é um projeto diferente e metade delas é reenviada (simulando
+retries do Stripe). Ao final confere se o cliente tem exatamente um plano por
+projeto, sem perdas nem duplicatas.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.planos import adicionar_plano, montar_plano, PLANO_ADICIONADO
+
+
+def criar_db():
+    if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+        sys.exit('Defina FIRESTORE_EMULATOR_HOST para rodar o benchmark no emulador do Firestore')
+    from google.cloud import firestore
+    return firestore.Client(project='demo-benchmark')
+
+
+def compra(i):
+    payment_intent = {'id': f'pi_bench_{i}', 'amount': 2200, 'created': int(time.time())}
+    metadata = {
+        'projeto_id': f'projeto_{i}',
+        'projeto_titulo': f'Projeto {i}',
+        'plano_titulo': 'Plano Open Code',
+        'data_compra': '2025-01-01T00:00:00',
+        'valor_plano': '22'
+    }
+    return montar_plano(payment_intent, metadata)
+
+
+def executar(db, compras, concorrencia, cliente_id='cliente_benchmark'):
+    cliente_ref = db.collection('clientes').document(cliente_id)
+    cliente_ref.set({'nome': 'Benchmark', 'planos': []})
+
+    # Metade das compras chega duas vezes
+    planos = [compra(i) for i in range(compras)] + [compra(i) for i in range(0, compras, 2)]
+    latencias = []
+
+    def aplicar(plano):
+        inicio = time.perf_counter()
+        resultado = adicionar_plano(db, cliente_id, plano)
+        latencias.append(time.perf_counter() - inicio)
+        return resultado
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        resultados = list(pool.map(aplicar, planos))
+    duracao = time.perf_counter() - inicio
+
+    finais = cliente_ref.get().to_dict()['planos']
+    servicos = [p['servicoId'] for p in finais]
+    latencias.sort()
+
+    print(f'Operações: {len(planos)} ({compras} compras únicas) com concorrência {concorrencia}')
+    print(f'Duração: {duracao:.2f}s  Throughput: {len(planos) / duracao:.1f} ops/s')
+    print(f'Latência p50: {latencias[len(latencias) // 2] * 1000:.1f}ms  '
+          f'p99: {latencias[int(len(latencias) * 0.99) - 1] * 1000:.1f}ms')
+    print(f'Planos adicionados: {resultados.count(PLANO_ADICIONADO)}  No documento: {len(finais)}')
+
+    ok = len(finais) == compras and len(set(servicos)) == compras
+    print('✅ Sem perdas nem duplicatas' if ok else '❌ Planos perdidos ou duplicados')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--compras', type=int, default=100)
+    parser.add_argument('--concorrencia', type=int, default=8)
+    args = parser.parse_args()
+    sys.exit(0 if executar(criar_db(), args.compras, args.concorrencia) else 1)
+
+
+if __name__ == '__main__':
+    main()
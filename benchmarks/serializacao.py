@@ -0,0 +1,121 @@
+"""CPU por requisição da serialização das respostas quentes e do parse dos webhooks.
+
+Não usa rede nem Firestore:
+    python -m benchmarks.serializacao --iteracoes 20000 --tamanho 4096
+
+Compara, para as respostas do /gerar-boleto e do /verificar-boleto, o jsonify
+padrão do Flask com o provedor de services.serializacao (backend rápido e
+fragmentos constantes pré-codificados) e, para um webhook, o caminho antigo
+(get_json + stripe.Webhook.construct_event, dois parses do corpo) com o atual
+(verificação sobre os bytes crus e um único parse).
+"""
+import argparse
+import json
+import time
+
+import stripe
+from flask import Flask
+
+from benchmarks.assinatura import SEGREDO, assinar, montar_payload
+from services import assinatura, serializacao
+from services.boletos import resposta_boleto, status_boleto
+from services.contas_stripe import contas
+
+
+def payment_intent_falso():
+    return stripe.PaymentIntent.construct_from({
+        'id': 'pi_benchmark',
+        'object': 'payment_intent',
+        'amount': 15000,
+        'created': int(time.time()),
+        'receipt_email': 'cliente@exemplo.com',
+        'status': 'requires_action',
+        'metadata': {'cliente_id': 'cli_benchmark', 'fatura_id': 'fat_2024_01'},
+        'next_action': {'boleto_display_details': {
+            'number': '23790000000000000000000000000000000000000000000',
+            'line': '23790.00000 00000.000000 00000.000000 0 00000000015000',
+            'hosted_voucher_url': 'https://payments.stripe.com/boleto/voucher/test_benchmark'
+        }},
+        'charges': {'object': 'list', 'data': [{
+            'id': 'ch_benchmark',
+            'object': 'charge',
+            'status': 'pending',
+            'created': int(time.time()),
+            'payment_method_details': {'boleto': {
+                'barcode': '23790000000000000000000000000000000000000000000',
+                'line': '23790.00000 00000.000000 00000.000000 0 00000000015000',
+                'hosted_voucher_url': 'https://payments.stripe.com/boleto/voucher/test_benchmark'
+            }}
+        }]}
+    }, 'sk_test_benchmark')
+
+
+def medir(funcao, iteracoes):
+    inicio = time.perf_counter()
+    for _ in range(iteracoes):
+        funcao()
+    return (time.perf_counter() - inicio) / iteracoes * 1e6
+
+
+def cenarios_respostas():
+    payment_intent = payment_intent_falso()
+    respostas = {
+        'gerar-boleto': resposta_boleto(payment_intent, {'valor': '150.00'}, contas.padrao),
+        'verificar-boleto': status_boleto(payment_intent, contas.padrao),
+    }
+    padrao = Flask('padrao')
+    rapido = Flask('rapido')
+    serializacao.init_serializacao(rapido)
+    for nome, dados in respostas.items():
+        # O corpo tem que ser o mesmo JSON, só produzido mais barato
+        with padrao.app_context():
+            esperado = json.loads(padrao.json.response(dados).get_data())
+        with rapido.app_context():
+            assert json.loads(rapido.json.response(dados).get_data()) == esperado
+        yield nome, (
+            ('jsonify', padrao, lambda app=padrao, dados=dados: app.json.response(dados)),
+            (f'provedor ({serializacao.BACKEND})', rapido, lambda app=rapido, dados=dados: app.json.response(dados)),
+        )
+
+
+def cenario_webhook(tamanho):
+    payload = montar_payload(tamanho)
+    header = assinar(payload, int(time.time()))
+
+    def antigo():
+        json.loads(payload)  # request.get_json()
+        stripe.Webhook.construct_event(payload.decode('utf-8'), header, SEGREDO)
+
+    def atual():
+        assinatura.verificar(payload, header, SEGREDO)
+        contas.padrao.construir_evento(serializacao.loads(payload))
+
+    return len(payload), (('get_json + construct_event', antigo), ('bytes crus + 1 parse', atual))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da serialização das respostas e do parse dos webhooks')
+    parser.add_argument('--iteracoes', type=int, default=20000)
+    parser.add_argument('--tamanho', type=int, default=4096, help='Tamanho aproximado do corpo do webhook em bytes')
+    args = parser.parse_args()
+
+    print(f'=== Serialização: backend {serializacao.BACKEND}, {args.iteracoes} iterações ===')
+    print(f'{"cenário":<18} {"implementação":<28} {"µs/requisição":>14} {"economia":>10}')
+    for nome, implementacoes in cenarios_respostas():
+        tempos = []
+        for implementacao, app, funcao in implementacoes:
+            with app.app_context():
+                tempos.append(medir(funcao, args.iteracoes))
+            economia = f'{1 - tempos[-1] / tempos[0]:.0%}' if len(tempos) > 1 else ''
+            print(f'{nome:<18} {implementacao:<28} {tempos[-1]:>14.1f} {economia:>10}')
+
+    tamanho, implementacoes = cenario_webhook(args.tamanho)
+    tempos = []
+    for implementacao, funcao in implementacoes:
+        tempos.append(medir(funcao, args.iteracoes))
+        economia = f'{1 - tempos[-1] / tempos[0]:.0%}' if len(tempos) > 1 else ''
+        print(f'{f"webhook {tamanho}B":<18} {implementacao:<28} {tempos[-1]:>14.1f} {economia:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Servidor HTTP local que imita a parte da API do Stripe usada pela aplicação.
+
+Atende POST /v1/payment_intents (com Idempotency-Key) e GET /v1/payment_intents/<id>,
+com uma latência artificial por requisição, e monta eventos de webhook
+assinados. Usado pelos benchmarks com STRIPE_API_BASE apontando para ele.
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import stripe
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class StripeFalso:
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.requisicoes = 0
+        self._payment_intents = {}
+        self._idempotencia = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._servidor = None
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address
+        return f'http://{host}:{porta}'
+
+    def iniciar(self):
+        stripe_falso = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Cabeçalho e corpo saem em escritas separadas: sem isso o Nagle soma ~40ms por resposta
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, dados):
+                corpo = json.dumps(dados).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def do_POST(self):
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                form = dict(parse_qsl(self.rfile.read(tamanho).decode('utf-8')))
+                stripe_falso._contar()
+                if urlparse(self.path).path != '/v1/payment_intents':
+                    return self._responder(404, _erro('Rota não suportada pelo Stripe falso'))
+                self._responder(200, stripe_falso.criar(form, self.headers.get('Idempotency-Key')))
+
+            def do_GET(self):
+                stripe_falso._contar()
+                caminho = urlparse(self.path).path
+                payment_intent = stripe_falso.obter(caminho.rsplit('/', 1)[-1])
+                if not caminho.startswith('/v1/payment_intents/') or payment_intent is None:
+                    return self._responder(404, _erro('No such payment_intent'))
+                self._responder(200, payment_intent)
+
+        self._servidor = _Servidor(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._servidor.serve_forever, name='stripe-falso', daemon=True).start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def _contar(self):
+        with self._lock:
+            self.requisicoes += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def criar(self, form, idempotency_key=None):
+        with self._lock:
+            if idempotency_key and idempotency_key in self._idempotencia:
+                return self._payment_intents[self._idempotencia[idempotency_key]]
+            payment_intent = _payment_intent(f'pi_falso{next(self._ids):08d}', form)
+            self._payment_intents[payment_intent['id']] = payment_intent
+            if idempotency_key:
+                self._idempotencia[idempotency_key] = payment_intent['id']
+            return payment_intent
+
+    def obter(self, payment_intent_id):
+        with self._lock:
+            return self._payment_intents.get(payment_intent_id)
+
+    def pagar(self, payment_intent_id):
+        """Marca o PaymentIntent como pago, com uma charge, como no webhook payment_intent.succeeded."""
+        with self._lock:
+            payment_intent = self._payment_intents[payment_intent_id]
+            payment_intent['status'] = 'succeeded'
+            payment_intent['charges']['data'] = [{
+                'id': 'ch' + payment_intent_id[2:],
+                'object': 'charge',
+                'status': 'succeeded',
+                'created': int(time.time()),
+                'payment_method_details': {'type': 'boleto', 'boleto': {
+                    'barcode': '23790000000000000000000000000000000000000000',
+                    'line': '23790.00000 00000.000000 00000.000000 0 00000000000000',
+                    'hosted_voucher_url': f'https://payments.stripe.com/boleto/voucher/{payment_intent_id}'
+                }}
+            }]
+            return payment_intent
+
+
+def _erro(mensagem):
+    return {'error': {'type': 'invalid_request_error', 'message': mensagem}}
+
+
+def _payment_intent(payment_intent_id, form):
+    metadata = {chave[len('metadata['):-1]: valor for chave, valor in form.items() if chave.startswith('metadata[')}
+    return {
+        'id': payment_intent_id,
+        'object': 'payment_intent',
+        'amount': int(form.get('amount', 0)),
+        'currency': form.get('currency', 'brl'),
+        'created': int(time.time()),
+        'status': 'requires_action',
+        'receipt_email': form.get('payment_method_data[billing_details][email]'),
+        'description': form.get('description'),
+        'metadata': metadata,
+        'charges': {'object': 'list', 'data': []},
+        'next_action': {'type': 'boleto_display_details', 'boleto_display_details': {
+            'number': '23790000000000000000000000000000000000000000',
+            'line': '23790.00000 00000.000000 00000.000000 0 00000000000000',
+            'hosted_voucher_url': f'https://payments.stripe.com/boleto/voucher/{payment_intent_id}'
+        }}
+    }
+
+
+def evento_assinado(tipo, objeto, segredo, evento_id=None):
+    """(corpo, header Stripe-Signature) de um evento de webhook, como o Stripe envia."""
+    payload = json.dumps({
+        'id': evento_id or f'evt_falso{time.time_ns()}',
+        'object': 'event',
+        'type': tipo,
+        'created': int(time.time()),
+        'data': {'object': objeto}
+    })
+    timestamp = int(time.time())
+    assinatura = stripe.WebhookSignature._compute_signature(f'{timestamp}.{payload}', segredo)
+    return payload.encode('utf-8'), f't={timestamp},v1={assinatura}'
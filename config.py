@@ -10,4 +10,116 @@ STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 STRIPE_WEBHOOK_SECRET_MENSAL = os.getenv('STRIPE_WEBHOOK_SECRET_MENSAL')
 STRIPE_WEBHOOK_SECRET_OPENCODE = os.getenv('STRIPE_WEBHOOK_SECRET_OPENCODE')
-STRIPE_WEBHOOK_SECRET_PERSONALIZADO = os.getenv('STRIPE_WEBHOOK_SECRET_PERSONALIZADO') 
\ No newline at end of file
+STRIPE_WEBHOOK_SECRET_PERSONALIZADO = os.getenv('STRIPE_WEBHOOK_SECRET_PERSONALIZADO')
+
+# Contas Stripe adicionais (Connect ou marcas separadas) no mesmo deploy: "marca_b,marca_c". As variáveis
+# acima são a conta "padrao"; cada conta adicional lê STRIPE_<NOME>_SECRET_KEY, STRIPE_<NOME>_PUBLIC_KEY,
+# STRIPE_<NOME>_ACCOUNT (conta conectada do Connect, usa a chave da plataforma) e
+# STRIPE_<NOME>_WEBHOOK_SECRET_MENSAL/_PERSONALIZADO/_OPENCODE
+STRIPE_CONTAS = {
+    nome: {
+        'secret_key': os.getenv(f'STRIPE_{nome.upper()}_SECRET_KEY'),
+        'public_key': os.getenv(f'STRIPE_{nome.upper()}_PUBLIC_KEY'),
+        'account': os.getenv(f'STRIPE_{nome.upper()}_ACCOUNT'),
+        'webhooks': {
+            'mensalidade': os.getenv(f'STRIPE_{nome.upper()}_WEBHOOK_SECRET_MENSAL'),
+            'software_personalizado': os.getenv(f'STRIPE_{nome.upper()}_WEBHOOK_SECRET_PERSONALIZADO'),
+            'opencode': os.getenv(f'STRIPE_{nome.upper()}_WEBHOOK_SECRET_OPENCODE'),
+        }
+    }
+    for nome in (nome.strip().lower() for nome in os.getenv('STRIPE_CONTAS', '').split(',')) if nome
+}
+
+# Cache de status dos boletos (/verificar-boleto)
+STATUS_CACHE_TTL = int(os.getenv('STATUS_CACHE_TTL', '30'))  # segundos
+STATUS_CACHE_TTL_PAGO = int(os.getenv('STATUS_CACHE_TTL_PAGO', '3600'))  # boletos pagos não mudam mais
+STATUS_CACHE_MAX_ITENS = int(os.getenv('STATUS_CACHE_MAX_ITENS', '10000'))
+STATUS_CACHE_REDIS_URL = os.getenv('STATUS_CACHE_REDIS_URL')  # opcional, compartilha o cache entre workers
+STATUS_CACHE_TTL_OBSOLETO = int(os.getenv('STATUS_CACHE_TTL_OBSOLETO', str(24 * 3600)))  # último status conhecido, servido com o Stripe fora
+
+# Eventos de status por SSE (/verificar-boleto/<id>/eventos)
+STATUS_EVENTOS_REDIS_URL = os.getenv('STATUS_EVENTOS_REDIS_URL', STATUS_CACHE_REDIS_URL)  # pub/sub entre workers
+SSE_MAX_CONEXOES = int(os.getenv('SSE_MAX_CONEXOES', '1000'))  # por processo
+SSE_HEARTBEAT = int(os.getenv('SSE_HEARTBEAT', '15'))  # segundos entre comentários de keep-alive
+SSE_DURACAO_MAX = int(os.getenv('SSE_DURACAO_MAX', '300'))  # segundos; o EventSource reconecta sozinho
+
+# Ingestão assíncrona de webhooks: verifica, grava na fila local e responde na hora
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'false').lower() in ('1', 'true', 'sim')
+WEBHOOK_FILA_PATH = os.getenv('WEBHOOK_FILA_PATH', 'webhook_fila.db')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+WEBHOOK_MAX_TENTATIVAS = int(os.getenv('WEBHOOK_MAX_TENTATIVAS', '5'))
+
+# Deduplicação de eventos de webhook (id do evento e do PaymentIntent)
+IDEMPOTENCIA_BACKEND = os.getenv('IDEMPOTENCIA_BACKEND', 'sqlite')  # sqlite, firestore ou memoria
+IDEMPOTENCIA_PATH = os.getenv('IDEMPOTENCIA_PATH', 'idempotencia.db')
+IDEMPOTENCIA_TTL = int(os.getenv('IDEMPOTENCIA_TTL', str(7 * 24 * 3600)))  # o Stripe reenvia por até 3 dias
+IDEMPOTENCIA_MAX_ITENS = int(os.getenv('IDEMPOTENCIA_MAX_ITENS', '100000'))
+
+# Armazenamento das faturas: 'array' (campo faturas do cliente) ou 'subcolecao' (clientes/{id}/faturas)
+FATURAS_MODO = os.getenv('FATURAS_MODO', 'array')
+
+# Tentativas (com backoff) da transação que adiciona planos OpenCode
+PLANOS_MAX_TENTATIVAS = int(os.getenv('PLANOS_MAX_TENTATIVAS', '6'))
+
+# Logs: nível padrão, níveis por módulo ("routes.webhooks=DEBUG,services.webhook_fila=WARNING") e formato (json ou texto)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_NIVEIS = os.getenv('LOG_NIVEIS', '')
+LOG_FORMATO = os.getenv('LOG_FORMATO', 'json')
+
+# Idempotência do /gerar-boleto: respostas guardadas por chave (o Stripe guarda as chaves por 24h)
+BOLETO_IDEMPOTENCIA_TTL = int(os.getenv('BOLETO_IDEMPOTENCIA_TTL', str(24 * 3600)))
+BOLETO_IDEMPOTENCIA_MAX_ITENS = int(os.getenv('BOLETO_IDEMPOTENCIA_MAX_ITENS', '10000'))
+
+# Geração de boletos em lote (/gerar-boletos/lote)
+BOLETO_LOTE_CONCORRENCIA = int(os.getenv('BOLETO_LOTE_CONCORRENCIA', '8'))  # chamadas simultâneas ao Stripe por lote
+BOLETO_LOTE_MAX_ITENS = int(os.getenv('BOLETO_LOTE_MAX_ITENS', '5000'))
+
+# Cliente HTTP do Stripe: pool de conexões keep-alive, timeouts e retentativas com backoff
+STRIPE_TIMEOUT_CONEXAO = float(os.getenv('STRIPE_TIMEOUT_CONEXAO', '3.05'))  # segundos
+STRIPE_TIMEOUT_LEITURA = float(os.getenv('STRIPE_TIMEOUT_LEITURA', '30'))  # segundos
+STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', '2'))
+STRIPE_POOL_MAX = int(os.getenv('STRIPE_POOL_MAX', '20'))  # conexões mantidas por processo
+STRIPE_ASYNC_POOL_MAX = int(os.getenv('STRIPE_ASYNC_POOL_MAX', '100'))  # conexões do cliente assíncrono (modo ASGI)
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')  # outro endereço só para testes (stripe-mock, benchmarks)
+
+# Limite de requisições ao Stripe por conta, somando todos os workers da máquina (token bucket em SQLite).
+# O Stripe aceita 100/s em produção e 25/s em modo de teste; 0 desativa
+STRIPE_TAXA = float(os.getenv('STRIPE_TAXA', '80'))  # requisições por segundo
+STRIPE_TAXA_RAJADA = float(os.getenv('STRIPE_TAXA_RAJADA', '0'))  # tamanho do balde; 0 usa STRIPE_TAXA
+STRIPE_TAXA_ESPERA_MAX = float(os.getenv('STRIPE_TAXA_ESPERA_MAX', '2'))  # segundos; acima disso responde 503
+STRIPE_TAXA_PATH = os.getenv('STRIPE_TAXA_PATH', 'stripe_taxa.db')
+
+# Disjuntores do Stripe e do Firestore: abrem depois de N falhas seguidas (conexão, timeout, 5xx)
+# e, passado o tempo aberto (segundos), deixam passar uma chamada de teste
+DISJUNTOR_FALHAS = int(os.getenv('DISJUNTOR_FALHAS', '5'))
+DISJUNTOR_TEMPO_ABERTO = float(os.getenv('DISJUNTOR_TEMPO_ABERTO', '30'))
+
+# Controle de admissão: requisições simultâneas por rota em cada processo; acima disso a resposta é
+# 503 com Retry-After (segundos) em vez de esperar na fila. 0 desativa o limite da rota
+ADMISSAO_MAX_GERAR_BOLETO = int(os.getenv('ADMISSAO_MAX_GERAR_BOLETO', '50'))
+ADMISSAO_MAX_VERIFICAR_BOLETO = int(os.getenv('ADMISSAO_MAX_VERIFICAR_BOLETO', '200'))
+ADMISSAO_MAX_WEBHOOKS = int(os.getenv('ADMISSAO_MAX_WEBHOOKS', '50'))  # somando os três endpoints
+ADMISSAO_RETRY_AFTER = int(os.getenv('ADMISSAO_RETRY_AFTER', '1'))
+
+# Webhooks: tamanho máximo do corpo e tolerância (segundos) do timestamp da assinatura do Stripe
+WEBHOOK_MAX_BYTES = int(os.getenv('WEBHOOK_MAX_BYTES', str(512 * 1024)))
+WEBHOOK_TOLERANCIA = int(os.getenv('WEBHOOK_TOLERANCIA', '300'))
+
+# Registro local dos boletos gerados (consultas de suporte e relatórios sem ir ao Stripe)
+LEDGER_BACKEND = os.getenv('LEDGER_BACKEND', 'sqlite')  # sqlite ou nenhum
+LEDGER_PATH = os.getenv('LEDGER_PATH', 'ledger.db')
+LEDGER_PAGINA_MAX = int(os.getenv('LEDGER_PAGINA_MAX', '500'))
+
+# Notificações de pagamento para sistemas externos (webhooks de saída); sem segredo nada é enviado
+NOTIFICACOES_SEGREDO = os.getenv('NOTIFICACOES_SEGREDO')  # assina o corpo (header X-Notificacao-Assinatura)
+NOTIFICACOES_PATH = os.getenv('NOTIFICACOES_PATH', 'notificacoes.db')
+NOTIFICACOES_DESTINOS = os.getenv('NOTIFICACOES_DESTINOS', '')  # "mensalidade=https://erp.exemplo.com/pagamentos,opencode=..."
+NOTIFICACOES_HOSTS_PERMITIDOS = os.getenv('NOTIFICACOES_HOSTS_PERMITIDOS', '')  # hosts aceitos no webhook_url do metadata
+NOTIFICACOES_CONCORRENCIA = int(os.getenv('NOTIFICACOES_CONCORRENCIA', '20'))  # entregas simultâneas por processo
+NOTIFICACOES_MAX_POR_HOST = int(os.getenv('NOTIFICACOES_MAX_POR_HOST', '4'))  # entregas simultâneas por destino
+NOTIFICACOES_MAX_TENTATIVAS = int(os.getenv('NOTIFICACOES_MAX_TENTATIVAS', '8'))
+NOTIFICACOES_TIMEOUT = float(os.getenv('NOTIFICACOES_TIMEOUT', '10'))  # segundos por tentativa
+NOTIFICACOES_RETENCAO = int(os.getenv('NOTIFICACOES_RETENCAO', str(7 * 24 * 3600)))  # entregues ficam registradas
+
+# Token das rotas administrativas (header "Authorization: Bearer <token>"); sem ele as rotas ficam desativadas
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
@@ -0,0 +1,28 @@
+from flask import jsonify, request
+import functools
+import hmac
+import logging
+from config import ADMIN_TOKEN
+
+logger = logging.getLogger(__name__)
+
+
+def token_admin_valido(authorization):
+    """Confere o header Authorization ("Bearer <token>") com ADMIN_TOKEN em tempo constante."""
+    if not ADMIN_TOKEN or not authorization:
+        return False
+    esquema, _, token = authorization.partition(' ')
+    return esquema.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode())
+
+
+def exigir_admin(view):
+    """Restringe a rota a quem tem o ADMIN_TOKEN; sem token configurado a rota fica desativada."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'erro': 'Rota administrativa desativada (defina ADMIN_TOKEN)'}), 404
+        if not token_admin_valido(request.headers.get('Authorization')):
+            logger.warning("Acesso negado a rota administrativa: %s", request.path)
+            return jsonify({'erro': 'Não autorizado'}), 401, {'WWW-Authenticate': 'Bearer'}
+        return view(*args, **kwargs)
+    return wrapper
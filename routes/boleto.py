@@ -0,0 +1,89 @@
+from flask import jsonify, request
+import logging
+import stripe
+from services.boletos import (
+    validar_boleto, chave_idempotencia, gerar_boleto_idempotente, obter_status_ou_obsoleto, MAX_TAMANHO_CHAVE
+)
+from services.contas_stripe import contas, ContaDesconhecida
+from services.disjuntor import CircuitoAberto
+
+logger = logging.getLogger(__name__)
+
+
+def resposta_indisponivel(e, erro):
+    """503 para uma chamada recusada pelo disjuntor, com o tempo até a próxima tentativa."""
+    logger.warning("%s: %s", erro, str(e))
+    return jsonify({'erro': erro, 'detalhes': str(e)}), 503, {'Retry-After': e.retry_after_header}
+
+
+def init_boleto_routes(app):
+    @app.route('/gerar-boleto', methods=['POST'])
+    def gerar_boleto():
+        try:
+            data = request.get_json()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Dados recebidos para gerar boleto", extra={'dados': data})
+
+            # Validação dos dados
+            dados, erro = validar_boleto(data)
+            if erro:
+                return jsonify({'erro': erro}), 400
+
+            chave = chave_idempotencia(dados, request.headers.get('Idempotency-Key'))
+            if len(chave) > MAX_TAMANHO_CHAVE:
+                return jsonify({'erro': f'Idempotency-Key deve ter no máximo {MAX_TAMANHO_CHAVE} caracteres'}), 400
+
+            conta = contas.da_requisicao(request.headers, dados['metadata'])
+            response_data, reaproveitado = gerar_boleto_idempotente(chave, dados, conta)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Resposta do boleto gerado", extra={'resposta': response_data})
+            resposta = jsonify(response_data)
+            if reaproveitado:
+                resposta.headers['Idempotent-Replayed'] = 'true'
+            return resposta
+
+        except ContaDesconhecida as e:
+            return jsonify({'erro': str(e)}), 400
+        except CircuitoAberto as e:
+            return resposta_indisponivel(e, 'Erro ao gerar boleto')
+        except stripe.error.StripeError as e:
+            logger.warning("Erro do Stripe ao gerar boleto: %s: %s", type(e).__name__, str(e))
+            return jsonify({
+                'erro': 'Erro ao gerar boleto',
+                'detalhes': str(e)
+            }), 400
+        except Exception as e:
+            logger.exception("Erro interno: %s", type(e).__name__)
+            return jsonify({
+                'erro': 'Erro interno do servidor',
+                'detalhes': str(e)
+            }), 500
+
+    @app.route('/verificar-boleto/<boleto_id>', methods=['GET'])
+    def verificar_boleto(boleto_id):
+        try:
+            # Responde pelo cache quando possível (atualizado pelos webhooks) e,
+            # com o Stripe fora, pelo último status conhecido
+            response_data, obsoleto = obter_status_ou_obsoleto(boleto_id, contas.da_requisicao(request.headers))
+            resposta = jsonify(response_data)
+            if obsoleto:
+                resposta.headers['X-Status-Obsoleto'] = 'true'
+            return resposta
+
+        except ContaDesconhecida as e:
+            return jsonify({'erro': str(e)}), 400
+        except CircuitoAberto as e:
+            return resposta_indisponivel(e, 'Erro ao verificar boleto')
+        except stripe.error.StripeError as e:
+            logger.warning("Erro do Stripe ao verificar boleto %s: %s: %s", boleto_id, type(e).__name__, str(e))
+            return jsonify({
+                'erro': 'Erro ao verificar boleto',
+                'detalhes': str(e)
+            }), 400
+        except Exception as e:
+            logger.exception("Erro interno: %s", type(e).__name__)
+            return jsonify({
+                'erro': 'Erro interno do servidor',
+                'detalhes': str(e)
+            }), 500
@@ -0,0 +1,96 @@
+from flask import Response, jsonify, request, stream_with_context
+import logging
+import queue
+import time
+import stripe
+from config import SSE_HEARTBEAT, SSE_DURACAO_MAX
+from routes.boleto import resposta_indisponivel
+from services.boletos import obter_status_ou_obsoleto
+from services.contas_stripe import contas, ContaDesconhecida
+from services.disjuntor import CircuitoAberto
+from services.metricas import registro
+from services.serializacao import dumps_resposta
+from services.status_eventos import status_hub
+
+logger = logging.getLogger(__name__)
+
+# Depois destes status o boleto não muda mais: o stream é encerrado
+STATUS_FINAIS = ('succeeded', 'canceled')
+
+# Espera (ms) sugerida ao EventSource antes de reconectar
+SSE_RETRY_MS = 3000
+
+CABECALHOS_SSE = {
+    'Cache-Control': 'no-cache',
+    # Sem buffer no nginx, para cada evento sair na hora
+    'X-Accel-Buffering': 'no'
+}
+
+
+def formatar_evento(dados, evento='status'):
+    return f'event: {evento}\ndata: {dumps_resposta(dados).decode("utf-8")}\n\n'
+
+
+def init_boleto_eventos_routes(app):
+    registro.medidor(
+        'sse_conexoes', 'Conexões SSE de status de boleto abertas neste processo',
+        lambda: status_hub.metricas()['conexoes']
+    )
+
+    @app.route('/verificar-boleto/<boleto_id>/eventos', methods=['GET'])
+    def eventos_boleto(boleto_id):
+        try:
+            conta = contas.da_requisicao(request.headers)
+        except ContaDesconhecida as e:
+            return jsonify({'erro': str(e)}), 400
+
+        # Inscreve antes de ler o status, para não perder um webhook que chegue no meio
+        fila = queue.SimpleQueue()
+        assinatura = status_hub.inscrever(conta.chave_cache(boleto_id), fila.put)
+        if assinatura is None:
+            logger.warning("Limite de conexões SSE atingido")
+            return jsonify({'erro': 'Limite de conexões atingido, use /verificar-boleto'}), 503, {
+                'Retry-After': str(SSE_RETRY_MS // 1000)
+            }
+
+        try:
+            dados, _ = obter_status_ou_obsoleto(boleto_id, conta)
+        except CircuitoAberto as e:
+            status_hub.cancelar(assinatura)
+            return resposta_indisponivel(e, 'Erro ao verificar boleto')
+        except stripe.error.StripeError as e:
+            status_hub.cancelar(assinatura)
+            logger.warning("Erro do Stripe ao verificar boleto %s: %s: %s", boleto_id, type(e).__name__, str(e))
+            return jsonify({'erro': 'Erro ao verificar boleto', 'detalhes': str(e)}), 400
+        except Exception as e:
+            status_hub.cancelar(assinatura)
+            logger.exception("Erro interno: %s", type(e).__name__)
+            return jsonify({'erro': 'Erro interno do servidor', 'detalhes': str(e)}), 500
+
+        def gerar(dados):
+            try:
+                yield f'retry: {SSE_RETRY_MS}\n\n' + formatar_evento(dados)
+                fim = time.monotonic() + SSE_DURACAO_MAX
+                while dados['status'] not in STATUS_FINAIS:
+                    restante = fim - time.monotonic()
+                    if restante <= 0:
+                        return
+                    try:
+                        mensagem = fila.get(timeout=min(SSE_HEARTBEAT, restante))
+                    except queue.Empty:
+                        # Comentário de keep-alive; também detecta cliente desconectado
+                        yield ': ping\n\n'
+                        continue
+                    # Sem dados na mensagem o status foi invalidado: consulta de novo
+                    dados = mensagem['dados'] or obter_status_ou_obsoleto(boleto_id, conta)[0]
+                    yield formatar_evento(dados)
+            except (stripe.error.StripeError, CircuitoAberto) as e:
+                logger.warning("Erro do Stripe ao verificar boleto %s: %s: %s", boleto_id, type(e).__name__, str(e))
+                yield formatar_evento({'erro': 'Erro ao verificar boleto', 'detalhes': str(e)}, evento='erro')
+            finally:
+                status_hub.cancelar(assinatura)
+
+        resposta = Response(stream_with_context(gerar(dados)), mimetype='text/event-stream', headers=CABECALHOS_SSE)
+        # Garante a liberação mesmo se o stream não chegar a ser iterado
+        resposta.call_on_close(lambda: status_hub.cancelar(assinatura))
+        return resposta
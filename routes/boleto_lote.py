@@ -0,0 +1,120 @@
+from flask import Response, jsonify, request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+import json
+import logging
+import random
+import time
+import stripe
+from config import BOLETO_LOTE_CONCORRENCIA, BOLETO_LOTE_MAX_ITENS
+from services.boletos import (
+    validar_boleto, chave_idempotencia, gerar_boleto_idempotente, MAX_TAMANHO_CHAVE
+)
+from services.contas_stripe import contas, ContaDesconhecida
+from services.disjuntor import CircuitoAberto
+from services.limite import TaxaExcedida
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVAS_RATE_LIMIT = 4
+
+
+def _ler_itens():
+    """Lista de boletos do corpo: JSON (lista ou {"boletos": [...]}) ou NDJSON (um boleto por linha)."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return [json.loads(linha) for linha in request.get_data(as_text=True).splitlines() if linha.strip()]
+    data = request.get_json()
+    if isinstance(data, dict):
+        data = data.get('boletos')
+    if not isinstance(data, list):
+        raise ValueError('Envie uma lista de boletos')
+    return data
+
+
+def _gerar_item(indice, chave, dados, conta):
+    for tentativa in range(1, MAX_TENTATIVAS_RATE_LIMIT + 1):
+        # A taxa do Stripe é controlada pelo limite compartilhado da conta (services.limite),
+        # reservado a cada chamada; repetições respondidas pelo cache não o consomem
+        try:
+            response_data, reaproveitado = gerar_boleto_idempotente(chave, dados, conta)
+            return {'indice': indice, 'status': 'ok', 'reaproveitado': reaproveitado, 'boleto': response_data}
+        except TaxaExcedida as e:
+            # Sem vaga no limite local: espera a vaga indicada em vez de falhar o item
+            if tentativa == MAX_TENTATIVAS_RATE_LIMIT:
+                return {'indice': indice, 'status': 'erro', 'erro': 'Erro ao gerar boleto', 'detalhes': str(e)}
+            time.sleep(e.retry_after)
+        except stripe.error.RateLimitError as e:
+            if tentativa == MAX_TENTATIVAS_RATE_LIMIT:
+                return {'indice': indice, 'status': 'erro', 'erro': 'Erro ao gerar boleto', 'detalhes': str(e)}
+            time.sleep(min(2 ** tentativa, 10) * (0.5 + random.random() / 2))
+        except CircuitoAberto as e:
+            # Recusado sem chamar o Stripe: o item pode ser reenviado com a mesma chave
+            return {'indice': indice, 'status': 'erro', 'erro': 'Erro ao gerar boleto', 'detalhes': str(e)}
+        except stripe.error.StripeError as e:
+            logger.warning("Erro do Stripe no item %d do lote: %s: %s", indice, type(e).__name__, str(e))
+            return {'indice': indice, 'status': 'erro', 'erro': 'Erro ao gerar boleto', 'detalhes': str(e)}
+        except Exception as e:
+            logger.exception("Erro interno no item %d do lote: %s", indice, type(e).__name__)
+            return {'indice': indice, 'status': 'erro', 'erro': 'Erro interno do servidor', 'detalhes': str(e)}
+
+
+def init_boleto_lote_routes(app):
+    @app.route('/gerar-boletos/lote', methods=['POST'])
+    def gerar_boletos_lote():
+        try:
+            itens = _ler_itens()
+        except ValueError as e:
+            return jsonify({'erro': 'Lote inválido', 'detalhes': str(e)}), 400
+
+        if not itens:
+            return jsonify({'erro': 'Lote vazio'}), 400
+        if len(itens) > BOLETO_LOTE_MAX_ITENS:
+            return jsonify({'erro': f'O lote aceita no máximo {BOLETO_LOTE_MAX_ITENS} boletos'}), 413
+
+        # Valida tudo antes da primeira chamada ao Stripe
+        validos = []
+        erros = []
+        for indice, item in enumerate(itens):
+            dados, erro = validar_boleto(item)
+            if not erro:
+                chave = chave_idempotencia(dados, item.get('idempotency_key'))
+                if len(chave) > MAX_TAMANHO_CHAVE:
+                    erro = f'idempotency_key deve ter no máximo {MAX_TAMANHO_CHAVE} caracteres'
+            if not erro:
+                # Um lote pode misturar contas pelo metadata; o header vale para todos os itens
+                try:
+                    conta = contas.da_requisicao(request.headers, dados['metadata'])
+                except ContaDesconhecida as e:
+                    erro = str(e)
+            if erro:
+                erros.append({'indice': indice, 'erro': erro})
+            else:
+                validos.append((indice, chave, dados, conta))
+        if erros:
+            return jsonify({'erro': 'Lote inválido', 'itens': erros}), 400
+
+        logger.info("Gerando lote de %d boletos", len(validos))
+        executor = ThreadPoolExecutor(max_workers=BOLETO_LOTE_CONCORRENCIA, thread_name_prefix='boleto-lote')
+        # Cada item roda com uma cópia do contexto (request_id nos logs)
+        futuros = [
+            executor.submit(contextvars.copy_context().run, _gerar_item, indice, chave, dados, conta)
+            for indice, chave, dados, conta in validos
+        ]
+
+        def resultados():
+            sucesso = 0
+            try:
+                for futuro in as_completed(futuros):
+                    resultado = futuro.result()
+                    sucesso += resultado['status'] == 'ok'
+                    yield json.dumps(resultado, ensure_ascii=False) + '\n'
+                yield json.dumps({'resumo': {
+                    'total': len(validos),
+                    'sucesso': sucesso,
+                    'falhas': len(validos) - sucesso
+                }}) + '\n'
+            finally:
+                # Cliente desconectou: itens ainda não iniciados são cancelados
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        return Response(resultados(), mimetype='application/x-ndjson')
@@ -0,0 +1,47 @@
+from flask import Response, jsonify, request, stream_with_context
+import io
+import json
+import logging
+from routes.admin import exigir_admin
+from services.faturas_lote import (
+    MAX_ESCRITAS_BATCH, exportar, formatar_csv, formatar_ndjson, importar, ler_linhas, resumir
+)
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = {
+    'ndjson': (formatar_ndjson, 'application/x-ndjson'),
+    'csv': (formatar_csv, 'text/csv')
+}
+
+
+def init_faturas_routes(app, db):
+    @app.route('/faturas/exportar', methods=['GET'])
+    @exigir_admin
+    def exportar_faturas():
+        formato = request.args.get('formato', 'ndjson')
+        if formato not in FORMATOS:
+            return jsonify({'erro': f"formato deve ser um de: {', '.join(FORMATOS)}"}), 400
+        formatar, mimetype = FORMATOS[formato]
+
+        logger.info("Exportando faturas em %s", formato)
+        return Response(
+            stream_with_context(formatar(exportar(db, cliente_id=request.args.get('cliente_id')))),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=faturas.{formato}'}
+        )
+
+    @app.route('/faturas/importar', methods=['POST'])
+    @exigir_admin
+    def importar_faturas():
+        """Confirmações de pagamento em CSV (text/csv) ou NDJSON, lidas do corpo linha a linha."""
+        formato = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'sim')
+        arquivo = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+
+        def resultados():
+            for resultado in resumir(importar(db, ler_linhas(arquivo, formato), dry_run=dry_run)):
+                yield json.dumps(resultado, ensure_ascii=False) + '\n'
+
+        logger.info("Importando confirmações de pagamento (%s, blocos de %d)", formato, MAX_ESCRITAS_BATCH)
+        return Response(stream_with_context(resultados()), mimetype='application/x-ndjson')
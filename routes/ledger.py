@@ -0,0 +1,67 @@
+from flask import jsonify, request
+import logging
+from datetime import datetime, timedelta
+from config import LEDGER_PAGINA_MAX
+from routes.admin import exigir_admin
+from services.ledger import ledger, FILTROS, CAMPOS_DATA
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_METADATA = 'metadata.'
+
+
+def _timestamp(valor, fim=False):
+    """'2025-05-01' ou '2025-05-01T10:00:00' em timestamp; uma data sem hora em `ate` inclui o dia todo."""
+    if not valor:
+        return None
+    try:
+        data = datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f'Data inválida: {valor} (use AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)')
+    if fim and len(valor) == 10:
+        data += timedelta(days=1)
+    return data.timestamp()
+
+
+def init_ledger_routes(app):
+    @app.route('/boletos', methods=['GET'])
+    @exigir_admin
+    def listar_boletos():
+        if ledger is None:
+            return jsonify({'erro': 'Ledger desativado (LEDGER_BACKEND=nenhum)'}), 404
+
+        args = request.args
+        try:
+            limite = min(int(args.get('limite', 50)), LEDGER_PAGINA_MAX)
+            if limite < 1:
+                raise ValueError('limite deve ser positivo')
+            data = args.get('data', 'criacao')
+            if data not in CAMPOS_DATA:
+                raise ValueError(f"data deve ser um de: {', '.join(CAMPOS_DATA)}")
+            boletos, proximo = ledger.consultar(
+                filtros={campo: args[campo] for campo in FILTROS if args.get(campo)},
+                metadata={
+                    chave[len(PREFIXO_METADATA):]: valor
+                    for chave, valor in args.items() if chave.startswith(PREFIXO_METADATA)
+                },
+                desde=_timestamp(args.get('desde')),
+                ate=_timestamp(args.get('ate'), fim=True),
+                data=data,
+                limite=limite,
+                cursor=args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'erro': str(e)}), 400
+
+        return jsonify({'boletos': boletos, 'proximo_cursor': proximo})
+
+    @app.route('/boletos/<boleto_id>', methods=['GET'])
+    @exigir_admin
+    def obter_boleto(boleto_id):
+        if ledger is None:
+            return jsonify({'erro': 'Ledger desativado (LEDGER_BACKEND=nenhum)'}), 404
+
+        boleto = ledger.obter(boleto_id)
+        if boleto is None:
+            return jsonify({'erro': 'Boleto não encontrado'}), 404
+        return jsonify(boleto)
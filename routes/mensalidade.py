@@ -1,102 +1,55 @@
-from flask import jsonify, request
 from datetime import datetime
-from firebase_admin import firestore
-import os
-import stripe
-from dotenv import load_dotenv
-import json
-from config import STRIPE_WEBHOOK_SECRET_MENSAL
+import logging
+from routes.webhooks import webhook_handler
+from services.disjuntor import CircuitoAberto
+from services.faturas import atualizar_fatura, CLIENTE_NAO_ENCONTRADO, FATURA_NAO_ENCONTRADA
+from services.notificacoes import notificar
 
-# Carregar variáveis do .env
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+@webhook_handler('mensalidade', 'payment_intent.succeeded')
+def processar_mensalidade(db, event):
+    try:
+        # Extrair dados do pagamento
+        payment_intent = event['data']['object']
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Dados do pagamento", extra={'payment_intent': payment_intent})
+        
+        # Extrair metadados do pagamento
+        metadata = payment_intent.get('metadata', {})
+        
+        fatura_id = metadata.get('fatura_id')
+        cliente_id = metadata.get('cliente_id')
+        
+        if not fatura_id or not cliente_id:
+            logger.warning("Metadados incompletos - fatura_id ou cliente_id não encontrados")
+            return {"erro": "Metadados incompletos"}, 400
+            
+        pagamento = {
+            'status': 'pago',
+            'dataPagamento': datetime.now().strftime('%d/%m/%Y'),
+            'paymentIntentId': payment_intent.get('id'),
+            'valorPago': payment_intent.get('amount') / 100  # Converte de centavos para reais
+        }
+        resultado = atualizar_fatura(db, cliente_id, fatura_id, pagamento)
+        
+        if resultado == CLIENTE_NAO_ENCONTRADO:
+            logger.warning("Cliente não encontrado - ID: %s", cliente_id)
+            return {"erro": "Cliente não encontrado"}, 404
+        
+        if resultado == FATURA_NAO_ENCONTRADA:
+            logger.warning("Fatura não encontrada - ID: %s", fatura_id)
+            return {"erro": "Fatura não encontrado"}, 404
+            
+        logger.info("Fatura %s marcada como paga para o cliente %s", fatura_id, cliente_id)
+        notificar('mensalidade', 'fatura_paga', event, {
+            'cliente_id': cliente_id, 'fatura_id': fatura_id, **pagamento
+        }, url=metadata.get('webhook_url'))
+        return {"mensagem": "Pagamento processado com sucesso"}, 200
 
-def init_mensalidade_routes(app, db):
-    @app.route('/webhook-mensal', methods=['POST'])
-    def webhook_mensalidade():
-        try:
-            print("\n=== Novo Webhook Recebido ===")
-            print("Dados recebidos:", request.get_data(as_text=True))
-            
-            try:
-                signature = request.headers.get('stripe-signature')
-                if not signature:
-                    print('❌ Assinatura não encontrada nos headers')
-                    return jsonify({'erro': 'Assinatura não encontrada'}), 400
-
-                event = stripe.Webhook.construct_event(
-                    request.data,
-                    signature,
-                    STRIPE_WEBHOOK_SECRET_MENSAL
-                )
-                print('✅ Assinatura do webhook válida')
-            except stripe.error.SignatureVerificationError as e:
-                print('❌ Assinatura do webhook inválida:', str(e))
-                return jsonify({'erro': 'Assinatura inválida'}), 400
-            
-            
-            
-            # Verificar se é o evento de pagamento bem-sucedido
-            if event['type'] != 'payment_intent.succeeded':
-                print(f"Evento ignorado: {event['type']}")
-                return jsonify({"mensagem": "Evento ignorado"}), 200
-            
-            print("✅ Evento payment_intent.succeeded recebido")
-            
-            # Extrair dados do pagamento
-            payment_intent = event['data']['object']
-            print("Dados do pagamento:", payment_intent)
-            
-            # Extrair metadados do pagamento
-            metadata = payment_intent.get('metadata', {})
-            print("Metadados extraídos:", metadata)
-            
-            fatura_id = metadata.get('fatura_id')
-            cliente_id = metadata.get('cliente_id')
-            
-            if not fatura_id or not cliente_id:
-                print("Erro: Metadados incompletos - fatura_id ou cliente_id não encontrados")
-                return jsonify({"erro": "Metadados incompletos"}), 400
-                
-            # Buscar documento do cliente
-            cliente_ref = db.collection('clientes').document(cliente_id)
-            cliente_doc = cliente_ref.get()
-            
-            if not cliente_doc.exists:
-                print(f"Erro: Cliente não encontrado - ID: {cliente_id}")
-                return jsonify({"erro": "Cliente não encontrado"}), 404
-                
-            cliente_data = cliente_doc.to_dict()
-            faturas = cliente_data.get('faturas', [])
-            
-            # Encontrar e atualizar a fatura específica
-            fatura_encontrada = False
-            for fatura in faturas:
-                if fatura.get('id') == fatura_id:
-                    fatura['status'] = 'pago'
-                    fatura['dataPagamento'] = datetime.now().strftime('%d/%m/%Y')
-                    fatura['paymentIntentId'] = payment_intent.get('id')
-                    fatura['valorPago'] = payment_intent.get('amount') / 100  # Converte de centavos para reais
-                    fatura_encontrada = True
-                    print(f"Fatura {fatura_id} encontrada e atualizada")
-                    break
-            
-            if not fatura_encontrada:
-                print(f"Erro: Fatura não encontrada - ID: {fatura_id}")
-                return jsonify({"erro": "Fatura não encontrado"}), 404
-                
-            # Atualizar o documento do cliente
-            cliente_ref.update({
-                'faturas': faturas
-            })
-            
-            print(f"Fatura {fatura_id} marcada como paga para o cliente {cliente_id}")
-            print("=== Webhook Processado com Sucesso ===\n")
-            return jsonify({"mensagem": "Pagamento processado com sucesso"}), 200
-            
-        except Exception as e:
-            print("Erro ao processar webhook:", str(e))
-            print('Detalhes do erro:', e.__class__.__name__)
-            print('Stack trace:', e.__traceback__)
-            return jsonify({"erro": str(e)}), 500
\ No newline at end of file
+    except CircuitoAberto:
+        # Firestore fora: o dispatcher responde 503 e o Stripe reenvia
+        raise
+    except Exception as e:
+        logger.exception("Erro ao processar webhook: %s", e.__class__.__name__)
+        return {"erro": str(e)}, 500
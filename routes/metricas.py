@@ -0,0 +1,48 @@
+from flask import Response, g, request
+import time
+from services.metricas import registro, formatar_prometheus
+from services.webhook_fila import webhook_fila
+
+tempo_requisicoes = registro.histograma(
+    'http_requisicao_segundos',
+    'Tempo de resposta por endpoint, método e status'
+)
+
+
+def observar_requisicao(endpoint, metodo, status, duracao):
+    tempo_requisicoes.observar(duracao, endpoint=endpoint, metodo=metodo, status=str(status))
+
+
+def _registrar_medidores_fila():
+    # Uma leitura da fila (COUNTs no SQLite) por coleta, para todos os medidores; os totais de
+    # processados e falhas são contadores (webhook_fila_*_total), incrementados pela própria fila
+    fila = registro.instantaneo(webhook_fila.metricas)
+    for nome, chave, descricao in (
+        ('webhook_fila_profundidade', 'profundidade', 'Eventos pendentes ou em processamento na fila'),
+        ('webhook_fila_lag_segundos', 'lag_segundos', 'Idade do evento mais antigo ainda na fila'),
+        ('webhook_fila_descartados', 'descartados', 'Eventos que esgotaram as tentativas ou que o handler recusou'),
+    ):
+        registro.medidor(nome, descricao, lambda chave=chave: fila()[chave])
+
+
+def init_metricas(app):
+    _registrar_medidores_fila()
+
+    @app.before_request
+    def iniciar_cronometro():
+        g._inicio_requisicao = time.perf_counter()
+
+    @app.after_request
+    def medir_requisicao(response):
+        inicio = g.pop('_inicio_requisicao', None)
+        if inicio is not None:
+            # Rotas inexistentes ficam agrupadas para não criar uma série por URL
+            observar_requisicao(
+                request.endpoint or 'nao_encontrado', request.method, response.status_code,
+                time.perf_counter() - inicio
+            )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(formatar_prometheus(registro), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,51 @@
+from flask import jsonify, request
+import logging
+from routes.admin import exigir_admin
+from services.metricas import registro
+from services.notificacoes import notificacoes
+
+logger = logging.getLogger(__name__)
+
+MAX_FALHAS_LISTADAS = 500
+
+
+def init_notificacoes_routes(app):
+    # Uma consulta ao SQLite por coleta para os dois medidores
+    estado = registro.instantaneo(notificacoes.metricas)
+    registro.medidor(
+        'notificacoes_pendentes', 'Notificações de saída aguardando entrega',
+        lambda: estado()['pendentes']
+    )
+    registro.medidor(
+        'notificacoes_falhas', 'Notificações de saída que esgotaram as tentativas',
+        lambda: estado()['falhas']
+    )
+
+    if notificacoes.ativa:
+        notificacoes.iniciar()
+
+        # Workers criados por fork depois do create_app (gunicorn --preload) recriam a thread de entrega
+        @app.before_request
+        def garantir_entrega_notificacoes():
+            notificacoes.iniciar()
+
+    @app.route('/notificacoes', methods=['GET'])
+    @exigir_admin
+    def listar_notificacoes():
+        try:
+            limite = min(int(request.args.get('limite', 100)), MAX_FALHAS_LISTADAS)
+        except ValueError:
+            return jsonify({'erro': 'limite inválido'}), 400
+        return jsonify({
+            'ativa': notificacoes.ativa,
+            **notificacoes.metricas(),
+            'falhas_recentes': notificacoes.listar_falhas(limite)
+        })
+
+    @app.route('/notificacoes/<notificacao_id>/reenviar', methods=['POST'])
+    @exigir_admin
+    def reenviar_notificacao(notificacao_id):
+        if not notificacoes.reenviar(notificacao_id):
+            return jsonify({'erro': 'Notificação não encontrada entre as falhas'}), 404
+        logger.info("Notificação %s devolvida para a fila", notificacao_id)
+        return jsonify({'mensagem': 'Notificação devolvida para a fila'})
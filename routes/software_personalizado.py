@@ -1,91 +1,51 @@
-from flask import jsonify, request
-import stripe
-import time
-import traceback
+import logging
 from datetime import datetime
-from firebase_admin import firestore
-import random
-import os
-from dotenv import load_dotenv
-import json
-from config import STRIPE_WEBHOOK_SECRET_PERSONALIZADO
-
-# Carregar variáveis do .env
-load_dotenv()
-
-# Configurar a chave do Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
-
-def init_software_personalizado_routes(app, db):
-    @app.route('/webhook-software-personalizado', methods=['POST'])
-    def software_personalizado():
-        try:
-            print('\n=== WEBHOOK PAGAMENTO RECEBIDO ===')
-            print('Headers:', dict(request.headers))
-            print('Payload:', request.get_json())
-            
-            try:
-                event = stripe.Webhook.construct_event(
-                    request.data,
-                    request.headers['Stripe-Signature'],
-                    STRIPE_WEBHOOK_SECRET_PERSONALIZADO
-                )
-                print('✅ Assinatura do webhook válida')
-            except stripe.error.SignatureVerificationError as e:
-                print('❌ Assinatura do webhook inválida:', str(e))
-                return jsonify({'erro': 'Assinatura inválida'}), 400
-
-            if event['type'] != 'payment_intent.succeeded':
-                print(f"Evento ignorado: {event['type']}")
-                return jsonify({"mensagem": "Evento ignorado"}), 200
-            
-            print("✅ Evento payment_intent.succeeded recebido")
-            
-            payment_intent = event['data']['object']
-            print("Dados do pagamento:", payment_intent)
-            
-            # Extrair metadados
-            metadata = payment_intent.get('metadata', {})
-            print("Metadados extraídos:", metadata)
-            
-            projectId = metadata.get('projectId')
-            projectName = metadata.get('projectName')
-            
-            if not projectId or not projectName:
-                print("Erro: Metadados incompletos - projectId ou projectName não encontrados")
-                return jsonify({'erro': 'Metadados inválidos'}), 400
-
-            # Buscar projeto no Firestore
-            software_ref = db.collection('software_personalizado')
-            projeto_query = software_ref.where(
-                field_path='clienteId',
-                op_string='==',
-                value=projectId
-            ).where(
-                field_path='nomeProjeto',
-                op_string='==',
-                value=projectName
-            ).get()
-
-            if not projeto_query:
-                print(f"Erro: Projeto não encontrado - ID: {projectId}, Nome: {projectName}")
-                return jsonify({'erro': 'Projeto não encontrado'}), 404
-
-            # Atualizar status do pagamento
-            for doc in projeto_query:
-                doc.reference.update({
-                    'status_pagamento': 'Pago',
-                    'data_pagamento': datetime.now().isoformat(),
-                    'paymentIntentId': payment_intent.get('id'),
-                    'valorPago': payment_intent.get('amount') / 100  # Converte de centavos para reais
-                })
-                print(f"✅ Projeto {projectName} atualizado com sucesso")
-
-            print("=== Webhook Processado com Sucesso ===\n")
-            return jsonify({'status': 'success'})
-
-        except Exception as e:
-            print('❌ Erro no webhook:', str(e))
-            print('Detalhes do erro:', e.__class__.__name__)
-            print('Stack trace:', e.__traceback__)
-            return jsonify({'erro': str(e)}), 500
\ No newline at end of file
+from routes.webhooks import webhook_handler
+from services.disjuntor import CircuitoAberto
+from services.notificacoes import notificar
+from services.software_indice import atualizar_projetos
+
+logger = logging.getLogger(__name__)
+
+@webhook_handler('software_personalizado', 'payment_intent.succeeded')
+def processar_software_personalizado(db, event):
+    try:
+        payment_intent = event['data']['object']
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Dados do pagamento", extra={'payment_intent': payment_intent})
+        
+        # Extrair metadados
+        metadata = payment_intent.get('metadata', {})
+        
+        projectId = metadata.get('projectId')
+        projectName = metadata.get('projectName')
+        
+        if not projectId or not projectName:
+            logger.warning("Metadados incompletos - projectId ou projectName não encontrados")
+            return {'erro': 'Metadados inválidos'}, 400
+
+        # Atualizar status do pagamento (índice + escrita em lote)
+        pagamento = {
+            'status_pagamento': 'Pago',
+            'data_pagamento': datetime.now().isoformat(),
+            'paymentIntentId': payment_intent.get('id'),
+            'valorPago': payment_intent.get('amount') / 100  # Converte de centavos para reais
+        }
+        atualizados = atualizar_projetos(db, projectId, projectName, pagamento)
+
+        if not atualizados:
+            logger.warning("Projeto não encontrado - ID: %s, Nome: %s", projectId, projectName)
+            return {'erro': 'Projeto não encontrado'}, 404
+
+        logger.info("Projeto %s atualizado com sucesso (%d documento(s))", projectName, atualizados)
+        notificar('software_personalizado', 'projeto_pago', event, {
+            'projectId': projectId, 'projectName': projectName, 'projetos_atualizados': atualizados, **pagamento
+        }, url=metadata.get('webhook_url'))
+        return {'status': 'success'}, 200
+
+    except CircuitoAberto:
+        # Firestore fora: o dispatcher responde 503 e o Stripe reenvia
+        raise
+    except Exception as e:
+        logger.exception('Erro no webhook: %s', e.__class__.__name__)
+        return {'erro': str(e)}, 500
@@ -0,0 +1,320 @@
+from flask import jsonify, request
+import logging
+import re
+import time
+import stripe
+from config import WEBHOOK_ASYNC, WEBHOOK_MAX_BYTES
+from services import assinatura, serializacao
+from services.contas_stripe import contas, conta_do_evento, CONTA_PADRAO
+from services.disjuntor import CircuitoAberto
+from services.idempotencia import criar_idempotencia_store, PROCESSADO, NOVA
+from services.metricas import registro
+from services.ledger import ledger
+from services.status_cache import status_cache
+from services.status_eventos import status_hub
+from services.webhook_fila import webhook_fila
+
+logger = logging.getLogger(__name__)
+
+# endpoint -> rota; os segredos de assinatura são das contas Stripe (services.contas_stripe)
+WEBHOOK_ENDPOINTS = {
+    'mensalidade': '/webhook-mensal',
+    'software_personalizado': '/webhook-software-personalizado',
+    'opencode': '/webhook-opencode',
+}
+
+# Valores de "type" no corpo bruto; o do evento está entre eles
+TIPO_REGEX = re.compile(rb'"type"\s*:\s*"([A-Za-z0-9_.]+)"')
+EVENTO_ID_REGEX = re.compile(rb'"id"\s*:\s*"(evt_[A-Za-z0-9_]+)"')
+
+tempo_handlers = registro.histograma(
+    'webhook_handler_segundos',
+    'Tempo de execução de cada handler de webhook'
+)
+eventos_recebidos = registro.contador(
+    'webhook_eventos_total',
+    'Webhooks com assinatura válida por endpoint, tipo do evento e resultado'
+)
+
+# (endpoint, tipo) -> [(handler, assincrono)]
+# endpoint '*' vale para todos; tipo 'prefixo.*' vale para todos os tipos do prefixo
+_handlers = {}
+
+
+def webhook_handler(endpoint, tipo, assincrono=True):
+    """Registra handler(db, event) para um endpoint e tipo de evento.
+
+    O handler retorna (resposta, status_code) ou None. Com WEBHOOK_ASYNC os
+    handlers assíncronos rodam na fila; os demais sempre rodam na requisição.
+    """
+    def decorator(func):
+        _handlers.setdefault((endpoint, tipo), []).append((func, assincrono))
+        return func
+    return decorator
+
+
+def handlers_para(endpoint, tipo):
+    encontrados = []
+    prefixo = tipo.rsplit('.', 1)[0] + '.*'
+    for chave in ((endpoint, tipo), ('*', tipo), (endpoint, prefixo), ('*', prefixo)):
+        encontrados.extend(_handlers.get(chave, []))
+    return encontrados
+
+
+def tipo_tratado(endpoint, payload):
+    """Diz, sem decodificar o JSON, se algum handler pode tratar o evento."""
+    return any(handlers_para(endpoint, tipo.decode()) for tipo in TIPO_REGEX.findall(payload))
+
+
+def extrair_tipo(payload):
+    """Tipo do evento lido do corpo bruto (só os tipos de evento têm ponto, como payment_intent.succeeded)."""
+    tipos = {tipo for tipo in TIPO_REGEX.findall(payload) if b'.' in tipo}
+    return tipos.pop().decode() if len(tipos) == 1 else 'desconhecido'
+
+
+def _resultado(resposta):
+    corpo, status_code = resposta
+    if corpo.get('mensagem') == 'Evento duplicado':
+        return 'duplicado'
+    if status_code == 409:
+        return 'em_processamento'
+    if status_code >= 400:
+        return 'falhou'
+    return 'enfileirado' if corpo.get('status') == 'recebido' else 'processado'
+
+
+def extrair_evento_id(payload):
+    """Id do evento lido direto do corpo bruto, quando não há ambiguidade."""
+    ids = set(EVENTO_ID_REGEX.findall(payload))
+    return ids.pop().decode() if len(ids) == 1 else None
+
+
+def executar_handlers(db, endpoint, event, assincrono=None):
+    """Executa os handlers do evento; assincrono=None executa todos."""
+    resposta = None
+    for handler, handler_assincrono in handlers_para(endpoint, event['type']):
+        if assincrono is not None and handler_assincrono != assincrono:
+            continue
+        inicio = time.perf_counter()
+        try:
+            resultado = handler(db, event)
+        finally:
+            tempo_handlers.observar(
+                time.perf_counter() - inicio,
+                endpoint=endpoint,
+                tipo=event['type'],
+                handler=handler.__name__
+            )
+        # Prevalece a primeira resposta de erro; senão a última resposta dada
+        if resultado is not None and (resposta is None or resposta[1] < 400):
+            resposta = resultado
+    return resposta or ({'status': 'success'}, 200)
+
+
+@webhook_handler('*', 'payment_intent.*', assincrono=False)
+def atualizar_status_cache(db, event):
+    # Mantém o cache de status do /verificar-boleto em dia e avisa as conexões SSE do boleto,
+    # nas chaves da conta que assinou o evento
+    payment_intent_id = event['data']['object'].get('id')
+    if not payment_intent_id:
+        return
+    chave = conta_do_evento(event).chave_cache(payment_intent_id)
+    dados = status_cache.aplicar_evento(event, chave)
+    status_hub.publicar(chave, dados)
+
+
+@webhook_handler('*', 'payment_intent.*', assincrono=False)
+def atualizar_ledger(db, event):
+    # Registro local dos boletos; uma falha aqui não deve fazer o Stripe reenviar o evento
+    if ledger is None:
+        return
+    try:
+        ledger.aplicar_evento(event, conta_do_evento(event).nome)
+    except Exception as e:
+        logger.warning("Falha ao atualizar ledger com o evento %s: %s", event.get('id'), str(e))
+
+
+def _reservar(idempotencia, chave, reservadas):
+    """Reserva a chave; retorna a resposta a dar ao Stripe se for duplicada."""
+    status = idempotencia.reservar(chave)
+    if status == NOVA:
+        reservadas.append(chave)
+        return None
+    if status == PROCESSADO:
+        logger.info('Evento duplicado ignorado: %s', chave)
+        return {'mensagem': 'Evento duplicado'}, 200
+    # Outro worker está processando; o Stripe reenvia mais tarde
+    logger.info('Evento em processamento por outro worker: %s', chave)
+    return {'erro': 'Evento em processamento'}, 409
+
+
+def nome_fila(endpoint, conta):
+    # Eventos da conta padrão mantêm o nome antigo na fila
+    return endpoint if conta.nome == CONTA_PADRAO else f'{endpoint}@{conta.nome}'
+
+
+def _processar(db, idempotencia, endpoint, payload, conta):
+    reservadas = []
+    try:
+        resposta = _deduplicar_e_executar(db, idempotencia, endpoint, payload, conta, reservadas)
+    except Exception:
+        for chave in reservadas:
+            idempotencia.liberar(chave)
+        raise
+
+    # Só eventos aplicados com sucesso (ou duplicados) ficam marcados; erros podem ser reenviados
+    for chave in reservadas:
+        if resposta[1] < 400:
+            idempotencia.confirmar(chave)
+        else:
+            idempotencia.liberar(chave)
+    return resposta
+
+
+def _deduplicar_e_executar(db, idempotencia, endpoint, payload, conta, reservadas):
+    evento_id = extrair_evento_id(payload)
+    if evento_id:
+        duplicado = _reservar(idempotencia, f'evento:{evento_id}', reservadas)
+        if duplicado:
+            return duplicado
+
+    # Único parse do corpo, feito só depois da assinatura validada
+    event = conta.construir_evento(serializacao.loads(payload))
+    logger.info('Evento %s recebido em %s (conta %s): %s', event.get('id'), endpoint, conta.nome, event['type'])
+
+    if not evento_id and event.get('id'):
+        duplicado = _reservar(idempotencia, f"evento:{event['id']}", reservadas)
+        if duplicado:
+            return duplicado
+
+    # O mesmo pagamento não é aplicado duas vezes, mesmo vindo em outro evento
+    objeto_id = (event.get('data') or {}).get('object', {}).get('id') or ''
+    if objeto_id.startswith('pi_'):
+        duplicado = _reservar(idempotencia, f"pi:{endpoint}:{event['type']}:{objeto_id}", reservadas)
+        if duplicado:
+            return duplicado
+
+    if not WEBHOOK_ASYNC:
+        return executar_handlers(db, endpoint, event)
+
+    resposta = executar_handlers(db, endpoint, event, assincrono=False)
+    if resposta[1] >= 400:
+        return resposta
+    if any(assincrono for _, assincrono in handlers_para(endpoint, event['type'])):
+        webhook_fila.enfileirar(nome_fila(endpoint, conta), event.get('id'), payload)
+        logger.debug('Evento %s enfileirado para processamento', event.get('id'))
+    return {'status': 'recebido'}, 200
+
+
+def checar_cabecalho(endpoint, segredos, signature, tamanho=None):
+    """Checagens feitas antes de ler o corpo: assinatura, timestamp e tamanho declarado.
+
+    Retorna (resposta de erro, None) ou (None, cabecalho da assinatura).
+    """
+    if not signature:
+        logger.warning('Webhook %s sem assinatura nos headers', endpoint)
+        return ({'erro': 'Assinatura não encontrada'}, 400), None
+    if not segredos:
+        logger.error('Segredo do webhook %s não configurado', endpoint)
+        return ({'erro': 'Webhook não configurado'}, 500), None
+    if tamanho is not None and tamanho > WEBHOOK_MAX_BYTES:
+        logger.warning('Webhook %s rejeitado: corpo de %d bytes', endpoint, tamanho)
+        return ({'erro': 'Payload muito grande'}, 413), None
+    try:
+        return None, assinatura.ler_cabecalho(signature)
+    except stripe.error.SignatureVerificationError as e:
+        logger.warning('Assinatura do webhook %s inválida: %s', endpoint, str(e))
+        return ({'erro': 'Assinatura inválida'}, 400), None
+
+
+def receber_webhook(db, idempotencia, endpoint, payload, cabecalho, headers=None):
+    """Valida o corpo de um webhook e o processa; retorna (resposta, status_code).
+
+    Recebe o cabeçalho já aprovado por checar_cabecalho(). A conta Stripe do
+    evento é a do segredo que confere com a assinatura. Independente do
+    framework: usado pela view Flask e pelo modo ASGI.
+    """
+    try:
+        if len(payload) > WEBHOOK_MAX_BYTES:
+            logger.warning('Webhook %s rejeitado: corpo maior que %d bytes', endpoint, WEBHOOK_MAX_BYTES)
+            return {'erro': 'Payload muito grande'}, 413
+
+        # Uma única verificação, sobre os bytes crus, antes de qualquer parse ou log do corpo
+        try:
+            conta = contas.conta_do_webhook(endpoint, payload, cabecalho)
+        except stripe.error.SignatureVerificationError as e:
+            logger.warning('Assinatura do webhook %s inválida: %s', endpoint, str(e))
+            return {'erro': 'Assinatura inválida'}, 400
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Webhook %s recebido', endpoint, extra={
+                'headers': dict(headers or {}),
+                'payload': payload.decode('utf-8', 'replace')
+            })
+
+        tipo = extrair_tipo(payload)
+        if not tipo_tratado(endpoint, payload):
+            logger.debug('Evento ignorado em %s: nenhum handler registrado', endpoint)
+            eventos_recebidos.incrementar(endpoint=endpoint, tipo=tipo, resultado='ignorado')
+            return {"mensagem": "Evento ignorado"}, 200
+
+        try:
+            resposta = _processar(db, idempotencia, endpoint, payload, conta)
+        except CircuitoAberto as e:
+            # Firestore fora: responde na hora e o Stripe reenvia o evento mais tarde
+            logger.warning('Webhook %s recusado: %s', endpoint, str(e))
+            eventos_recebidos.incrementar(endpoint=endpoint, tipo=tipo, resultado='indisponivel')
+            return {'erro': str(e)}, 503
+        except Exception:
+            eventos_recebidos.incrementar(endpoint=endpoint, tipo=tipo, resultado='falhou')
+            raise
+        eventos_recebidos.incrementar(endpoint=endpoint, tipo=tipo, resultado=_resultado(resposta))
+        return resposta
+
+    except Exception as e:
+        logger.exception('Erro no webhook %s: %s', endpoint, e.__class__.__name__)
+        return {'erro': str(e)}, 500
+
+
+def _criar_view(db, idempotencia, endpoint):
+    def view():
+        erro, cabecalho = checar_cabecalho(
+            endpoint, contas.segredos_webhook(endpoint), request.headers.get('Stripe-Signature'),
+            request.content_length
+        )
+        if erro:
+            return jsonify(erro[0]), erro[1]
+
+        # Lê no máximo um byte além do limite (corpos sem Content-Length)
+        payload = request.stream.read(WEBHOOK_MAX_BYTES + 1)
+        resposta, status_code = receber_webhook(
+            db, idempotencia, endpoint, payload, cabecalho, request.headers
+        )
+        return jsonify(resposta), status_code
+
+    view.__name__ = f'webhook_{endpoint}'
+    return view
+
+
+def _criar_processador_fila(db, endpoint, conta):
+    def processar(dados):
+        event = conta.construir_evento(dados)
+        return executar_handlers(db, endpoint, event, assincrono=True)
+    return processar
+
+
+def init_webhook_dispatcher(app, db):
+    # Importados aqui para registrarem seus handlers
+    from routes import mensalidade, software_personalizado, webhook_opencode  # noqa: F401
+
+    idempotencia = criar_idempotencia_store(db)
+    # Usados pelo modo ASGI (asgi.py), que atende as mesmas rotas sem passar pelo Flask
+    app.extensions['webhooks'] = {'db': db, 'idempotencia': idempotencia}
+    for endpoint, rota in WEBHOOK_ENDPOINTS.items():
+        app.add_url_rule(rota, view_func=_criar_view(db, idempotencia, endpoint), methods=['POST'])
+        for conta in contas:
+            webhook_fila.registrar(nome_fila(endpoint, conta), _criar_processador_fila(db, endpoint, conta))
+
+    @app.route('/webhooks/metricas', methods=['GET'])
+    def metricas_webhooks():
+        return jsonify({'handlers': tempo_handlers.resumo()})
@@ -0,0 +1,91 @@
+import threading
+
+from config import (
+    ADMISSAO_MAX_GERAR_BOLETO, ADMISSAO_MAX_VERIFICAR_BOLETO, ADMISSAO_MAX_WEBHOOKS, ADMISSAO_RETRY_AFTER
+)
+from services.metricas import registro
+
+requisicoes_rejeitadas = registro.contador(
+    'admissao_rejeitadas_total', 'Requisições respondidas com 503 por limite de concorrência, por limite'
+)
+
+
+class LimiteConcorrencia:
+    """Quantas requisições de uma rota podem estar em andamento ao mesmo tempo.
+
+    `entrar()` não espera: retorna False se o limite foi atingido, para a
+    requisição ser recusada na hora em vez de ficar na fila atrás das outras.
+    """
+
+    def __init__(self, nome, maximo):
+        self.nome = nome
+        self.maximo = maximo
+        self._em_andamento = 0
+        self._lock = threading.Lock()
+
+    def entrar(self):
+        with self._lock:
+            if self._em_andamento >= self.maximo:
+                cheio = True
+            else:
+                self._em_andamento += 1
+                cheio = False
+        if cheio:
+            requisicoes_rejeitadas.incrementar(limite=self.nome)
+        return not cheio
+
+    def sair(self):
+        with self._lock:
+            self._em_andamento -= 1
+
+    @property
+    def em_andamento(self):
+        return self._em_andamento
+
+
+def _criar_limites():
+    webhooks = LimiteConcorrencia('webhooks', ADMISSAO_MAX_WEBHOOKS)
+    limites = {
+        'gerar_boleto': LimiteConcorrencia('gerar_boleto', ADMISSAO_MAX_GERAR_BOLETO),
+        'verificar_boleto': LimiteConcorrencia('verificar_boleto', ADMISSAO_MAX_VERIFICAR_BOLETO),
+        # Os três endpoints disputam o mesmo Firestore: um limite para todos
+        'webhook_mensalidade': webhooks,
+        'webhook_software_personalizado': webhooks,
+        'webhook_opencode': webhooks,
+    }
+    return {endpoint: limite for endpoint, limite in limites.items() if limite.maximo > 0}
+
+
+# Por nome de endpoint (os mesmos no Flask e no modo ASGI)
+limites_admissao = _criar_limites()
+
+registro.medidor(
+    'admissao_em_andamento', 'Requisições em andamento por limite de concorrência',
+    lambda: {(('limite', limite.nome),): limite.em_andamento for limite in set(limites_admissao.values())}
+)
+
+
+def resposta_saturada():
+    return {'erro': 'Servidor ocupado, tente novamente em instantes'}, 503, {'Retry-After': str(ADMISSAO_RETRY_AFTER)}
+
+
+def init_admissao(app):
+    """Aplica os limites de concorrência às rotas do Flask."""
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def admitir_requisicao():
+        limite = limites_admissao.get(request.endpoint)
+        if limite is None:
+            return None
+        if not limite.entrar():
+            corpo, status, headers = resposta_saturada()
+            return jsonify(corpo), status, headers
+        g._limite_admissao = limite
+        return None
+
+    @app.teardown_request
+    def liberar_admissao(exc):
+        limite = g.pop('_limite_admissao', None)
+        if limite is not None:
+            limite.sair()
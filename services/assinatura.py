@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import threading
+import time
+
+import stripe
+
+from config import WEBHOOK_TOLERANCIA
+
+# Objeto HMAC já inicializado por segredo: cada verificação só faz copy() + update()
+_hmacs = {}
+_lock = threading.Lock()
+
+
+def _invalida(mensagem, header):
+    return stripe.error.SignatureVerificationError(mensagem, header)
+
+
+def ler_cabecalho(header, tolerancia=WEBHOOK_TOLERANCIA, agora=None):
+    """Lê o Stripe-Signature e confere o timestamp, sem tocar no corpo.
+
+    Retorna (timestamp, assinaturas v1) ou levanta SignatureVerificationError.
+    """
+    timestamp = None
+    assinaturas = []
+    for item in header.split(','):
+        chave, _, valor = item.strip().partition('=')
+        if chave == 't':
+            timestamp = valor
+        elif chave == 'v1':
+            assinaturas.append(valor)
+
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        raise _invalida('Timestamp ausente ou inválido no header de assinatura', header)
+    if not assinaturas:
+        raise _invalida('Nenhuma assinatura v1 no header', header)
+
+    agora = time.time() if agora is None else agora
+    if tolerancia and abs(agora - timestamp) > tolerancia:
+        raise _invalida('Timestamp fora da tolerância', header)
+    return timestamp, assinaturas
+
+
+def _hmac_base(segredo):
+    base = _hmacs.get(segredo)
+    if base is None:
+        with _lock:
+            base = _hmacs.setdefault(segredo, hmac.new(segredo.encode('utf-8'), digestmod=hashlib.sha256))
+    return base
+
+
+def assinar(payload, segredo, timestamp=None):
+    """Header no mesmo formato do Stripe-Signature (t=...,v1=...) para os bytes de `payload`."""
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    mac = _hmac_base(segredo).copy()
+    mac.update(str(timestamp).encode('ascii') + b'.')
+    mac.update(payload)
+    return f't={timestamp},v1={mac.hexdigest()}'
+
+
+def verificar_corpo(payload, cabecalho, segredo, header=''):
+    """Confere o HMAC de `t.payload` sobre os bytes crus; levanta SignatureVerificationError."""
+    timestamp, assinaturas = cabecalho
+    mac = _hmac_base(segredo).copy()
+    mac.update(str(timestamp).encode('ascii') + b'.')
+    mac.update(payload)
+    esperada = mac.hexdigest()
+    if not any(hmac.compare_digest(esperada, assinatura) for assinatura in assinaturas):
+        raise _invalida('Nenhuma assinatura confere com o payload', header)
+
+
+def verificar(payload, header, segredo, tolerancia=WEBHOOK_TOLERANCIA):
+    verificar_corpo(payload, ler_cabecalho(header, tolerancia), segredo, header)
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import math
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import stripe
+
+from config import BOLETO_IDEMPOTENCIA_TTL, BOLETO_IDEMPOTENCIA_MAX_ITENS
+from services.cache import TTLCache
+from services.chamada_unica import ChamadaUnica
+from services.contas_stripe import contas
+from services.disjuntor import CircuitoAberto
+from services.ledger import ledger
+from services.serializacao import fragmentos
+from services.status_cache import status_cache
+
+logger = logging.getLogger(__name__)
+
+# Respostas do /gerar-boleto por chave de idempotência (ContaStripe.chave_cache): repetições não chamam o Stripe
+boletos_gerados = TTLCache(max_itens=BOLETO_IDEMPOTENCIA_MAX_ITENS, ttl=BOLETO_IDEMPOTENCIA_TTL)
+
+# Consultas simultâneas ao mesmo PaymentIntent (polling em rajada) fazem uma chamada ao Stripe só
+consultas_status = ChamadaUnica('verificar_boleto')
+
+# Serializa requisições simultâneas com a mesma chave (duplo clique) sem um lock por chave;
+# os do event loop servem a gerar_boleto_idempotente_async
+_locks_geracao = [threading.Lock() for _ in range(64)]
+_locks_geracao_async = [asyncio.Lock() for _ in range(64)]
+
+MAX_TAMANHO_CHAVE = 255
+# Chaves geradas no servidor (requisição sem Idempotency-Key): nunca se repetem, não vão para o cache
+PREFIXO_CHAVE_GERADA = 'gerada-'
+
+# Erros que indicam o Stripe fora, e não um problema do pedido
+STRIPE_INDISPONIVEL = (CircuitoAberto, stripe.error.APIConnectionError, stripe.error.APIError)
+
+# Partes constantes das respostas, codificadas em JSON uma única vez no boot
+fragmentos.registrar('public_key', contas.padrao.public_key)
+INSTRUCOES = fragmentos.registrar('instrucoes', [
+    '1. Copie o código de barras ou linha digitável',
+    '2. Pague em qualquer banco ou lotérica',
+    '3. Ou acesse o PDF do boleto para imprimir',
+    '4. O pagamento será confirmado automaticamente'
+])
+
+
+def validar_boleto(data):
+    """Valida e normaliza os dados de um boleto.
+
+    Retorna (dados, None) ou (None, mensagem de erro).
+    """
+    if not isinstance(data, dict):
+        return None, 'Dados do boleto inválidos'
+
+    valor = data.get('valor')
+    email = data.get('email')
+    nome = data.get('nome')
+    cpf = data.get('cpf')
+
+    if not valor:
+        return None, 'Valor é obrigatório'
+    if not email:
+        return None, 'Email é obrigatório'
+    if not nome:
+        return None, 'Nome é obrigatório'
+    if not cpf:
+        return None, 'CPF é obrigatório'
+    if not isinstance(cpf, str):
+        return None, 'CPF inválido'
+    try:
+        valor_numerico = float(valor)
+    except (TypeError, ValueError):
+        return None, 'Valor inválido'
+    # float() aceita 'nan' e 'inf', que não viram centavos
+    if not math.isfinite(valor_numerico) or valor_numerico <= 0:
+        return None, 'Valor inválido'
+
+    # Dados do endereço
+    endereco = data.get('endereco') or {}
+    if not isinstance(endereco, dict):
+        return None, 'Endereço inválido'
+    cep = endereco.get('cep', '00000000')
+    if not isinstance(cep, str):
+        return None, 'CEP inválido'
+    metadata = data.get('metadata') or {}
+    if not isinstance(metadata, dict):
+        return None, 'Metadata inválido'
+
+    return {
+        'valor': valor,
+        'email': email,
+        'nome': nome,
+        'cpf_limpo': cpf.replace('.', '').replace('-', ''),  # Remove pontos e traços
+        'descricao': data.get('descricao', 'Pagamento via Boleto'),
+        'metadata': metadata,
+        'rua': endereco.get('rua', 'Rua não informada'),
+        'numero': endereco.get('numero', 'S/N'),
+        'complemento': endereco.get('complemento', ''),
+        'cidade': endereco.get('cidade', 'Cidade não informada'),
+        'estado': endereco.get('estado', 'Estado não informado'),
+        'cep_limpo': cep.replace('-', '')  # Remove o traço
+    }, None
+
+
+def chave_idempotencia(dados, chave=None):
+    """A chave informada pelo cliente ou, sem ela, uma nova a cada requisição.
+
+    Só a chave do cliente deduplica: dois boletos do mesmo CPF, valor e
+    metadata sem chave são cobranças diferentes. A chave gerada ainda vai ao
+    Stripe, que a usa nas retentativas de rede da mesma chamada.
+    """
+    return chave or PREFIXO_CHAVE_GERADA + uuid.uuid4().hex
+
+
+def parametros_boleto(dados):
+    """Parâmetros do PaymentIntent de um boleto já validado."""
+    return {
+        'amount': int(float(dados['valor']) * 100),  # Valor em centavos
+        'currency': 'brl',
+        'payment_method_types': ['boleto'],
+        'payment_method_data': {
+            'type': 'boleto',
+            'boleto': {
+                'tax_id': dados['cpf_limpo']
+            },
+            'billing_details': {
+                'name': dados['nome'],
+                'email': dados['email'],
+                'address': {
+                    'line1': f"{dados['rua']}, {dados['numero']}",
+                    'line2': dados['complemento'],
+                    'city': dados['cidade'],
+                    'state': dados['estado'],
+                    'postal_code': dados['cep_limpo'],
+                    'country': 'BR'
+                }
+            }
+        },
+        'description': dados['descricao'],
+        'metadata': dados['metadata'],  # Adiciona o metadata ao PaymentIntent
+        'confirm': True
+    }
+
+
+def resposta_boleto(payment_intent, dados, conta):
+    # Obtém os detalhes do boleto corretamente
+    boleto_display = payment_intent.next_action['boleto_display_details']
+
+    return {
+        'boleto_id': payment_intent.id,
+        'codigo_barras': boleto_display.get('number'),
+        'linha_digitavel': boleto_display.get('line'),
+        'pdf_url': boleto_display.get('hosted_voucher_url'),
+        'valor': dados['valor'],
+        'data_vencimento': (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d'),
+        'status': payment_intent.status,
+        'public_key': conta.public_key,
+        'metadata': payment_intent.metadata,  # Inclui o metadata na resposta
+        'instrucoes': INSTRUCOES
+    }
+
+
+def status_boleto(payment_intent, conta):
+    """Resposta do /verificar-boleto a partir do PaymentIntent com charges expandido."""
+    if logger.isEnabledFor(logging.DEBUG) and hasattr(payment_intent, 'charges'):
+        logger.debug("Charges do PaymentIntent %s", payment_intent.id, extra={
+            'charges': [{'id': charge.id, 'status': charge.status} for charge in payment_intent.charges.data]
+        })
+
+    # Obtém os detalhes do boleto
+    charge = payment_intent.charges.data[0] if hasattr(payment_intent, 'charges') and payment_intent.charges.data else None
+    boleto_details = charge.payment_method_details.boleto if charge and hasattr(charge, 'payment_method_details') else None
+
+    # Verifica se o boleto realmente foi pago
+    is_paid = False
+    if charge:
+        is_paid = charge.status == 'succeeded'
+
+    return {
+        'status': 'succeeded' if is_paid else 'requires_action',
+        'valor': payment_intent.amount / 100,  # Converte de centavos para reais
+        'email': payment_intent.receipt_email,
+        'data_criacao': datetime.fromtimestamp(payment_intent.created).strftime('%Y-%m-%d %H:%M:%S'),
+        'data_aprovacao': datetime.fromtimestamp(charge.created).strftime('%Y-%m-%d %H:%M:%S') if charge and is_paid else None,
+        'public_key': conta.public_key,
+        'boleto': {
+            'codigo_barras': boleto_details.barcode if boleto_details else None,
+            'linha_digitavel': boleto_details.line if boleto_details else None,
+            'pdf_url': boleto_details.hosted_voucher_url if boleto_details else None
+        } if boleto_details else None,
+        'debug_info': {
+            'payment_intent_status': payment_intent.status,
+            'has_charges': hasattr(payment_intent, 'charges'),
+            'charge_status': charge.status if charge else None,
+            'is_paid': is_paid
+        }
+    }
+
+
+def obter_status(boleto_id, conta):
+    """Status do boleto pelo cache (atualizado pelos webhooks) ou, se ausente, pelo Stripe da conta."""
+    response_data = status_cache.get(conta.chave_cache(boleto_id))
+    if response_data is not None:
+        logger.debug("Status do boleto %s obtido do cache: %s", boleto_id, response_data['status'])
+        return response_data
+    return consultas_status.executar((conta.nome, boleto_id), lambda: _consultar_status(boleto_id, conta))
+
+
+def _consultar_status(boleto_id, conta):
+    # Busca o PaymentIntent com expansão do campo charges
+    payment_intent = conta.cliente.payment_intents.retrieve(
+        boleto_id,
+        params={'expand': ['charges']}
+    )
+    response_data = status_boleto(payment_intent, conta)
+    status_cache.set(conta.chave_cache(boleto_id), response_data)
+
+    logger.info("Boleto %s verificado no Stripe: %s", boleto_id, response_data['status'])
+    return response_data
+
+
+def status_obsoleto(boleto_id, conta, erro):
+    """Último status conhecido do boleto quando o Stripe está fora; repassa o erro se não houver."""
+    response_data = status_cache.obsoleto(conta.chave_cache(boleto_id))
+    if response_data is None:
+        raise erro
+    logger.warning("Stripe indisponível (%s): status obsoleto do boleto %s", type(erro).__name__, boleto_id)
+    return response_data
+
+
+def obter_status_ou_obsoleto(boleto_id, conta):
+    """(status, obsoleto): com o Stripe fora usa o último status conhecido em vez de falhar."""
+    try:
+        return obter_status(boleto_id, conta), False
+    except STRIPE_INDISPONIVEL as e:
+        return status_obsoleto(boleto_id, conta, e), True
+
+
+def criar_boleto(chave, dados, conta):
+    logger.debug("Criando pagamento", extra={'metadata': dados['metadata']})
+
+    # Cria o pagamento do boleto
+    payment_intent = conta.cliente.payment_intents.create(params=parametros_boleto(dados), options={
+        'idempotency_key': chave  # Repetições com a mesma chave devolvem o mesmo PaymentIntent
+    })
+    logger.info("Pagamento criado: %s", payment_intent.id)
+    registrar_no_ledger(payment_intent, dados, chave, conta)
+    return resposta_boleto(payment_intent, dados, conta)
+
+
+def registrar_no_ledger(payment_intent, dados, chave, conta):
+    # O boleto já existe no Stripe: uma falha aqui não pode virar erro para o cliente,
+    # e o primeiro webhook do PaymentIntent cria a linha que faltar
+    if ledger is None:
+        return
+    try:
+        ledger.registrar(payment_intent, dados, chave, conta.nome)
+    except Exception as e:
+        logger.warning("Falha ao registrar boleto %s no ledger: %s", payment_intent.id, str(e))
+
+
+async def criar_boleto_async(chave, dados, conta):
+    """criar_boleto pelo cliente assíncrono do Stripe (modo ASGI)."""
+    logger.debug("Criando pagamento", extra={'metadata': dados['metadata']})
+    payment_intent = await conta.stripe_async.criar_payment_intent(parametros_boleto(dados), idempotency_key=chave)
+    logger.info("Pagamento criado: %s", payment_intent.id)
+    # O ledger grava em SQLite: fora do event loop
+    await asyncio.to_thread(registrar_no_ledger, payment_intent, dados, chave, conta)
+    return resposta_boleto(payment_intent, dados, conta)
+
+
+def _lock_da_chave(locks, chave_cache):
+    return locks[hash(chave_cache) % len(locks)]
+
+
+def _boleto_reaproveitado(chave_cache):
+    response_data = boletos_gerados.get(chave_cache)
+    if response_data is not None:
+        logger.info("Boleto %s reaproveitado pela chave de idempotência", response_data['boleto_id'])
+    return response_data
+
+
+def gerar_boleto_idempotente(chave, dados, conta):
+    """Retorna (resposta, reaproveitado); só chama o Stripe se a chave ainda não foi usada na conta."""
+    if chave.startswith(PREFIXO_CHAVE_GERADA):
+        return criar_boleto(chave, dados, conta), False
+    chave_cache = conta.chave_cache(chave)
+    with _lock_da_chave(_locks_geracao, chave_cache):
+        response_data = _boleto_reaproveitado(chave_cache)
+        if response_data is not None:
+            return response_data, True
+
+        response_data = criar_boleto(chave, dados, conta)
+        boletos_gerados.set(chave_cache, response_data)
+        return response_data, False
+
+
+async def gerar_boleto_idempotente_async(chave, dados, conta):
+    """gerar_boleto_idempotente para o modo ASGI: mesmo cache de respostas, sem ocupar uma thread."""
+    if chave.startswith(PREFIXO_CHAVE_GERADA):
+        return await criar_boleto_async(chave, dados, conta), False
+    chave_cache = conta.chave_cache(chave)
+    async with _lock_da_chave(_locks_geracao_async, chave_cache):
+        response_data = _boleto_reaproveitado(chave_cache)
+        if response_data is not None:
+            return response_data, True
+
+        response_data = await criar_boleto_async(chave, dados, conta)
+        boletos_gerados.set(chave_cache, response_data)
+        return response_data, False
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+from services.metricas import registro
+
+chamadas_coalescidas = registro.contador(
+    'chamadas_coalescidas_total', 'Chamadas que aproveitaram outra idêntica já em andamento, por operação'
+)
+
+
+class _Chamada:
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class ChamadaUnica:
+    """Single-flight entre threads: chamadas simultâneas com a mesma chave executam uma vez só.
+
+    A primeira executa `funcao()`; as que chegam enquanto ela está em andamento
+    esperam e recebem o mesmo resultado (ou a mesma exceção). Depois que ela
+    termina, a próxima chamada com a chave executa de novo.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+
+    def executar(self, chave, funcao):
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _Chamada()
+
+        if not lider:
+            chamadas_coalescidas.incrementar(operacao=self.nome)
+            chamada.concluida.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = funcao()
+            return chamada.resultado
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada.concluida.set()
+
+
+class ChamadaUnicaAsync:
+    """O mesmo que ChamadaUnica para corrotinas de um event loop.
+
+    A chamada compartilhada roda numa task própria: quem desiste de esperar
+    (cliente desconectado) não a cancela para os demais.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._em_andamento = {}
+
+    async def executar(self, chave, fabrica):
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(fabrica())
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda concluida: self._concluir(chave, concluida))
+        else:
+            chamadas_coalescidas.incrementar(operacao=self.nome)
+        return await asyncio.shield(tarefa)
+
+    def _concluir(self, chave, tarefa):
+        self._em_andamento.pop(chave, None)
+        # Marca a exceção como lida mesmo que todos tenham desistido de esperar
+        if not tarefa.cancelled():
+            tarefa.exception()
@@ -0,0 +1,191 @@
+import os
+import re
+import threading
+
+import stripe
+
+from config import (
+    STRIPE_SECRET_KEY, STRIPE_PUBLIC_KEY, STRIPE_WEBHOOK_SECRET_MENSAL, STRIPE_WEBHOOK_SECRET_PERSONALIZADO,
+    STRIPE_WEBHOOK_SECRET_OPENCODE, STRIPE_CONTAS, DISJUNTOR_FALHAS, DISJUNTOR_TEMPO_ABERTO,
+    STRIPE_TAXA, STRIPE_TAXA_RAJADA, STRIPE_TAXA_ESPERA_MAX, STRIPE_TAXA_PATH
+)
+from services import assinatura
+from services.disjuntor import Disjuntor
+from services.limite import LimiteTaxaCompartilhado
+from services.metricas import registro
+from services.stripe_async import StripeAsync
+from services.stripe_client import criar_cliente
+
+CONTA_PADRAO = 'padrao'
+
+# Onde a requisição diz a conta: header, ou a chave "conta" do metadata do boleto
+CONTA_HEADER = 'X-Stripe-Conta'
+CONTA_METADATA = 'conta'
+
+# Eventos do Connect trazem a conta conectada no corpo
+ACCOUNT_REGEX = re.compile(rb'"account"\s*:\s*"(acct_[A-Za-z0-9]+)"')
+
+
+class ContaDesconhecida(ValueError):
+    def __init__(self, nome):
+        super().__init__(f'Conta Stripe desconhecida: {nome}')
+        self.nome = nome
+
+
+class ContaStripe:
+    """Uma conta Stripe isolada das demais.
+
+    Chaves, segredos de webhook, pool de conexões (síncrono e assíncrono),
+    disjuntor e limite de taxa são da conta: uma conta fora do ar ou no limite
+    de requisições do Stripe não afeta as outras. Nada é gravado no estado
+    global da biblioteca do Stripe (`stripe.api_key`), então contas diferentes
+    atendem requisições ao mesmo tempo no mesmo processo.
+    """
+
+    def __init__(self, nome, secret_key, public_key=None, account=None, webhooks=None):
+        self.nome = nome
+        self.secret_key = secret_key
+        self.public_key = public_key
+        self.account = account
+        # endpoint (mensalidade, software_personalizado, opencode) -> segredo de assinatura
+        self.webhooks = {endpoint: segredo for endpoint, segredo in (webhooks or {}).items() if segredo}
+        # A conta padrão mantém o nome 'stripe' nas métricas e no /prontidao
+        self.disjuntor = Disjuntor(
+            'stripe' if nome == CONTA_PADRAO else f'stripe:{nome}',
+            limite_falhas=DISJUNTOR_FALHAS, tempo_aberto=DISJUNTOR_TEMPO_ABERTO
+        )
+        # O limite de requisições do Stripe é por conta: um balde para todos os workers e rotas
+        self.taxa = LimiteTaxaCompartilhado(
+            STRIPE_TAXA_PATH, nome, STRIPE_TAXA, STRIPE_TAXA_RAJADA, STRIPE_TAXA_ESPERA_MAX, nome=self.disjuntor.nome
+        ) if STRIPE_TAXA > 0 else None
+        self.stripe_async = StripeAsync(secret_key, self.disjuntor, nome, stripe_account=account, taxa=self.taxa)
+        self._cliente = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def cliente(self):
+        """StripeClient da conta, com uma sessão keep-alive própria.
+
+        Criado no primeiro uso e recriado em processos filhos (conexões não
+        podem ser herdadas por fork).
+        """
+        if self._cliente is None or self._pid != os.getpid():
+            with self._lock:
+                if self._cliente is None or self._pid != os.getpid():
+                    self._cliente = criar_cliente(
+                        self.secret_key, self.disjuntor, self.nome, self.account, taxa=self.taxa
+                    )
+                    self._pid = os.getpid()
+        return self._cliente
+
+    def construir_evento(self, dados):
+        """stripe.Event de um webhook já verificado, ligado às chaves da conta."""
+        evento = stripe.Event.construct_from(dados, self.secret_key, stripe_account=self.account)
+        # Atributo com "_" não vira campo do evento: os handlers o leem por conta_do_evento()
+        evento._conta = self
+        return evento
+
+    def chave_cache(self, chave):
+        """Chave nos caches e no hub de status: ids e chaves derivadas dos dados do boleto não são únicos entre contas."""
+        return chave if self.nome == CONTA_PADRAO else f'{self.nome}:{chave}'
+
+
+class ContasStripe:
+    """Contas configuradas, por nome, e a escolha da conta de cada requisição ou webhook."""
+
+    def __init__(self, contas):
+        self._contas = {conta.nome: conta for conta in contas}
+        self.padrao = self._contas[CONTA_PADRAO]
+        # endpoint -> {segredo: [contas]}; contas conectadas podem dividir o segredo da plataforma
+        self._segredos = {}
+        for conta in contas:
+            for endpoint, segredo in conta.webhooks.items():
+                self._segredos.setdefault(endpoint, {}).setdefault(segredo, []).append(conta)
+
+    def __iter__(self):
+        return iter(self._contas.values())
+
+    def obter(self, nome=None):
+        """Conta pelo nome; sem nome, a padrão. Levanta ContaDesconhecida."""
+        if not nome:
+            return self.padrao
+        conta = self._contas.get(nome.strip().lower())
+        if conta is None:
+            raise ContaDesconhecida(nome)
+        return conta
+
+    def da_requisicao(self, headers, metadata=None):
+        """Conta pedida no header X-Stripe-Conta ou, sem ele, no metadata do boleto."""
+        # Minúsculo: serve para os headers do Flask e para o dict do modo ASGI
+        nome = headers.get(CONTA_HEADER.lower())
+        if not nome and isinstance(metadata, dict):
+            nome = metadata.get(CONTA_METADATA)
+        return self.obter(nome if isinstance(nome, str) else None)
+
+    def segredos_webhook(self, endpoint):
+        return self._segredos.get(endpoint, {})
+
+    def conta_do_webhook(self, endpoint, payload, cabecalho, header=''):
+        """Conta cujo segredo confere com a assinatura do corpo; levanta SignatureVerificationError."""
+        erro = None
+        for segredo, contas in self.segredos_webhook(endpoint).items():
+            try:
+                assinatura.verificar_corpo(payload, cabecalho, segredo, header)
+            except stripe.error.SignatureVerificationError as e:
+                erro = e
+                continue
+            return self._desempatar(contas, payload)
+        raise erro or stripe.error.SignatureVerificationError('Webhook não configurado', header)
+
+    @staticmethod
+    def _desempatar(contas, payload):
+        if len(contas) == 1:
+            return contas[0]
+        # Mesmo segredo em várias contas (Connect): vale a conta conectada do evento,
+        # e eventos da própria plataforma ficam com a conta sem `account`
+        conectadas = set(ACCOUNT_REGEX.findall(payload))
+        for conta in contas:
+            if conta.account and conta.account.encode('ascii') in conectadas:
+                return conta
+        return next((conta for conta in contas if not conta.account), contas[0])
+
+
+def _criar_contas():
+    contas = [ContaStripe(CONTA_PADRAO, STRIPE_SECRET_KEY, STRIPE_PUBLIC_KEY, webhooks={
+        'mensalidade': STRIPE_WEBHOOK_SECRET_MENSAL,
+        'software_personalizado': STRIPE_WEBHOOK_SECRET_PERSONALIZADO,
+        'opencode': STRIPE_WEBHOOK_SECRET_OPENCODE,
+    })]
+    for nome, dados in STRIPE_CONTAS.items():
+        if nome == CONTA_PADRAO:
+            continue
+        # Contas conectadas usam as chaves da plataforma, com o header Stripe-Account
+        plataforma = bool(dados['account'])
+        contas.append(ContaStripe(
+            nome,
+            dados['secret_key'] or (STRIPE_SECRET_KEY if plataforma else None),
+            dados['public_key'] or (STRIPE_PUBLIC_KEY if plataforma else None),
+            account=dados['account'],
+            webhooks=dados['webhooks']
+        ))
+    return ContasStripe(contas)
+
+
+contas = _criar_contas()
+
+registro.medidor(
+    'stripe_taxa_folga',
+    'Fração do limite de requisições ao Stripe livre agora, por conta (1 = balde cheio; negativa = fila de espera)',
+    lambda: {(('conta', conta.nome),): conta.taxa.disponivel() / conta.taxa.rajada for conta in contas if conta.taxa}
+)
+
+
+def conta_do_evento(event):
+    """Conta cujo segredo verificou o webhook do evento; a padrão para eventos montados de outro jeito."""
+    return getattr(event, '_conta', None) or contas.padrao
+
+
+def get_stripe(conta=None):
+    """StripeClient da conta (por nome); sem conta, o da conta padrão."""
+    return contas.obter(conta).cliente
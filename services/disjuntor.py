@@ -0,0 +1,114 @@
+import logging
+import math
+import threading
+import time
+
+from services.metricas import registro
+
+logger = logging.getLogger(__name__)
+
+FECHADO = 'fechado'
+MEIO_ABERTO = 'meio_aberto'
+ABERTO = 'aberto'
+
+# Valor do medidor por estado
+_VALOR_ESTADO = {FECHADO: 0, MEIO_ABERTO: 1, ABERTO: 2}
+
+_disjuntores = []
+
+rejeicoes_disjuntor = registro.contador(
+    'disjuntor_rejeicoes_total', 'Chamadas recusadas na hora por disjuntor aberto, por dependência'
+)
+registro.medidor(
+    'disjuntor_estado', 'Estado do disjuntor por dependência (0 fechado, 1 meio-aberto, 2 aberto)',
+    lambda: {(('dependencia', d.nome),): _VALOR_ESTADO[d.estado] for d in _disjuntores}
+)
+
+
+class CircuitoAberto(Exception):
+    """A dependência está fora: a chamada foi recusada sem ser feita."""
+
+    def __init__(self, dependencia, retry_after):
+        super().__init__(f'{dependencia} indisponível (disjuntor aberto)')
+        self.dependencia = dependencia
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class Disjuntor:
+    """Circuit breaker de uma dependência externa. Seguro para uso entre threads.
+
+    Abre depois de `limite_falhas` falhas seguidas e passa a recusar as chamadas
+    com CircuitoAberto. Passados `tempo_aberto` segundos fica meio-aberto: até
+    `max_sondas` chamadas de teste passam; um sucesso fecha o disjuntor e uma
+    falha o abre de novo.
+
+    Uso: `sonda = disjuntor.admitir()` antes da chamada e
+    `disjuntor.concluir(sonda, falhou)` depois, com falhou=None quando o
+    resultado não diz nada sobre a dependência (chamada cancelada).
+    """
+
+    def __init__(self, nome, limite_falhas=5, tempo_aberto=30, max_sondas=1):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.max_sondas = max_sondas
+        self._estado = FECHADO
+        self._falhas = 0
+        self._aberto_em = 0.0
+        self._sondas = 0
+        self._lock = threading.Lock()
+        _disjuntores.append(self)
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._atualizar(time.monotonic())
+
+    def _atualizar(self, agora):
+        if self._estado == ABERTO and agora - self._aberto_em >= self.tempo_aberto:
+            self._estado = MEIO_ABERTO
+            self._sondas = 0
+        return self._estado
+
+    def admitir(self):
+        """Retorna True se a chamada é uma sonda do estado meio-aberto; levanta CircuitoAberto se recusada."""
+        with self._lock:
+            agora = time.monotonic()
+            estado = self._atualizar(agora)
+            if estado == FECHADO:
+                return False
+            if estado == MEIO_ABERTO and self._sondas < self.max_sondas:
+                self._sondas += 1
+                return True
+            retry_after = max(self.tempo_aberto - (agora - self._aberto_em), 0)
+        rejeicoes_disjuntor.incrementar(dependencia=self.nome)
+        raise CircuitoAberto(self.nome, retry_after)
+
+    def concluir(self, sonda, falhou):
+        with self._lock:
+            if sonda:
+                self._sondas -= 1
+            if falhou is None:
+                return
+            if not falhou:
+                if self._estado == MEIO_ABERTO and sonda:
+                    logger.info("Disjuntor %s fechado: dependência respondeu", self.nome)
+                    self._estado = FECHADO
+                if self._estado == FECHADO:
+                    self._falhas = 0
+                return
+
+            self._falhas += 1
+            if (self._estado == MEIO_ABERTO and sonda) or (
+                self._estado == FECHADO and self._falhas >= self.limite_falhas
+            ):
+                logger.warning(
+                    "Disjuntor %s aberto por %ss depois de %d falha(s)", self.nome, self.tempo_aberto, self._falhas
+                )
+                self._estado = ABERTO
+                self._aberto_em = time.monotonic()
+                self._falhas = 0
@@ -0,0 +1,130 @@
+from google.api_core.exceptions import NotFound
+
+from config import FATURAS_MODO
+from services.firebase import ler_em_lote, medir_firestore, paginar
+
+# Campo do documento do cliente que indica que as faturas já estão na subcoleção
+CAMPO_MIGRADO = 'faturasMigradas'
+
+FATURA_ATUALIZADA = 'atualizada'
+CLIENTE_NAO_ENCONTRADO = 'cliente_nao_encontrado'
+FATURA_NAO_ENCONTRADA = 'fatura_nao_encontrada'
+FATURA_JA_PAGA = 'ja_paga'
+
+
+def faturas_ref(db, cliente_id):
+    return db.collection('clientes').document(cliente_id).collection('faturas')
+
+
+def faturas_migradas(cliente_data):
+    """Diz se as faturas do cliente já estão na subcoleção (e o array é só histórico)."""
+    return bool((cliente_data or {}).get(CAMPO_MIGRADO))
+
+
+def listar_faturas(db, cliente_id, cliente_data=None, pagina=None):
+    """Faturas do cliente, venham da subcoleção (clientes migrados) ou do array legado.
+
+    Todo leitor de faturas passa por aqui, então a migração não muda o que
+    eles veem. Com `pagina`, a subcoleção é lida em páginas desse tamanho;
+    a leitura é preguiçosa. Retorna None se o cliente não existir.
+    """
+    if cliente_data is None:
+        cliente_doc = db.collection('clientes').document(cliente_id).get()
+        if not cliente_doc.exists:
+            return None
+        cliente_data = cliente_doc.to_dict()
+
+    if not faturas_migradas(cliente_data):
+        return list(cliente_data.get('faturas', []))
+    if pagina:
+        docs = (doc for docs in paginar(faturas_ref(db, cliente_id), pagina) for doc in docs)
+    else:
+        docs = faturas_ref(db, cliente_id).stream()
+    return ({'id': doc.id, **(doc.to_dict() or {})} for doc in docs)
+
+
+def ler_faturas_migradas(db, clientes, pares):
+    """Lê em lote (get_all) as faturas da subcoleção dos pares (cliente_id, fatura_id).
+
+    `clientes` mapeia cliente_id -> snapshot do cliente já lido; pares de
+    clientes não migrados ficam de fora (a fatura deles está no array).
+    Retorna {(cliente_id, fatura_id): snapshot da fatura ou None}.
+    """
+    refs = {
+        (cliente_id, fatura_id): faturas_ref(db, cliente_id).document(fatura_id)
+        for cliente_id, fatura_id in pares
+        if clientes.get(cliente_id) is not None and clientes[cliente_id].exists
+        and faturas_migradas(clientes[cliente_id].to_dict())
+    }
+    snapshots = ler_em_lote(db, list(refs.values()))
+    return {
+        par: snapshot if snapshot is not None and snapshot.exists else None
+        for par, snapshot in ((par, snapshots.get(ref.path)) for par, ref in refs.items())
+    }
+
+
+def _atualizar_na_subcolecao(db, cliente_id, fatura_id, dados, se_pendente=False):
+    ref = faturas_ref(db, cliente_id).document(fatura_id)
+    if not se_pendente:
+        ref.update(dados)
+        return FATURA_ATUALIZADA
+    fatura_doc = ref.get()
+    if not fatura_doc.exists:
+        raise NotFound(f'Fatura {fatura_id} não encontrada')
+    if (fatura_doc.to_dict() or {}).get('status') == 'pago':
+        return FATURA_JA_PAGA
+    # Só grava se a fatura não mudou (um webhook pode tê-la pago) desde a leitura
+    ref.update(dados, option=db.write_option(last_update_time=fatura_doc.update_time))
+    return FATURA_ATUALIZADA
+
+
+def _atualizar_no_array(db, cliente_id, fatura_id, dados, se_pendente=False):
+    cliente_ref = db.collection('clientes').document(cliente_id)
+    cliente_doc = cliente_ref.get()
+
+    if not cliente_doc.exists:
+        return CLIENTE_NAO_ENCONTRADO
+
+    cliente_data = cliente_doc.to_dict()
+    if faturas_migradas(cliente_data):
+        # Migrado depois da primeira tentativa: a subcoleção é a fonte da verdade
+        try:
+            return _atualizar_na_subcolecao(db, cliente_id, fatura_id, dados, se_pendente)
+        except NotFound:
+            return FATURA_NAO_ENCONTRADA
+
+    faturas = cliente_data.get('faturas', [])
+
+    # Encontrar e atualizar a fatura específica
+    for fatura in faturas:
+        if fatura.get('id') == fatura_id:
+            if se_pendente and fatura.get('status') == 'pago':
+                return FATURA_JA_PAGA
+            fatura.update(dados)
+            break
+    else:
+        return FATURA_NAO_ENCONTRADA
+
+    # Só grava se ninguém alterou o documento desde a leitura
+    cliente_ref.update(
+        {'faturas': faturas},
+        option=db.write_option(last_update_time=cliente_doc.update_time)
+    )
+    return FATURA_ATUALIZADA
+
+
+@medir_firestore('atualizar_fatura')
+def atualizar_fatura(db, cliente_id, fatura_id, dados, se_pendente=False):
+    """Aplica os campos em uma fatura do cliente.
+
+    No modo 'subcolecao' é uma única escrita em clientes/{id}/faturas/{fatura_id};
+    clientes ainda não migrados caem no array legado. Com `se_pendente`, uma
+    fatura já paga não é alterada (FATURA_JA_PAGA): a escrita só vale se a
+    fatura não mudou desde a leitura.
+    """
+    if FATURAS_MODO == 'subcolecao':
+        try:
+            return _atualizar_na_subcolecao(db, cliente_id, fatura_id, dados, se_pendente)
+        except NotFound:
+            pass
+    return _atualizar_no_array(db, cliente_id, fatura_id, dados, se_pendente)
@@ -0,0 +1,303 @@
+"""Exportação e importação em lote das faturas de mensalidade.
+
+Uso:
+    python -m services.faturas_lote exportar [--formato csv|ndjson] [--cliente ID] [--saida faturas.csv]
+    python -m services.faturas_lote importar retorno.csv [--lote 500] [--dry-run]
+
+A exportação lê os clientes em páginas (e as subcoleções dos clientes
+migrados) e escreve uma fatura por linha, sem juntar tudo em memória.
+
+A importação recebe confirmações de pagamento feitas fora do Stripe (arquivo de
+retorno do banco, por exemplo), uma por linha, com as colunas cliente_id,
+fatura_id, valor_pago e data_pagamento (DD/MM/AAAA ou AAAA-MM-DD), mais
+`referencia` opcional. As linhas são lidas em blocos: clientes e faturas de cada
+bloco são lidos com get_all e as baixas gravadas em batches de até 500
+escritas, com todas as faturas de um mesmo cliente (array legado) numa escrita
+só. Faturas já pagas são puladas, então o mesmo arquivo pode ser reimportado.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+from datetime import datetime
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+
+from services.faturas import (
+    FATURA_ATUALIZADA, CLIENTE_NAO_ENCONTRADO, FATURA_NAO_ENCONTRADA, FATURA_JA_PAGA,
+    atualizar_fatura, ler_faturas_migradas, listar_faturas
+)
+from services.firebase import ler_em_lote, paginar
+
+MAX_ESCRITAS_BATCH = 500
+PAGINA_CLIENTES = 200
+
+COLUNAS_CSV = (
+    'cliente_id', 'fatura_id', 'status', 'valor', 'dataVencimento', 'dataPagamento',
+    'paymentIntentId', 'valorPago', 'referenciaPagamento'
+)
+
+APLICADA = 'aplicada'
+INVALIDA = 'invalida'
+FALHOU = 'falhou'
+
+
+def exportar(db, cliente_id=None, pagina=PAGINA_CLIENTES):
+    """Uma fatura por item: {'cliente_id', 'fatura_id', ...campos da fatura}."""
+    clientes = db.collection('clientes')
+    if cliente_id:
+        doc = clientes.document(cliente_id).get()
+        paginas = [[doc]] if doc.exists else []
+    else:
+        paginas = paginar(clientes, pagina)
+
+    for docs in paginas:
+        for cliente_doc in docs:
+            faturas = listar_faturas(db, cliente_doc.id, cliente_doc.to_dict() or {}, pagina=pagina)
+            for fatura in faturas:
+                campos = {chave: valor for chave, valor in fatura.items() if chave != 'id'}
+                yield {'cliente_id': cliente_doc.id, 'fatura_id': fatura.get('id'), **campos}
+
+
+def formatar_ndjson(faturas):
+    for fatura in faturas:
+        yield json.dumps(fatura, ensure_ascii=False, default=str) + '\n'
+
+
+def formatar_csv(faturas, colunas=COLUNAS_CSV):
+    """Linhas CSV com cabeçalho; campos fora de `colunas` ficam de fora."""
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=colunas, extrasaction='ignore')
+    escritor.writeheader()
+    for fatura in faturas:
+        escritor.writerow(fatura)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Sem faturas ainda sai o cabeçalho
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def ler_linhas(arquivo, formato):
+    """Confirmações de pagamento de um arquivo texto aberto, uma por vez."""
+    if formato == 'csv':
+        yield from csv.DictReader(arquivo)
+        return
+    for linha in arquivo:
+        if not linha.strip():
+            continue
+        try:
+            yield json.loads(linha)
+        except ValueError:
+            # Vira um resultado `invalida` sem interromper o resto do arquivo
+            yield None
+
+
+def _data_pagamento(valor):
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(valor.strip(), formato).strftime('%d/%m/%Y')
+        except ValueError:
+            continue
+    raise ValueError(f'data_pagamento inválida: {valor}')
+
+
+def validar_linha(linha):
+    """(cliente_id, fatura_id, dados da baixa) de uma confirmação; ValueError se inválida."""
+    if not isinstance(linha, dict):
+        raise ValueError('Linha inválida')
+    cliente_id = str(linha.get('cliente_id') or '').strip()
+    fatura_id = str(linha.get('fatura_id') or '').strip()
+    if not cliente_id or not fatura_id:
+        raise ValueError('cliente_id e fatura_id são obrigatórios')
+    try:
+        valor_pago = float(str(linha.get('valor_pago')).replace(',', '.'))
+    except (TypeError, ValueError):
+        valor_pago = None
+    # float() aceita 'nan' e 'inf'; como no validar_boleto, só valores finitos e positivos
+    if valor_pago is None or not math.isfinite(valor_pago) or valor_pago <= 0:
+        raise ValueError(f"valor_pago inválido: {linha.get('valor_pago')}")
+
+    dados = {
+        'status': 'pago',
+        'dataPagamento': _data_pagamento(str(linha.get('data_pagamento') or '')),
+        'valorPago': valor_pago,
+        'origemPagamento': 'importacao'
+    }
+    if linha.get('referencia'):
+        dados['referenciaPagamento'] = str(linha['referencia'])
+    return cliente_id, fatura_id, dados
+
+
+def importar(db, linhas, lote=MAX_ESCRITAS_BATCH, dry_run=False):
+    """Aplica as confirmações em blocos de `lote` linhas; gera um resultado por linha, na ordem."""
+    bloco = []
+    for indice, linha in enumerate(linhas):
+        bloco.append((indice, linha))
+        if len(bloco) >= lote:
+            yield from _importar_bloco(db, bloco, dry_run)
+            bloco = []
+    if bloco:
+        yield from _importar_bloco(db, bloco, dry_run)
+
+
+def _importar_bloco(db, bloco, dry_run):
+    resultados = {}
+    validas = []
+    for indice, linha in bloco:
+        try:
+            cliente_id, fatura_id, dados = validar_linha(linha)
+        except ValueError as e:
+            resultados[indice] = {'indice': indice, 'resultado': INVALIDA, 'erro': str(e)}
+            continue
+        validas.append((indice, cliente_id, fatura_id, dados))
+
+    clientes = db.collection('clientes')
+    docs = ler_em_lote(db, [clientes.document(cliente_id) for _, cliente_id, _, _ in validas])
+
+    def cliente_doc(cliente_id):
+        doc = docs.get(clientes.document(cliente_id).path)
+        return doc if doc is not None and doc.exists else None
+
+    migradas = ler_faturas_migradas(db, {cliente_id: cliente_doc(cliente_id) for _, cliente_id, _, _ in validas},
+                                    [(cliente_id, fatura_id) for _, cliente_id, fatura_id, _ in validas])
+
+    # (ref, dados, option, itens): uma escrita do batch e as linhas que ela aplica
+    escritas = []
+    arrays = {}
+    for indice, cliente_id, fatura_id, dados in validas:
+        base = {'indice': indice, 'cliente_id': cliente_id, 'fatura_id': fatura_id}
+        doc = cliente_doc(cliente_id)
+        if doc is None:
+            resultados[indice] = {**base, 'resultado': CLIENTE_NAO_ENCONTRADO}
+            continue
+        item = (indice, cliente_id, fatura_id, dados)
+
+        if (cliente_id, fatura_id) in migradas:
+            fatura = migradas[(cliente_id, fatura_id)]
+            if fatura is None:
+                resultados[indice] = {**base, 'resultado': FATURA_NAO_ENCONTRADA}
+            elif (fatura.to_dict() or {}).get('status') == 'pago':
+                resultados[indice] = {**base, 'resultado': FATURA_JA_PAGA}
+            else:
+                # Precondição: um webhook que pague a fatura depois da leitura faz o batch cair no refazer
+                escritas.append((fatura.reference, dados, db.write_option(last_update_time=fatura.update_time),
+                                 [item]))
+            continue
+
+        # Array legado: todas as faturas do cliente no bloco viram uma escrita com precondição
+        if cliente_id not in arrays:
+            arrays[cliente_id] = ([dict(f) for f in (doc.to_dict() or {}).get('faturas', [])], [])
+            escritas.append((doc.reference, None, db.write_option(last_update_time=doc.update_time),
+                             arrays[cliente_id][1]))
+        faturas, itens = arrays[cliente_id]
+        fatura = next((f for f in faturas if f.get('id') == fatura_id), None)
+        if fatura is None:
+            resultados[indice] = {**base, 'resultado': FATURA_NAO_ENCONTRADA}
+        elif fatura.get('status') == 'pago':
+            resultados[indice] = {**base, 'resultado': FATURA_JA_PAGA}
+        else:
+            fatura.update(dados)
+            itens.append(item)
+
+    escritas = [
+        (ref, dados if dados is not None else {'faturas': arrays[ref.id][0]}, option, itens)
+        for ref, dados, option, itens in escritas if itens
+    ]
+    for inicio in range(0, len(escritas), MAX_ESCRITAS_BATCH):
+        _gravar(db, escritas[inicio:inicio + MAX_ESCRITAS_BATCH], resultados, dry_run)
+
+    for indice, _ in bloco:
+        yield resultados[indice]
+
+
+def _gravar(db, escritas, resultados, dry_run):
+    itens = [item for _, _, _, itens_escrita in escritas for item in itens_escrita]
+    if not dry_run:
+        batch = db.batch()
+        for ref, dados, option, _ in escritas:
+            if option is not None:
+                batch.update(ref, dados, option=option)
+            else:
+                batch.update(ref, dados)
+        try:
+            batch.commit()
+        except (FailedPrecondition, NotFound):
+            # Alguém alterou um cliente (ou pagou ou apagou uma fatura) no meio: refaz linha a linha,
+            # com a mesma regra do batch de não tocar em fatura já paga
+            for indice, cliente_id, fatura_id, dados in itens:
+                base = {'indice': indice, 'cliente_id': cliente_id, 'fatura_id': fatura_id}
+                try:
+                    resultado = atualizar_fatura(db, cliente_id, fatura_id, dados, se_pendente=True)
+                    resultados[indice] = {**base, 'resultado': APLICADA if resultado == FATURA_ATUALIZADA else resultado}
+                except Exception as e:
+                    resultados[indice] = {**base, 'resultado': FALHOU, 'erro': str(e)}
+            return
+
+    for indice, cliente_id, fatura_id, _ in itens:
+        resultados[indice] = {'indice': indice, 'cliente_id': cliente_id, 'fatura_id': fatura_id, 'resultado': APLICADA}
+
+
+def resumir(resultados):
+    """Conta os resultados por tipo enquanto os repassa."""
+    resumo = {}
+    for resultado in resultados:
+        resumo[resultado['resultado']] = resumo.get(resultado['resultado'], 0) + 1
+        yield resultado
+    yield {'resumo': resumo}
+
+
+def _formato(caminho, formato):
+    if formato:
+        return formato
+    return 'csv' if caminho.lower().endswith('.csv') else 'ndjson'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exporta e importa faturas de mensalidade em lote')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    exportacao = comandos.add_parser('exportar', help='Exporta as faturas de todos os clientes')
+    exportacao.add_argument('--formato', choices=('csv', 'ndjson'), default='ndjson')
+    exportacao.add_argument('--cliente', help='Exporta apenas este cliente')
+    exportacao.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão)')
+    exportacao.add_argument('--pagina', type=int, default=PAGINA_CLIENTES, help='Clientes lidos por página')
+
+    importacao = comandos.add_parser('importar', help='Aplica confirmações de pagamento de um arquivo')
+    importacao.add_argument('arquivo', help='CSV ou NDJSON com cliente_id, fatura_id, valor_pago, data_pagamento')
+    importacao.add_argument('--formato', choices=('csv', 'ndjson'), help='Padrão: pela extensão do arquivo')
+    importacao.add_argument('--lote', type=int, default=MAX_ESCRITAS_BATCH, help='Linhas lidas por bloco')
+    importacao.add_argument('--dry-run', action='store_true', help='Só confere, sem gravar')
+    args = parser.parse_args()
+
+    from services.firebase import inicializar_firestore
+    db = inicializar_firestore()
+
+    if args.comando == 'exportar':
+        formatar = formatar_csv if args.formato == 'csv' else formatar_ndjson
+        saida = open(args.saida, 'w', newline='', encoding='utf-8') if args.saida else sys.stdout
+        total = 0
+        try:
+            for linha in formatar(exportar(db, cliente_id=args.cliente, pagina=args.pagina)):
+                saida.write(linha)
+                total += 1
+        finally:
+            if args.saida:
+                saida.close()
+        print(f'=== Exportação concluída: {total} linha(s) ===', file=sys.stderr)
+        return
+
+    with open(args.arquivo, newline='', encoding='utf-8') as arquivo:
+        linhas = ler_linhas(arquivo, _formato(args.arquivo, args.formato))
+        for resultado in resumir(importar(db, linhas, lote=args.lote, dry_run=args.dry_run)):
+            if 'resumo' in resultado:
+                print(f"=== Importação{' (dry-run)' if args.dry_run else ''}: {resultado['resumo']} ===")
+            elif resultado['resultado'] not in (APLICADA, FATURA_JA_PAGA):
+                print(f"❌ Linha {resultado['indice'] + 1}: {resultado['resultado']} {resultado.get('erro', '')}")
+
+
+if __name__ == '__main__':
+    main()
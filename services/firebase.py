@@ -0,0 +1,162 @@
+import base64
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from config import DISJUNTOR_FALHAS, DISJUNTOR_TEMPO_ABERTO
+from services.disjuntor import Disjuntor
+from services.metricas import registro
+
+logger = logging.getLogger(__name__)
+
+tempo_firestore = registro.histograma(
+    'firestore_operacao_segundos', 'Latência das operações no Firestore, por operação e status'
+)
+erros_firestore = registro.contador(
+    'firestore_erros_total', 'Operações no Firestore que falharam, por operação e tipo de erro'
+)
+
+disjuntor_firestore = Disjuntor('firestore', limite_falhas=DISJUNTOR_FALHAS, tempo_aberto=DISJUNTOR_TEMPO_ABERTO)
+
+_db = None
+_lock = threading.Lock()
+
+
+def _criar_cliente():
+    # Importado aqui para não pesar no import da aplicação
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    logger.info("Inicializando Firebase")
+    try:
+        # Obtém as credenciais da variável de ambiente
+        firebase_credentials = os.getenv('FIREBASE_CREDENTIALS')
+        if not firebase_credentials:
+            raise ValueError("Variável de ambiente FIREBASE_CREDENTIALS não encontrada")
+
+        # Decodifica as credenciais base64
+        cred_json = base64.b64decode(firebase_credentials).decode('utf-8')
+        cred_dict = json.loads(cred_json)
+
+        # Inicializa o Firebase Admin com as credenciais
+        cred = credentials.Certificate(cred_dict)
+
+        firebase_app = firebase_admin.initialize_app(cred, {
+            'projectId': 'empresa-fe1a8',
+            'databaseURL': 'https://empresa-fe1a8.firebaseio.com'
+        })
+
+        # Inicializa o Firestore
+        db = firestore.client(firebase_app)
+        db._database = 'empresa'  # Define o banco de dados específico
+        logger.info("Cliente Firestore criado com banco de dados 'empresa'")
+        return db
+
+    except Exception as e:
+        logger.exception("Erro ao inicializar Firebase: %s", str(e))
+        raise e
+
+
+def falha_de_disponibilidade(erro):
+    """Erros que indicam o Firestore fora ou degradado (e não um conflito ou documento ausente)."""
+    from google.api_core import exceptions
+
+    return isinstance(erro, (
+        exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+        exceptions.ResourceExhausted, exceptions.RetryError, TimeoutError, ConnectionError
+    ))
+
+
+def medir_firestore(operacao):
+    """Decorator que registra latência e erros de uma operação no Firestore.
+
+    A operação passa pelo disjuntor_firestore: com ele aberto falha na hora com
+    CircuitoAberto.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            sonda = disjuntor_firestore.admitir()
+            inicio = time.perf_counter()
+            status = 'erro'
+            falhou = False
+            try:
+                resultado = func(*args, **kwargs)
+                status = 'ok'
+                return resultado
+            except Exception as e:
+                falhou = falha_de_disponibilidade(e)
+                erros_firestore.incrementar(operacao=operacao, erro=e.__class__.__name__)
+                raise
+            finally:
+                disjuntor_firestore.concluir(sonda, falhou)
+                tempo_firestore.observar(time.perf_counter() - inicio, operacao=operacao, status=status)
+        return wrapper
+    return decorator
+
+
+def get_db():
+    """Cliente Firestore compartilhado, criado no primeiro uso (sem acesso à rede)."""
+    global _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                _db = _criar_cliente()
+    return _db
+
+
+@medir_firestore('verificar_conexao')
+def verificar_conexao(timeout=5):
+    """Teste de conexão com o Firestore, usado pela rota de prontidão."""
+    get_db().collection('clientes').limit(1).get(timeout=timeout)
+
+
+MAX_LEITURAS_GET_ALL = 300
+
+
+def paginar(colecao, pagina):
+    """Documentos da coleção em páginas de `pagina`, na ordem do id (memória limitada)."""
+    ultimo = None
+    while True:
+        query = colecao.order_by('__name__').limit(pagina)
+        if ultimo is not None:
+            query = query.start_after(ultimo)
+        docs = list(query.stream())
+        if not docs:
+            return
+        yield docs
+        ultimo = docs[-1]
+
+
+def ler_em_lote(db, refs):
+    """Snapshots dos documentos indexados pelo caminho, lidos com get_all em blocos."""
+    unicos = list({ref.path: ref for ref in refs}.values())
+    snapshots = {}
+    for inicio in range(0, len(unicos), MAX_LEITURAS_GET_ALL):
+        for snapshot in db.get_all(unicos[inicio:inicio + MAX_LEITURAS_GET_ALL]):
+            snapshots[snapshot.reference.path] = snapshot
+    return snapshots
+
+
+def inicializar_firestore():
+    """Cria o cliente e testa a conexão na hora; usado pelos comandos de linha."""
+    db = get_db()
+    verificar_conexao()
+    logger.info("Conexão com Firestore testada com sucesso")
+    return db
+
+
+class FirestoreLazy:
+    """Repassa tudo para o cliente Firestore, que só é criado no primeiro acesso.
+
+    Permite montar as rotas com `db` sem inicializar o Firebase no import.
+    """
+
+    def __getattr__(self, nome):
+        return getattr(get_db(), nome)
+
+
+db = FirestoreLazy()
@@ -0,0 +1,171 @@
+import threading
+import time
+
+from config import IDEMPOTENCIA_BACKEND, IDEMPOTENCIA_PATH, IDEMPOTENCIA_TTL, IDEMPOTENCIA_MAX_ITENS
+from services.cache import TTLCache
+from services.firebase import medir_firestore
+from services.sqlite_util import ConexaoPorThread
+
+NOVA = 'nova'
+PROCESSADO = 'processado'
+EM_PROCESSAMENTO = 'em_processamento'
+
+# Tempo máximo de uma reserva sem confirmação (worker que morreu no meio)
+LEASE_SEGUNDOS = 300
+
+
+class MemoriaBackend:
+    def __init__(self):
+        self._chaves = {}
+        self._lock = threading.Lock()
+
+    def reservar(self, chave, lease):
+        agora = time.time()
+        with self._lock:
+            atual = self._chaves.get(chave)
+            if atual and atual[1] > agora:
+                return atual[0]
+            self._chaves[chave] = (EM_PROCESSAMENTO, agora + lease)
+            return NOVA
+
+    def confirmar(self, chave, ttl):
+        with self._lock:
+            self._chaves[chave] = (PROCESSADO, time.time() + ttl)
+
+    def liberar(self, chave):
+        with self._lock:
+            self._chaves.pop(chave, None)
+
+
+class SQLiteBackend:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conexoes = ConexaoPorThread(caminho)
+        self._operacoes = 0
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chaves (
+                chave TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                expira_em REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chaves_expira_em ON chaves (expira_em)')
+
+    def _conn(self):
+        return self._conexoes.obter()
+
+    def reservar(self, chave, lease):
+        agora = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            linha = conn.execute(
+                'SELECT status FROM chaves WHERE chave = ? AND expira_em > ?', (chave, agora)
+            ).fetchone()
+            if linha is None:
+                conn.execute(
+                    'INSERT OR REPLACE INTO chaves (chave, status, expira_em) VALUES (?, ?, ?)',
+                    (chave, EM_PROCESSAMENTO, agora + lease)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._limpar_expiradas(conn, agora)
+        return linha[0] if linha else NOVA
+
+    def _limpar_expiradas(self, conn, agora):
+        self._operacoes += 1
+        if self._operacoes % 1000 == 0:
+            conn.execute('DELETE FROM chaves WHERE expira_em <= ?', (agora,))
+
+    def confirmar(self, chave, ttl):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO chaves (chave, status, expira_em) VALUES (?, ?, ?)',
+            (chave, PROCESSADO, time.time() + ttl)
+        )
+
+    def liberar(self, chave):
+        self._conn().execute('DELETE FROM chaves WHERE chave = ?', (chave,))
+
+
+class FirestoreBackend:
+    """Chaves na coleção 'webhook_eventos'.
+
+    Configure uma política de TTL do Firestore no campo 'expiraEm' para que
+    as chaves antigas sejam removidas automaticamente.
+    """
+
+    def __init__(self, db, colecao='webhook_eventos'):
+        self._db = db
+        self._nome_colecao = colecao
+
+    @property
+    def _colecao(self):
+        return self._db.collection(self._nome_colecao)
+
+    @medir_firestore('idempotencia_reservar')
+    def reservar(self, chave, lease):
+        from google.api_core.exceptions import AlreadyExists
+
+        agora = time.time()
+        ref = self._colecao.document(chave)
+        dados = {'status': EM_PROCESSAMENTO, 'expiraEm': agora + lease}
+        try:
+            ref.create(dados)
+            return NOVA
+        except AlreadyExists:
+            atual = ref.get().to_dict() or {}
+            if atual.get('expiraEm', 0) > agora:
+                return atual.get('status', EM_PROCESSAMENTO)
+            ref.set(dados)
+            return NOVA
+
+    @medir_firestore('idempotencia_confirmar')
+    def confirmar(self, chave, ttl):
+        self._colecao.document(chave).set({'status': PROCESSADO, 'expiraEm': time.time() + ttl})
+
+    @medir_firestore('idempotencia_liberar')
+    def liberar(self, chave):
+        self._colecao.document(chave).delete()
+
+
+class IdempotenciaStore:
+    """Deduplicação de eventos de webhook.
+
+    Chaves já confirmadas ficam num LRU em memória, então reenvios do Stripe
+    são respondidos sem acessar nenhum banco. O backend garante a deduplicação
+    entre workers e reinícios.
+    """
+
+    def __init__(self, backend, ttl=7 * 24 * 3600, max_itens=100000):
+        self.backend = backend
+        self.ttl = ttl
+        self._processados = TTLCache(max_itens=max_itens, ttl=ttl)
+
+    def reservar(self, chave):
+        """Retorna NOVA (e reserva a chave), PROCESSADO ou EM_PROCESSAMENTO."""
+        if self._processados.get(chave):
+            return PROCESSADO
+        status = self.backend.reservar(chave, LEASE_SEGUNDOS)
+        if status == PROCESSADO:
+            self._processados.set(chave, True)
+        return status
+
+    def confirmar(self, chave):
+        self.backend.confirmar(chave, self.ttl)
+        self._processados.set(chave, True)
+
+    def liberar(self, chave):
+        self.backend.liberar(chave)
+
+
+def criar_idempotencia_store(db):
+    if IDEMPOTENCIA_BACKEND == 'firestore':
+        backend = FirestoreBackend(db)
+    elif IDEMPOTENCIA_BACKEND == 'memoria':
+        backend = MemoriaBackend()
+    else:
+        backend = SQLiteBackend(IDEMPOTENCIA_PATH)
+    return IdempotenciaStore(backend, ttl=IDEMPOTENCIA_TTL, max_itens=IDEMPOTENCIA_MAX_ITENS)
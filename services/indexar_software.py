@@ -0,0 +1,54 @@
+"""Backfill do índice software_personalizado_indice a partir dos projetos existentes.
+
+Uso:
+    python -m services.indexar_software [--pagina 300]
+
+Idempotente: os ids são acrescentados com ArrayUnion, então pode ser
+executado de novo a qualquer momento.
+"""
+import argparse
+
+from services.firebase import paginar
+from services.software_indice import indexar, MAX_ESCRITAS_BATCH
+
+
+def indexar_todos(db, pagina=300):
+    total = 0
+    for docs in paginar(db.collection('software_personalizado'), pagina):
+        # Agrupa a página por (clienteId, nomeProjeto): uma escrita por par
+        grupos = {}
+        for doc in docs:
+            dados = doc.to_dict() or {}
+            if dados.get('clienteId') and dados.get('nomeProjeto'):
+                grupos.setdefault((dados['clienteId'], dados['nomeProjeto']), []).append(doc.id)
+
+        batch = db.batch()
+        escritas = 0
+        for (cliente_id, nome_projeto), doc_ids in grupos.items():
+            indexar(db, cliente_id, nome_projeto, doc_ids, batch=batch)
+            escritas += 1
+            if escritas == MAX_ESCRITAS_BATCH:
+                batch.commit()
+                batch = db.batch()
+                escritas = 0
+        if escritas:
+            batch.commit()
+
+        total += len(docs)
+        print(f'✅ {total} projeto(s) indexado(s)')
+
+    print(f'=== Índice de software personalizado concluído: {total} projeto(s) ===')
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera o índice dos projetos de software personalizado')
+    parser.add_argument('--pagina', type=int, default=300, help='Projetos lidos por página')
+    args = parser.parse_args()
+
+    from services.firebase import inicializar_firestore
+    indexar_todos(inicializar_firestore(), pagina=args.pagina)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+import base64
+import json
+import logging
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+from config import LEDGER_BACKEND, LEDGER_PATH
+from services.contas_stripe import CONTA_PADRAO
+from services.sqlite_util import ConexaoPorThread
+
+logger = logging.getLogger(__name__)
+
+# Filtros por igualdade aceitos em consultar(), todos com índice
+FILTROS = ('cpf', 'email', 'status', 'cliente_id', 'fatura_id', 'conta')
+CAMPOS_DATA = {'criacao': 'criado_em', 'pagamento': 'pago_em'}
+CHAVE_METADATA_REGEX = re.compile(r'^[A-Za-z0-9_]{1,40}$')
+
+
+def limpar_cpf(cpf):
+    """CPF como gravado no ledger: sem pontos e traço (a mesma limpeza de validar_boleto)."""
+    return cpf.replace('.', '').replace('-', '')
+
+
+def _data(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+
+def codificar_cursor(valor, payment_intent_id):
+    return base64.urlsafe_b64encode(json.dumps([valor, payment_intent_id]).encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """(valor, payment_intent_id) do cursor; ValueError se for inválido."""
+    try:
+        valor, payment_intent_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(valor), str(payment_intent_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+class SQLiteLedger:
+    """Registro dos boletos gerados, atualizado pelos webhooks.
+
+    Uma linha por PaymentIntent. A criação grava os dados do pagador; os eventos
+    payment_intent.* atualizam status e data de pagamento, sem voltar um status
+    por causa de um evento antigo entregue fora de ordem.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conexoes = ConexaoPorThread(caminho, row_factory=sqlite3.Row)
+        self._tabela_criada = False
+
+    def _conn(self):
+        conn = self._conexoes.obter()
+        if not self._tabela_criada:
+            self._criar_tabela(conn)
+        return conn
+
+    def _criar_tabela(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS boletos (
+                payment_intent_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                valor_centavos INTEGER,
+                email TEXT,
+                cpf TEXT,
+                nome TEXT,
+                descricao TEXT,
+                cliente_id TEXT,
+                fatura_id TEXT,
+                conta TEXT NOT NULL DEFAULT 'padrao',
+                metadata TEXT,
+                chave_idempotencia TEXT,
+                criado_em REAL NOT NULL,
+                pago_em REAL,
+                atualizado_em REAL NOT NULL
+            )
+        ''')
+        # Ledgers criados antes das várias contas Stripe: as linhas antigas são da conta padrão
+        colunas_existentes = {linha[1] for linha in conn.execute('PRAGMA table_info(boletos)')}
+        if 'conta' not in colunas_existentes:
+            conn.execute(f"ALTER TABLE boletos ADD COLUMN conta TEXT NOT NULL DEFAULT '{CONTA_PADRAO}'")
+        for nome, colunas in (
+            ('cpf', 'cpf, criado_em'),
+            ('email', 'email, criado_em'),
+            ('status', 'status, criado_em'),
+            ('cliente_id', 'cliente_id, criado_em'),
+            ('fatura_id', 'fatura_id, criado_em'),
+            ('conta', 'conta, criado_em'),
+            ('criado_em', 'criado_em'),
+            ('pago_em', 'pago_em'),
+        ):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_boletos_{nome} ON boletos ({colunas})')
+        self._tabela_criada = True
+
+    def registrar(self, payment_intent, dados, chave=None, conta=CONTA_PADRAO):
+        """Grava o boleto recém-criado; não sobrescreve um status já trazido por webhook."""
+        metadata = dict(payment_intent.get('metadata') or dados.get('metadata') or {})
+        self._conn().execute('''
+            INSERT INTO boletos (
+                payment_intent_id, status, valor_centavos, email, cpf, nome, descricao,
+                cliente_id, fatura_id, conta, metadata, chave_idempotencia, criado_em, atualizado_em
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (payment_intent_id) DO UPDATE SET
+                conta = excluded.conta,
+                email = excluded.email,
+                cpf = excluded.cpf,
+                nome = excluded.nome,
+                descricao = excluded.descricao,
+                chave_idempotencia = excluded.chave_idempotencia
+        ''', (
+            payment_intent['id'],
+            payment_intent['status'],
+            payment_intent.get('amount'),
+            (dados.get('email') or '').lower() or None,
+            dados.get('cpf_limpo'),
+            dados.get('nome'),
+            dados.get('descricao'),
+            metadata.get('cliente_id'),
+            metadata.get('fatura_id'),
+            conta,
+            json.dumps(metadata),
+            chave,
+            payment_intent.get('created') or time.time(),
+            payment_intent.get('created') or time.time()
+        ))
+
+    def aplicar_evento(self, event, conta=CONTA_PADRAO):
+        """Cria ou atualiza a linha do PaymentIntent a partir de um evento payment_intent.* da `conta`"""
+        payment_intent = event['data']['object']
+        if not payment_intent.get('id') or not payment_intent.get('status'):
+            return
+
+        pago_em = None
+        if payment_intent['status'] == 'succeeded':
+            charges = (payment_intent.get('charges') or {}).get('data') or []
+            pago_em = (charges[0].get('created') if charges else None) or event.get('created') or time.time()
+
+        metadata = dict(payment_intent.get('metadata') or {})
+        evento_em = event.get('created') or time.time()
+        # Boletos criados fora desta API (ou antes do ledger) entram pelo primeiro evento
+        self._conn().execute('''
+            INSERT INTO boletos (
+                payment_intent_id, status, valor_centavos, email, cliente_id, fatura_id,
+                conta, metadata, criado_em, pago_em, atualizado_em
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (payment_intent_id) DO UPDATE SET
+                status = excluded.status,
+                pago_em = COALESCE(excluded.pago_em, boletos.pago_em),
+                atualizado_em = excluded.atualizado_em
+            WHERE excluded.atualizado_em >= boletos.atualizado_em
+        ''', (
+            payment_intent['id'],
+            payment_intent['status'],
+            payment_intent.get('amount'),
+            (payment_intent.get('receipt_email') or '').lower() or None,
+            metadata.get('cliente_id'),
+            metadata.get('fatura_id'),
+            conta,
+            json.dumps(metadata),
+            payment_intent.get('created') or evento_em,
+            pago_em,
+            evento_em
+        ))
+
+    def obter(self, payment_intent_id):
+        linha = self._conn().execute(
+            'SELECT * FROM boletos WHERE payment_intent_id = ?', (payment_intent_id,)
+        ).fetchone()
+        return self._formatar(linha) if linha else None
+
+    def consultar(self, filtros=None, metadata=None, desde=None, ate=None, data='criacao', limite=50, cursor=None):
+        """Boletos mais recentes primeiro, com paginação por cursor.
+
+        `filtros` usa as colunas de FILTROS; `metadata` filtra por outras chaves do
+        metadata (sem índice, combine com um filtro ou um intervalo de datas).
+        `desde`/`ate` são timestamps sobre a data de criação ou de pagamento.
+        Retorna (boletos, proximo_cursor), com proximo_cursor None na última página.
+        """
+        coluna = CAMPOS_DATA[data]
+        condicoes = [f'{coluna} IS NOT NULL']
+        parametros = []
+        for campo, valor in (filtros or {}).items():
+            if campo not in FILTROS:
+                raise ValueError(f'Filtro não suportado: {campo}')
+            if campo == 'email':
+                valor = valor.lower()
+            elif campo == 'cpf':
+                valor = limpar_cpf(valor)
+            condicoes.append(f'{campo} = ?')
+            parametros.append(valor)
+        for chave, valor in (metadata or {}).items():
+            if not CHAVE_METADATA_REGEX.match(chave):
+                raise ValueError(f'Chave de metadata inválida: {chave}')
+            condicoes.append('json_extract(metadata, ?) = ?')
+            parametros.extend([f'$.{chave}', valor])
+        if desde is not None:
+            condicoes.append(f'{coluna} >= ?')
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append(f'{coluna} < ?')
+            parametros.append(ate)
+        if cursor:
+            valor_cursor, id_cursor = decodificar_cursor(cursor)
+            condicoes.append(f'({coluna} < ? OR ({coluna} = ? AND payment_intent_id < ?))')
+            parametros.extend([valor_cursor, valor_cursor, id_cursor])
+
+        linhas = self._conn().execute(
+            f'SELECT * FROM boletos WHERE {" AND ".join(condicoes)} '
+            f'ORDER BY {coluna} DESC, payment_intent_id DESC LIMIT ?',
+            parametros + [limite + 1]
+        ).fetchall()
+
+        proximo = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proximo = codificar_cursor(linhas[-1][coluna], linhas[-1]['payment_intent_id'])
+        return [self._formatar(linha) for linha in linhas], proximo
+
+    @staticmethod
+    def _formatar(linha):
+        return {
+            'boleto_id': linha['payment_intent_id'],
+            'status': linha['status'],
+            'valor': linha['valor_centavos'] / 100 if linha['valor_centavos'] is not None else None,
+            'email': linha['email'],
+            'cpf': linha['cpf'],
+            'nome': linha['nome'],
+            'descricao': linha['descricao'],
+            'cliente_id': linha['cliente_id'],
+            'fatura_id': linha['fatura_id'],
+            'conta': linha['conta'],
+            'metadata': json.loads(linha['metadata'] or '{}'),
+            'data_criacao': _data(linha['criado_em']),
+            'data_pagamento': _data(linha['pago_em']),
+            'atualizado_em': _data(linha['atualizado_em'])
+        }
+
+
+def criar_ledger():
+    if LEDGER_BACKEND == 'nenhum':
+        return None
+    return SQLiteLedger(LEDGER_PATH)
+
+
+ledger = criar_ledger()
@@ -0,0 +1,91 @@
+import time
+
+from services.disjuntor import CircuitoAberto
+from services.sqlite_util import ConexaoPorThread
+
+
+class TaxaExcedida(CircuitoAberto):
+    """Sem folga no limite de requisições da conta: a chamada é recusada sem ir ao Stripe.
+
+    Subclasse de CircuitoAberto para ter o mesmo tratamento nas rotas: 503 com
+    Retry-After e, no /verificar-boleto, o último status conhecido.
+    """
+
+    def __init__(self, dependencia, retry_after):
+        super().__init__(dependencia, retry_after)
+        self.args = (f'{dependencia}: limite de requisições atingido',)
+
+
+class LimiteTaxaCompartilhado:
+    """Token bucket gravado em SQLite: um balde por `chave` para todos os processos da máquina.
+
+    `reservar()` tira um token numa transação curta. Sem token disponível o
+    saldo fica negativo (quem já reservou forma a fila) e o retorno é quanto
+    esperar antes da chamada; se a espera passar de `espera_max`, nada é
+    reservado e a chamada é recusada com TaxaExcedida.
+    """
+
+    def __init__(self, caminho, chave, por_segundo, rajada=None, espera_max=2.0, nome=None):
+        self.caminho = caminho
+        self.chave = chave
+        self.nome = nome or chave
+        self.por_segundo = float(por_segundo)
+        self.rajada = float(rajada if rajada else por_segundo)
+        self.espera_max = espera_max
+        # As contas são montadas no import: o arquivo só é aberto na primeira chamada
+        self._conexoes = ConexaoPorThread(caminho)
+        self._tabela_criada = False
+
+    def _conn(self):
+        conn = self._conexoes.obter()
+        if not self._tabela_criada:
+            self._criar_tabela(conn)
+        return conn
+
+    def _criar_tabela(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS baldes (
+                chave TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+        ''')
+        self._tabela_criada = True
+
+    def _saldo(self, linha, agora):
+        if linha is None:
+            return self.rajada
+        # Relógio de parede: é o único comum a todos os processos
+        tokens, atualizado_em = linha
+        return min(self.rajada, tokens + max(0.0, agora - atualizado_em) * self.por_segundo)
+
+    def reservar(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Lido já com o lock de escrita, para o relógio do balde nunca voltar
+            agora = time.time()
+            tokens = self._saldo(
+                conn.execute('SELECT tokens, atualizado_em FROM baldes WHERE chave = ?', (self.chave,)).fetchone(),
+                agora
+            )
+            espera = max(0.0, (1 - tokens) / self.por_segundo)
+            if espera <= self.espera_max:
+                conn.execute(
+                    'INSERT OR REPLACE INTO baldes (chave, tokens, atualizado_em) VALUES (?, ?, ?)',
+                    (self.chave, tokens - 1, agora)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if espera > self.espera_max:
+            raise TaxaExcedida(self.nome, espera)
+        return espera
+
+    def disponivel(self):
+        """Tokens no balde agora; negativo quando há chamadas reservadas esperando."""
+        linha = self._conn().execute(
+            'SELECT tokens, atualizado_em FROM baldes WHERE chave = ?', (self.chave,)
+        ).fetchone()
+        return self._saldo(linha, time.time())
@@ -0,0 +1,165 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import time
+import uuid
+
+from config import LOG_LEVEL, LOG_NIVEIS, LOG_FORMATO
+
+# Id de correlação da requisição (ou do evento, nos workers da fila)
+request_id = contextvars.ContextVar('request_id', default='-')
+
+CAMPOS_SENSIVEIS = {
+    'cpf', 'cpf_limpo', 'tax_id', 'cliente_cpf', 'cliente_cpf_cnpj', 'clientecpfcnpj', 'cpfcnpj',
+    'email', 'receipt_email', 'cliente_email', 'clienteemail',
+    'endereco', 'cliente_endereco', 'address', 'line1', 'line2', 'postal_code', 'cep', 'rua', 'numero',
+    'complemento', 'billing_details', 'telefone', 'cliente_telefone', 'clientetelefone', 'phone'
+}
+CPF_REGEX = re.compile(r'\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b')
+CNPJ_REGEX = re.compile(r'\b\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}\b')
+EMAIL_REGEX = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+OCULTO = '***'
+
+_listener = None
+
+
+def mascarar_texto(texto):
+    texto = EMAIL_REGEX.sub(OCULTO, texto)
+    texto = CNPJ_REGEX.sub(OCULTO, texto)
+    return CPF_REGEX.sub(OCULTO, texto)
+
+
+def mascarar(valor):
+    """Cópia do valor com CPF/CNPJ, e-mail, telefone e endereço ocultados."""
+    if isinstance(valor, dict):
+        return {
+            chave: OCULTO if str(chave).lower() in CAMPOS_SENSIVEIS else mascarar(item)
+            for chave, item in valor.items()
+        }
+    if isinstance(valor, (list, tuple)):
+        return [mascarar(item) for item in valor]
+    if isinstance(valor, str):
+        return mascarar_texto(valor)
+    return valor
+
+
+class _FilaHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Só resolve a mensagem; formatação e máscara ficam com a thread do listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class CorrelacaoFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    # Atributos padrão do LogRecord; o resto veio de `extra=`
+    _PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id'}
+
+    def format(self, record):
+        dados = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'nivel': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'mensagem': mascarar_texto(record.getMessage()),
+        }
+        for chave, valor in record.__dict__.items():
+            if chave not in self._PADRAO and not chave.startswith('_'):
+                dados[chave] = mascarar(valor)
+        if record.exc_info:
+            dados['excecao'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            dados['excecao'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class TextoFormatter(logging.Formatter):
+    def format(self, record):
+        record.msg = mascarar_texto(record.getMessage())
+        record.args = ()
+        return super().format(record)
+
+
+def _niveis_por_modulo(especificacao):
+    niveis = {}
+    for item in filter(None, (parte.strip() for parte in especificacao.split(','))):
+        modulo, _, nivel = item.partition('=')
+        niveis[modulo.strip()] = nivel.strip().upper()
+    return niveis
+
+
+def configurar_logs():
+    """Logs em JSON (ou texto) por uma fila: quem loga não espera o stdout."""
+    global _listener
+    if _listener is not None:
+        return
+
+    saida = logging.StreamHandler(sys.stdout)
+    if LOG_FORMATO == 'texto':
+        saida.setFormatter(TextoFormatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+    else:
+        saida.setFormatter(JsonFormatter())
+
+    fila = queue.SimpleQueue()
+    handler = _FilaHandler(fila)
+    handler.addFilter(CorrelacaoFilter())
+
+    raiz = logging.getLogger()
+    raiz.handlers = [handler]
+    raiz.setLevel(LOG_LEVEL.upper())
+    for modulo, nivel in _niveis_por_modulo(LOG_NIVEIS).items():
+        logging.getLogger(modulo).setLevel(nivel)
+
+    _listener = logging.handlers.QueueListener(fila, saida, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_parar_listener)
+    # A thread do listener não sobrevive ao fork (gunicorn --preload)
+    os.register_at_fork(after_in_child=_reiniciar_listener)
+
+
+def _parar_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _reiniciar_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=False)
+    _listener.start()
+
+
+def init_correlacao(app):
+    """Usa o X-Request-ID recebido (ou gera um) e o devolve na resposta."""
+    from flask import g, request
+
+    @app.before_request
+    def definir_request_id():
+        g._request_id_token = request_id.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+
+    @app.after_request
+    def devolver_request_id(response):
+        response.headers['X-Request-ID'] = request_id.get()
+        return response
+
+    @app.teardown_request
+    def limpar_request_id(exc):
+        token = g.pop('_request_id_token', None)
+        if token is not None:
+            request_id.reset(token)
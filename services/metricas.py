@@ -0,0 +1,181 @@
+import bisect
+import threading
+
+# Limites (em segundos) dos buckets de latência
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Contador:
+    def __init__(self, nome, descricao):
+        self.nome = nome
+        self.descricao = descricao
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor=1, **labels):
+        chave = tuple(sorted(labels.items()))
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def coletar(self):
+        with self._lock:
+            return {chave: valor for chave, valor in self._valores.items()}
+
+
+class Histograma:
+    def __init__(self, nome, descricao, buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **labels):
+        chave = tuple(sorted(labels.items()))
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                # contagens por bucket (o último é o +Inf), soma, total e máximo
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+            if valor > serie[3]:
+                serie[3] = valor
+
+    def coletar(self):
+        with self._lock:
+            return {
+                chave: {
+                    'buckets': list(contagens),
+                    'soma': soma,
+                    'total': total,
+                    'maximo': maximo
+                }
+                for chave, (contagens, soma, total, maximo) in self._series.items()
+            }
+
+    def resumo(self):
+        """Contagem, média e máximo por série, para as rotas de diagnóstico em JSON."""
+        resultado = []
+        for chave, serie in self.coletar().items():
+            resultado.append({
+                **dict(chave),
+                'total': serie['total'],
+                'media_ms': round(serie['soma'] / serie['total'] * 1000, 3) if serie['total'] else 0.0,
+                'maximo_ms': round(serie['maximo'] * 1000, 3)
+            })
+        return resultado
+
+
+class Medidor:
+    """Gauge lido na hora da coleta: `funcao()` retorna um número ou {labels: número} para várias séries."""
+
+    def __init__(self, nome, descricao, funcao):
+        self.nome = nome
+        self.descricao = descricao
+        self.funcao = funcao
+
+    def coletar(self):
+        valor = self.funcao()
+        return valor if isinstance(valor, dict) else {(): valor}
+
+
+class Instantaneo:
+    """`funcao()` lida uma vez por coleta e compartilhada pelos medidores derivados dela."""
+
+    def __init__(self, registro, funcao):
+        self._registro = registro
+        self._funcao = funcao
+        self._coleta = None
+        self._valor = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._coleta != self._registro.coleta:
+                self._valor = self._funcao()
+                self._coleta = self._registro.coleta
+            return self._valor
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+        # Incrementada a cada coleta (scrape); ver Instantaneo
+        self.coleta = 0
+
+    def _obter(self, classe, nome, descricao, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nome)
+            if metrica is None:
+                metrica = self._metricas[nome] = classe(nome, descricao, **kwargs)
+            return metrica
+
+    def contador(self, nome, descricao=''):
+        return self._obter(Contador, nome, descricao)
+
+    def histograma(self, nome, descricao='', buckets=BUCKETS_PADRAO):
+        return self._obter(Histograma, nome, descricao, buckets=buckets)
+
+    def medidor(self, nome, descricao, funcao):
+        return self._obter(Medidor, nome, descricao, funcao=funcao)
+
+    def instantaneo(self, funcao):
+        return Instantaneo(self, funcao)
+
+    def iniciar_coleta(self):
+        with self._lock:
+            self.coleta += 1
+
+    def metricas(self):
+        with self._lock:
+            return list(self._metricas.values())
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(chave, extra=()):
+    pares = list(chave) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formatar_prometheus(registro):
+    """Todas as métricas do registro no formato texto do Prometheus (0.0.4)."""
+    registro.iniciar_coleta()
+    linhas = []
+    for metrica in sorted(registro.metricas(), key=lambda m: m.nome):
+        tipo = {Contador: 'counter', Histograma: 'histogram', Medidor: 'gauge'}[type(metrica)]
+        linhas.append(f'# HELP {metrica.nome} {metrica.descricao}')
+        linhas.append(f'# TYPE {metrica.nome} {tipo}')
+        try:
+            series = metrica.coletar()
+        except Exception:
+            # Um medidor com erro não derruba a coleta das demais
+            continue
+        for chave, valor in sorted(series.items()):
+            if tipo != 'histogram':
+                linhas.append(f'{metrica.nome}{_labels(chave)} {_numero(valor)}')
+                continue
+            acumulado = 0
+            for limite, contagem in zip(metrica.buckets + (float('inf'),), valor['buckets']):
+                acumulado += contagem
+                linhas.append(f'{metrica.nome}_bucket{_labels(chave, [("le", _numero(limite))])} {acumulado}')
+            linhas.append(f'{metrica.nome}_sum{_labels(chave)} {_numero(valor["soma"])}')
+            linhas.append(f'{metrica.nome}_count{_labels(chave)} {valor["total"]}')
+    return '\n'.join(linhas) + '\n'
+
+
+registro = Registro()
@@ -0,0 +1,109 @@
+"""Backfill das faturas do array 'faturas' para a subcoleção clientes/{id}/faturas.
+
+Uso:
+    python -m services.migrar_faturas [--cliente ID] [--pagina 200] [--dry-run]
+
+Pode ser executado várias vezes: clientes já migrados são pulados e a escrita
+das faturas é idempotente. O cliente só é marcado como migrado se o documento
+não mudou desde a leitura; se mudou (pagamento no meio da migração), ele é
+processado de novo.
+"""
+import argparse
+
+from google.api_core.exceptions import FailedPrecondition
+
+from services.faturas import CAMPO_MIGRADO, faturas_ref
+from services.firebase import paginar
+
+# Limite de escritas de um batch do Firestore
+MAX_ESCRITAS_BATCH = 500
+MAX_TENTATIVAS_CLIENTE = 3
+
+
+def migrar_cliente(db, cliente_doc, dry_run=False):
+    """Copia as faturas de um cliente para a subcoleção. Retorna quantas foram copiadas."""
+    cliente_data = cliente_doc.to_dict() or {}
+    if cliente_data.get(CAMPO_MIGRADO):
+        return 0
+
+    faturas = [f for f in cliente_data.get('faturas', []) if f.get('id')]
+    ignoradas = len(cliente_data.get('faturas', [])) - len(faturas)
+    if ignoradas:
+        print(f"⚠️ Cliente {cliente_doc.id}: {ignoradas} fatura(s) sem id não migrada(s)")
+    if dry_run:
+        return len(faturas)
+
+    destino = faturas_ref(db, cliente_doc.id)
+    # Numa tentativa anterior interrompida, o webhook (FATURAS_MODO=subcolecao) já pode ter pago
+    # faturas copiadas: essas não voltam para o status do array
+    pagas = {doc.id for docs in paginar(destino, MAX_ESCRITAS_BATCH) for doc in docs
+             if (doc.to_dict() or {}).get('status') == 'pago'}
+    batch = db.batch()
+    escritas = 0
+    for fatura in faturas:
+        if str(fatura['id']) in pagas and fatura.get('status') != 'pago':
+            continue
+        batch.set(destino.document(str(fatura['id'])), fatura, merge=True)
+        escritas += 1
+        # Reserva uma escrita para a marcação do cliente no último batch
+        if escritas == MAX_ESCRITAS_BATCH - 1:
+            batch.commit()
+            batch = db.batch()
+            escritas = 0
+
+    batch.update(
+        cliente_doc.reference,
+        {CAMPO_MIGRADO: True},
+        option=db.write_option(last_update_time=cliente_doc.update_time)
+    )
+    batch.commit()
+    return len(faturas)
+
+
+def migrar(db, cliente_id=None, pagina=200, dry_run=False):
+    clientes = db.collection('clientes')
+    total_clientes = 0
+    total_faturas = 0
+
+    if cliente_id:
+        docs = [clientes.document(cliente_id).get()]
+        paginas = [[doc for doc in docs if doc.exists]]
+    else:
+        paginas = paginar(clientes, pagina)
+
+    for docs in paginas:
+        for cliente_doc in docs:
+            for tentativa in range(1, MAX_TENTATIVAS_CLIENTE + 1):
+                try:
+                    copiadas = migrar_cliente(db, cliente_doc, dry_run)
+                    break
+                except FailedPrecondition:
+                    print(f"Cliente {cliente_doc.id} alterado durante a migração, tentativa {tentativa}")
+                    cliente_doc = cliente_doc.reference.get()
+            else:
+                print(f"❌ Cliente {cliente_doc.id} não migrado, execute novamente")
+                continue
+            if copiadas:
+                total_clientes += 1
+                total_faturas += copiadas
+                print(f"✅ Cliente {cliente_doc.id}: {copiadas} fatura(s)")
+
+    acao = 'seriam migradas' if dry_run else 'migradas'
+    print(f"=== {total_faturas} fatura(s) de {total_clientes} cliente(s) {acao} ===")
+    return total_clientes, total_faturas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migra as faturas dos clientes para a subcoleção')
+    parser.add_argument('--cliente', help='Migra apenas este cliente')
+    parser.add_argument('--pagina', type=int, default=200, help='Clientes lidos por página')
+    parser.add_argument('--dry-run', action='store_true', help='Só conta o que seria migrado')
+    args = parser.parse_args()
+
+    from services.firebase import inicializar_firestore
+    db = inicializar_firestore()
+    migrar(db, cliente_id=args.cliente, pagina=args.pagina, dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import (
+    NOTIFICACOES_SEGREDO, NOTIFICACOES_PATH, NOTIFICACOES_DESTINOS, NOTIFICACOES_HOSTS_PERMITIDOS,
+    NOTIFICACOES_CONCORRENCIA, NOTIFICACOES_MAX_POR_HOST, NOTIFICACOES_MAX_TENTATIVAS, NOTIFICACOES_TIMEOUT,
+    NOTIFICACOES_RETENCAO
+)
+from services import assinatura
+from services.metricas import registro
+from services.sqlite_util import ConexaoPorThread
+
+logger = logging.getLogger(__name__)
+
+# Notificações 'enviando' há mais tempo que isso voltam para a fila (o processo morreu no meio)
+LEASE_SEGUNDOS = 300
+INTERVALO_OCIOSO = 1.0
+INTERVALO_LIMPEZA = 3600
+ESPERA_INICIAL = 5
+ESPERA_MAXIMA = 3600
+
+# Respostas que valem nova tentativa; os demais 4xx vão direto para as falhas
+STATUS_REPETIR = (408, 425, 429)
+
+entregas_notificacoes = registro.contador(
+    'notificacoes_entregas_total', 'Tentativas de entrega de notificações, por destino e resultado'
+)
+tempo_notificacoes = registro.histograma(
+    'notificacoes_entrega_segundos', 'Latência de cada tentativa de entrega de notificação'
+)
+
+
+def _destinos(especificacao):
+    """Lê NOTIFICACOES_DESTINOS ("endpoint=url,endpoint=url") em {endpoint: url}."""
+    destinos = {}
+    for item in filter(None, (parte.strip() for parte in especificacao.split(','))):
+        endpoint, _, url = item.partition('=')
+        destinos[endpoint.strip()] = url.strip()
+    return destinos
+
+
+class Notificacoes:
+    """Webhooks de saída: avisa sistemas externos dos pagamentos aplicados.
+
+    `enfileirar()` grava a notificação numa fila SQLite (uma por pagamento e
+    tipo; repetições são ignoradas). Uma thread por processo entrega a fila com
+    um cliente httpx assíncrono (conexões keep-alive), até `concorrencia`
+    entregas simultâneas e `max_por_host` por destino. Falhas são repetidas com
+    backoff exponencial; esgotadas as tentativas (ou com um 4xx definitivo) a
+    notificação fica como 'falhou' até ser reenviada pela rota administrativa.
+
+    O corpo vai assinado no header X-Notificacao-Assinatura, no formato do
+    Stripe-Signature (`t=<timestamp>,v1=<HMAC-SHA256 de "t.corpo">`).
+    """
+
+    def __init__(self, caminho, segredo, destinos=None, hosts_permitidos=(), concorrencia=20, max_por_host=4,
+                 max_tentativas=8, timeout=10, retencao=7 * 24 * 3600):
+        self.caminho = caminho
+        self.segredo = segredo
+        self.destinos = dict(destinos or {})
+        # Os hosts dos destinos configurados também valem para o webhook_url do metadata
+        self.hosts_permitidos = (set(hosts_permitidos) | {urlsplit(url).hostname for url in self.destinos.values()}) - {None}
+        self.concorrencia = concorrencia
+        self.max_por_host = max_por_host
+        self.max_tentativas = max_tentativas
+        self.timeout = timeout
+        self.retencao = retencao
+        self._conexoes = ConexaoPorThread(caminho)
+        self._thread = None
+        self._pid = None
+        self._lock_inicio = threading.Lock()
+        self._loop = None
+        self._novo = None
+        self._parar = threading.Event()
+        self._tabela_criada = False
+
+    @property
+    def ativa(self):
+        return bool(self.segredo)
+
+    def _conn(self):
+        self._criar_tabela()
+        return self._conexoes.obter()
+
+    def _criar_tabela(self):
+        if self._tabela_criada:
+            return
+        conn = self._conexoes.obter()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS notificacoes (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                host TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                corpo TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                criado_em REAL NOT NULL,
+                disponivel_em REAL NOT NULL,
+                iniciado_em REAL,
+                entregue_em REAL,
+                ultimo_status INTEGER,
+                erro TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notificacoes_status ON notificacoes (status, disponivel_em)')
+        self._tabela_criada = True
+
+    def resolver_url(self, endpoint, url=None):
+        """URL de destino: a do metadata, se o host for permitido, ou a configurada para o endpoint."""
+        if url:
+            partes = urlsplit(url)
+            if partes.scheme in ('http', 'https') and partes.hostname in self.hosts_permitidos:
+                return url
+            logger.warning("webhook_url com host não permitido ignorado: %s", partes.hostname)
+        return self.destinos.get(endpoint)
+
+    def enfileirar(self, endpoint, tipo, event, dados, url=None):
+        """Grava a notificação do pagamento; retorna o id, ou None se não houver destino."""
+        if not self.ativa:
+            return None
+        url = self.resolver_url(endpoint, url)
+        if not url:
+            return None
+
+        payment_intent = event['data']['object']
+        tipo = f'{endpoint}.{tipo}'
+        # Mesmo id em qualquer reenvio do evento: o destino também pode deduplicar por ele
+        notificacao_id = 'ntf_' + hashlib.sha256(f"{tipo}:{payment_intent.get('id')}".encode('utf-8')).hexdigest()[:32]
+        agora = time.time()
+        corpo = json.dumps({
+            'id': notificacao_id,
+            'tipo': tipo,
+            'criado_em': int(agora),
+            'evento_id': event.get('id'),
+            'payment_intent_id': payment_intent.get('id'),
+            'valor': (payment_intent.get('amount') or 0) / 100,
+            'metadata': dict(payment_intent.get('metadata') or {}),
+            'dados': dados
+        }, ensure_ascii=False, default=str)
+
+        self._conn().execute(
+            'INSERT OR IGNORE INTO notificacoes (id, url, host, tipo, corpo, criado_em, disponivel_em) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (notificacao_id, url, urlsplit(url).hostname, tipo, corpo, agora, agora)
+        )
+        self._acordar()
+        return notificacao_id
+
+    def _acordar(self):
+        loop, novo = self._loop, self._novo
+        if loop is not None and novo is not None:
+            try:
+                loop.call_soon_threadsafe(novo.set)
+            except RuntimeError:
+                # Loop já encerrado
+                pass
+
+    def _reservar(self, conn, livres, por_host):
+        """Marca como 'enviando' até `livres` notificações vencidas de hosts abaixo do limite."""
+        agora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE notificacoes SET status = 'pendente' WHERE status = 'enviando' AND iniciado_em < ?",
+                (agora - LEASE_SEGUNDOS,)
+            )
+            candidatas = conn.execute(
+                "SELECT id, url, host, corpo, tentativas FROM notificacoes "
+                "WHERE status = 'pendente' AND disponivel_em <= ? ORDER BY disponivel_em LIMIT ?",
+                (agora, livres * 4)
+            ).fetchall()
+            reservadas = []
+            ocupacao = dict(por_host)
+            for linha in candidatas:
+                host = linha[2]
+                if len(reservadas) >= livres or ocupacao.get(host, 0) >= self.max_por_host:
+                    continue
+                ocupacao[host] = ocupacao.get(host, 0) + 1
+                reservadas.append(linha)
+            conn.executemany(
+                "UPDATE notificacoes SET status = 'enviando', iniciado_em = ?, tentativas = tentativas + 1 WHERE id = ?",
+                [(agora, linha[0]) for linha in reservadas]
+            )
+            conn.execute('COMMIT')
+            return reservadas
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    async def _entregar(self, cliente, conn, linha):
+        notificacao_id, url, host, corpo, tentativas = linha
+        tentativas += 1
+        corpo = corpo.encode('utf-8')
+        status = None
+        erro = None
+        inicio = time.perf_counter()
+        try:
+            resposta = await cliente.post(url, content=corpo, headers={
+                'Content-Type': 'application/json',
+                'X-Notificacao-Id': notificacao_id,
+                # Assinado a cada tentativa: o timestamp não envelhece nas retentativas
+                'X-Notificacao-Assinatura': assinatura.assinar(corpo, self.segredo)
+            })
+            status = resposta.status_code
+            if status >= 300:
+                erro = f'status {status}'
+        except httpx.HTTPError as e:
+            erro = f'{e.__class__.__name__}: {str(e)}'
+        finally:
+            tempo_notificacoes.observar(time.perf_counter() - inicio, host=host, status=str(status or 'erro'))
+
+        agora = time.time()
+        if erro is None:
+            entregas_notificacoes.incrementar(host=host, resultado='entregue')
+            conn.execute(
+                "UPDATE notificacoes SET status = 'entregue', entregue_em = ?, ultimo_status = ?, erro = NULL WHERE id = ?",
+                (agora, status, notificacao_id)
+            )
+            return
+
+        definitivo = status is not None and 400 <= status < 500 and status not in STATUS_REPETIR
+        if definitivo or tentativas >= self.max_tentativas:
+            entregas_notificacoes.incrementar(host=host, resultado='falhou')
+            logger.error('Notificação %s para %s descartada após %d tentativa(s): %s', notificacao_id, host, tentativas, erro)
+            conn.execute(
+                "UPDATE notificacoes SET status = 'falhou', ultimo_status = ?, erro = ? WHERE id = ?",
+                (status, erro, notificacao_id)
+            )
+            return
+
+        entregas_notificacoes.incrementar(host=host, resultado='repetir')
+        espera = min(ESPERA_INICIAL * 2 ** (tentativas - 1), ESPERA_MAXIMA) * (0.5 + random.random() / 2)
+        logger.info('Notificação %s para %s falhou (%s), nova tentativa em %.0fs', notificacao_id, host, erro, espera)
+        conn.execute(
+            "UPDATE notificacoes SET status = 'pendente', disponivel_em = ?, ultimo_status = ?, erro = ? WHERE id = ?",
+            (agora + espera, status, erro, notificacao_id)
+        )
+
+    def _limpar(self, conn):
+        conn.execute(
+            "DELETE FROM notificacoes WHERE status = 'entregue' AND entregue_em < ?", (time.time() - self.retencao,)
+        )
+
+    async def _executar(self):
+        self._loop = asyncio.get_running_loop()
+        self._novo = asyncio.Event()
+        conn = self._conn()
+        por_host = {}
+        tarefas = set()
+        ultima_limpeza = 0.0
+
+        def concluida(tarefa, host):
+            tarefas.discard(tarefa)
+            por_host[host] -= 1
+            self._novo.set()
+            if not tarefa.cancelled() and tarefa.exception() is not None:
+                # A notificação continua como 'enviando' e volta para a fila após o lease
+                logger.warning('Falha ao atualizar notificação na fila: %s', str(tarefa.exception()))
+
+        limites = httpx.Limits(max_connections=self.concorrencia, max_keepalive_connections=self.concorrencia)
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout, limits=limites) as cliente:
+                while not self._parar.is_set():
+                    self._novo.clear()
+                    if time.monotonic() - ultima_limpeza > INTERVALO_LIMPEZA:
+                        self._limpar(conn)
+                        ultima_limpeza = time.monotonic()
+
+                    livres = self.concorrencia - len(tarefas)
+                    linhas = []
+                    if livres > 0:
+                        try:
+                            linhas = self._reservar(conn, livres, por_host)
+                        except sqlite3.OperationalError as e:
+                            logger.warning('Fila de notificações ocupada: %s', str(e))
+                    for linha in linhas:
+                        host = linha[2]
+                        por_host[host] = por_host.get(host, 0) + 1
+                        tarefa = asyncio.ensure_future(self._entregar(cliente, conn, linha))
+                        tarefas.add(tarefa)
+                        tarefa.add_done_callback(lambda t, host=host: concluida(t, host))
+                    if not linhas:
+                        try:
+                            await asyncio.wait_for(self._novo.wait(), INTERVALO_OCIOSO)
+                        except asyncio.TimeoutError:
+                            pass
+                # Entregas em andamento terminam; o que não terminar volta para a fila após o lease
+                if tarefas:
+                    await asyncio.wait(tarefas, timeout=self.timeout)
+        finally:
+            self._loop = None
+
+    def iniciar(self):
+        if not self.ativa or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock_inicio:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            # Threads não sobrevivem ao fork: num processo filho a thread é recriada
+            self._criar_tabela()
+            self._parar.clear()
+            thread = threading.Thread(
+                target=lambda: asyncio.run(self._executar()), name='notificacoes', daemon=True
+            )
+            thread.start()
+            self._thread = thread
+            self._pid = os.getpid()
+        logger.info('Entrega de notificações iniciada (%s)', self.caminho)
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        self._acordar()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def listar_falhas(self, limite=100):
+        cursor = self._conn().execute(
+            "SELECT id, url, tipo, tentativas, criado_em, ultimo_status, erro FROM notificacoes "
+            "WHERE status = 'falhou' ORDER BY criado_em DESC LIMIT ?", (limite,)
+        )
+        colunas = [coluna[0] for coluna in cursor.description]
+        return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+
+    def reenviar(self, notificacao_id):
+        """Volta uma notificação que falhou para a fila, com as tentativas zeradas; False se não existir."""
+        alteradas = self._conn().execute(
+            "UPDATE notificacoes SET status = 'pendente', tentativas = 0, disponivel_em = ? "
+            "WHERE id = ? AND status = 'falhou'", (time.time(), notificacao_id)
+        ).rowcount
+        self._acordar()
+        return alteradas > 0
+
+    def metricas(self):
+        conn = self._conn()
+        contagens = dict(conn.execute('SELECT status, COUNT(*) FROM notificacoes GROUP BY status').fetchall())
+        mais_antiga = conn.execute(
+            "SELECT MIN(criado_em) FROM notificacoes WHERE status IN ('pendente', 'enviando')"
+        ).fetchone()[0]
+        return {
+            'pendentes': contagens.get('pendente', 0) + contagens.get('enviando', 0),
+            'falhas': contagens.get('falhou', 0),
+            'entregues': contagens.get('entregue', 0),
+            'lag_segundos': round(time.time() - mais_antiga, 3) if mais_antiga else 0.0
+        }
+
+
+notificacoes = Notificacoes(
+    NOTIFICACOES_PATH,
+    NOTIFICACOES_SEGREDO,
+    destinos=_destinos(NOTIFICACOES_DESTINOS),
+    hosts_permitidos=[host.strip() for host in NOTIFICACOES_HOSTS_PERMITIDOS.split(',') if host.strip()],
+    concorrencia=NOTIFICACOES_CONCORRENCIA,
+    max_por_host=NOTIFICACOES_MAX_POR_HOST,
+    max_tentativas=NOTIFICACOES_MAX_TENTATIVAS,
+    timeout=NOTIFICACOES_TIMEOUT,
+    retencao=NOTIFICACOES_RETENCAO
+)
+
+
+def notificar(endpoint, tipo, event, dados, url=None):
+    """Enfileira a notificação de um pagamento aplicado; uma falha aqui não afeta o webhook."""
+    try:
+        return notificacoes.enfileirar(endpoint, tipo, event, dados, url)
+    except Exception as e:
+        logger.warning("Falha ao enfileirar notificação do evento %s: %s", event.get('id'), str(e))
+        return None
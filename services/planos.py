@@ -0,0 +1,84 @@
+import hashlib
+import logging
+import random
+import time
+from datetime import datetime
+
+from google.api_core.exceptions import Aborted
+from firebase_admin import firestore
+
+from config import PLANOS_MAX_TENTATIVAS
+from services.firebase import medir_firestore
+
+logger = logging.getLogger(__name__)
+
+PLANO_ADICIONADO = 'adicionado'
+PLANO_EXISTENTE = 'existente'
+CLIENTE_NAO_ENCONTRADO = 'cliente_nao_encontrado'
+
+BACKOFF_INICIAL = 0.05
+BACKOFF_MAXIMO = 2.0
+
+
+def numero_nota(payment_intent):
+    """Número da nota derivado do PaymentIntent, igual em qualquer reenvio do evento."""
+    digest = hashlib.sha256(payment_intent.get('id', '').encode('utf-8')).hexdigest()
+    criado_em = payment_intent.get('created')
+    ano = datetime.fromtimestamp(criado_em).year if criado_em else datetime.now().year
+    return f"INV-{int(digest[:8], 16) % 9000 + 1000}-{ano}"
+
+
+def montar_plano(payment_intent, metadata):
+    return {
+        'servicoId': metadata.get('projeto_id'),
+        'servicoNome': metadata.get('projeto_titulo'),
+        'titulo': metadata.get('plano_titulo'),
+        'tipo': 'unico',
+        'dataAdesao': metadata.get('data_compra'),
+        'status': 'ativo',
+        'downloadLink': metadata.get('download_link', ''),
+        'valor': metadata.get('valor_plano'),
+        'numeroNota': numero_nota(payment_intent),
+        'paymentIntentId': payment_intent.get('id'),
+        'valorPago': payment_intent.get('amount') / 100  # Converte de centavos para reais
+    }
+
+
+@firestore.transactional
+def _adicionar_na_transacao(transaction, cliente_ref, plano):
+    cliente_doc = cliente_ref.get(transaction=transaction)
+    if not cliente_doc.exists:
+        return CLIENTE_NAO_ENCONTRADO
+
+    planos = (cliente_doc.to_dict() or {}).get('planos', [])
+    if any(p.get('servicoId') == plano['servicoId'] for p in planos):
+        return PLANO_EXISTENTE
+
+    transaction.update(cliente_ref, {'planos': firestore.ArrayUnion([plano])})
+    return PLANO_ADICIONADO
+
+
+@medir_firestore('adicionar_plano')
+def adicionar_plano(db, cliente_id, plano, max_tentativas=None):
+    """Adiciona o plano ao cliente se ainda não houver um com o mesmo servicoId.
+
+    A leitura e a escrita acontecem numa transação, então compras simultâneas
+    e reenvios do mesmo evento não sobrescrevem nem duplicam planos. Em caso de
+    contenção a transação é repetida com backoff exponencial e jitter.
+    """
+    max_tentativas = max_tentativas or PLANOS_MAX_TENTATIVAS
+    cliente_ref = db.collection('clientes').document(cliente_id)
+
+    for tentativa in range(1, max_tentativas + 1):
+        try:
+            return _adicionar_na_transacao(db.transaction(max_attempts=1), cliente_ref, plano)
+        except ValueError as e:
+            # transactional() embrulha o Aborted da última tentativa em ValueError
+            if not isinstance(e.__cause__, Aborted) or tentativa == max_tentativas:
+                raise
+        except Aborted:
+            if tentativa == max_tentativas:
+                raise
+        espera = min(BACKOFF_MAXIMO, BACKOFF_INICIAL * 2 ** (tentativa - 1))
+        logger.info('Contenção ao adicionar plano do cliente %s, tentativa %d', cliente_id, tentativa)
+        time.sleep(random.uniform(0, espera))
@@ -0,0 +1,347 @@
+"""Reconciliação dos pagamentos do Stripe com o Firestore.
+
+Uso:
+    python -m services.reconciliar [--desde 2025-01-01] [--ate 2025-02-01] [--janela 24] [--dry-run]
+    python -m services.reconciliar --conta marca_b   # outra conta de STRIPE_CONTAS, com checkpoint próprio
+
+Lista os PaymentIntents pagos de cada janela de tempo (auto-paginação do
+Stripe) e confere, em lote, se o Firestore reflete o pagamento:
+
+- mensalidade (metadata fatura_id + cliente_id): fatura com status 'pago'
+- opencode (tipo_pagamento 'opencode'): plano com servicoId = projeto_id no cliente
+- software_personalizado (projectId + projectName): projetos com status_pagamento 'Pago'
+
+Os documentos são lidos com get_all e as correções gravadas em batches. Se um
+cliente mudou entre a leitura e a escrita, as correções daquele batch são
+refeitas uma a uma pelas mesmas funções dos webhooks. Ao fim de cada janela
+o checkpoint (maior `created` já conferido) é gravado, então a próxima execução
+continua de onde esta parou.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from firebase_admin import firestore
+
+from services.contas_stripe import contas, ContaDesconhecida, CONTA_PADRAO
+from services.faturas import atualizar_fatura, ler_faturas_migradas, listar_faturas
+from services.firebase import ler_em_lote
+from services.planos import adicionar_plano, montar_plano
+from services.software_indice import (
+    COLECAO_INDICE, atualizar_projetos, chave_projeto, consultar_projetos, indexar
+)
+
+# Limite de escritas de um batch do Firestore
+MAX_ESCRITAS_BATCH = 500
+PAGINA_STRIPE = 100
+
+# Pagamentos mais novos que isso ainda podem ter o webhook a caminho
+MARGEM_SEGUNDOS = 15 * 60
+CHECKPOINT_PADRAO = 'reconciliacao.json'
+
+
+def ler_checkpoint(caminho):
+    try:
+        with open(caminho) as arquivo:
+            return json.load(arquivo).get('created')
+    except FileNotFoundError:
+        return None
+
+
+def gravar_checkpoint(caminho, created):
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w') as arquivo:
+        json.dump({'created': created, 'gravado_em': datetime.now().isoformat()}, arquivo)
+    os.replace(temporario, caminho)
+
+
+def listar_pagamentos(inicio, fim, conta):
+    """PaymentIntents pagos da conta criados em [inicio, fim), com a última charge expandida."""
+    pagina = conta.cliente.payment_intents.list(params={
+        'created': {'gte': int(inicio), 'lt': int(fim)},
+        'limit': PAGINA_STRIPE,
+        'expand': ['data.latest_charge']
+    })
+    for payment_intent in pagina.auto_paging_iter():
+        if payment_intent.status == 'succeeded':
+            yield payment_intent
+
+
+def classificar(payment_intent):
+    """(tipo, metadata) do pagamento, ou (None, metadata) se não for de nenhum webhook."""
+    metadata = dict(payment_intent.metadata or {})
+    if metadata.get('tipo_pagamento') == 'opencode' and metadata.get('projeto_id') and metadata.get('cliente_id'):
+        return 'opencode', metadata
+    if metadata.get('fatura_id') and metadata.get('cliente_id'):
+        return 'mensalidade', metadata
+    if metadata.get('projectId') and metadata.get('projectName'):
+        return 'software_personalizado', metadata
+    return None, metadata
+
+
+def _pago_em(payment_intent):
+    charge = payment_intent.get('latest_charge')
+    criado_em = charge.get('created') if isinstance(charge, dict) else None
+    return datetime.fromtimestamp(criado_em or payment_intent.created)
+
+
+class Correcao:
+    """Uma escrita do batch e como refazê-la sozinha se o batch falhar."""
+
+    def __init__(self, ref, dados, refazer, option=None):
+        self.ref = ref
+        self.dados = dados
+        self.refazer = refazer
+        self.option = option
+
+
+def comparar(db, pagamentos, resumo):
+    """Lê o Firestore dos pagamentos em lote e retorna as correções necessárias."""
+    clientes = db.collection('clientes')
+    por_tipo = {'mensalidade': [], 'opencode': [], 'software_personalizado': []}
+    for payment_intent in pagamentos:
+        tipo, metadata = classificar(payment_intent)
+        if tipo is None:
+            resumo['ignorados'] += 1
+        else:
+            por_tipo[tipo].append((payment_intent, metadata))
+
+    # Documentos dos clientes, indexados pelo caminho
+    cliente_ids = {m['cliente_id'] for _, m in por_tipo['mensalidade'] + por_tipo['opencode']}
+    docs = ler_em_lote(db, [clientes.document(cliente_id) for cliente_id in cliente_ids])
+    cliente = {cliente_id: docs.get(clientes.document(cliente_id).path) for cliente_id in cliente_ids}
+
+    # Faturas dos clientes já migrados para a subcoleção
+    faturas_sub = ler_faturas_migradas(
+        db, cliente, [(m['cliente_id'], m['fatura_id']) for _, m in por_tipo['mensalidade']]
+    )
+
+    # Alterações no documento de cada cliente (array de faturas e planos), numa escrita só
+    alteracoes = {}
+    correcoes = []
+
+    for payment_intent, metadata in por_tipo['mensalidade']:
+        cliente_id, fatura_id = metadata['cliente_id'], metadata['fatura_id']
+        dados = {
+            'status': 'pago',
+            'dataPagamento': _pago_em(payment_intent).strftime('%d/%m/%Y'),
+            'paymentIntentId': payment_intent.id,
+            'valorPago': payment_intent.amount / 100
+        }
+        doc = cliente[cliente_id]
+        if doc is None or not doc.exists:
+            resumo['nao_encontrados'] += 1
+            continue
+        if (cliente_id, fatura_id) in faturas_sub:
+            fatura = faturas_sub[(cliente_id, fatura_id)]
+            if fatura is None:
+                resumo['nao_encontrados'] += 1
+            elif (fatura.to_dict() or {}).get('status') != 'pago':
+                correcoes.append(Correcao(
+                    fatura.reference, dados,
+                    lambda c=cliente_id, f=fatura_id, d=dados: atualizar_fatura(db, c, f, d)
+                ))
+            else:
+                resumo['conferidos'] += 1
+            continue
+
+        alteracao = alteracoes.setdefault(cliente_id, {'doc': doc, 'faturas': None, 'planos': [], 'refazer': []})
+        faturas = alteracao['faturas'] or [dict(f) for f in listar_faturas(db, cliente_id, doc.to_dict() or {})]
+        fatura = next((f for f in faturas if f.get('id') == fatura_id), None)
+        if fatura is None:
+            resumo['nao_encontrados'] += 1
+        elif fatura.get('status') != 'pago':
+            fatura.update(dados)
+            alteracao['faturas'] = faturas
+            alteracao['refazer'].append(lambda c=cliente_id, f=fatura_id, d=dados: atualizar_fatura(db, c, f, d))
+        else:
+            resumo['conferidos'] += 1
+
+    for payment_intent, metadata in por_tipo['opencode']:
+        cliente_id = metadata['cliente_id']
+        doc = cliente[cliente_id]
+        if doc is None or not doc.exists:
+            resumo['nao_encontrados'] += 1
+            continue
+        planos = (doc.to_dict() or {}).get('planos', [])
+        if any(p.get('servicoId') == metadata['projeto_id'] for p in planos):
+            resumo['conferidos'] += 1
+            continue
+        plano = montar_plano(payment_intent, metadata)
+        alteracao = alteracoes.setdefault(cliente_id, {'doc': doc, 'faturas': None, 'planos': [], 'refazer': []})
+        if any(p['servicoId'] == plano['servicoId'] for p in alteracao['planos']):
+            continue
+        alteracao['planos'].append(plano)
+        alteracao['refazer'].append(lambda c=cliente_id, p=plano: adicionar_plano(db, c, p))
+
+    for cliente_id, alteracao in alteracoes.items():
+        dados = {}
+        if alteracao['faturas'] is not None:
+            dados['faturas'] = alteracao['faturas']
+        if alteracao['planos']:
+            dados['planos'] = firestore.ArrayUnion(alteracao['planos'])
+        if not dados:
+            continue
+
+        def refazer(funcoes=alteracao['refazer']):
+            for funcao in funcoes:
+                funcao()
+        # Só grava se o cliente não mudou desde a leitura; senão refaz pelo caminho dos webhooks
+        correcoes.append(Correcao(
+            alteracao['doc'].reference, dados, refazer,
+            option=db.write_option(last_update_time=alteracao['doc'].update_time)
+        ))
+
+    correcoes += _comparar_software(db, por_tipo['software_personalizado'], resumo)
+    return correcoes
+
+
+def _comparar_software(db, pagamentos, resumo):
+    indices = ler_em_lote(db, [
+        db.collection(COLECAO_INDICE).document(chave_projeto(m['projectId'], m['projectName']))
+        for _, m in pagamentos
+    ])
+    # A consulta é a fonte da verdade aqui (fora do caminho dos webhooks): uma por par,
+    # e o índice do par é regravado se não bater com ela
+    projetos = {}
+    correcoes = []
+    for _, metadata in pagamentos:
+        par = (metadata['projectId'], metadata['projectName'])
+        if par in projetos:
+            continue
+        projetos[par] = consultar_projetos(db, *par)
+        indice = indices.get(db.collection(COLECAO_INDICE).document(chave_projeto(*par)).path)
+        doc_ids = (indice.to_dict() or {}).get('docIds', []) if indice and indice.exists else []
+        encontrados = [doc.id for doc in projetos[par]]
+        if set(doc_ids) != set(encontrados):
+            correcoes.append(Correcao(None, None, lambda p=par, ids=encontrados:
+                                      indexar(db, *p, ids, substituir=True)))
+
+    for payment_intent, metadata in pagamentos:
+        dados = {
+            'status_pagamento': 'Pago',
+            'data_pagamento': _pago_em(payment_intent).isoformat(),
+            'paymentIntentId': payment_intent.id,
+            'valorPago': payment_intent.amount / 100
+        }
+        docs = projetos[(metadata['projectId'], metadata['projectName'])]
+        if not docs:
+            resumo['nao_encontrados'] += 1
+            continue
+        refazer = (lambda c=metadata['projectId'], n=metadata['projectName'], d=dados:
+                   atualizar_projetos(db, c, n, d))
+        pendentes = [doc for doc in docs if (doc.to_dict() or {}).get('status_pagamento') != 'Pago']
+        if not pendentes:
+            resumo['conferidos'] += 1
+        for doc in pendentes:
+            correcoes.append(Correcao(doc.reference, dados, refazer))
+    return correcoes
+
+
+def aplicar(db, correcoes, resumo):
+    """Grava as correções em batches; um batch rejeitado é refeito item a item."""
+    individuais = [c for c in correcoes if c.ref is None]
+    em_lote = [c for c in correcoes if c.ref is not None]
+
+    for inicio in range(0, len(em_lote), MAX_ESCRITAS_BATCH):
+        bloco = em_lote[inicio:inicio + MAX_ESCRITAS_BATCH]
+        batch = db.batch()
+        for correcao in bloco:
+            if correcao.option is not None:
+                batch.update(correcao.ref, correcao.dados, option=correcao.option)
+            else:
+                batch.update(correcao.ref, correcao.dados)
+        try:
+            batch.commit()
+            resumo['corrigidos'] += len(bloco)
+        except (FailedPrecondition, NotFound) as e:
+            print(f"Batch rejeitado ({type(e).__name__}), refazendo {len(bloco)} correção(ões) uma a uma")
+            individuais += bloco
+
+    # Várias correções de um mesmo projeto compartilham a função: roda uma vez só
+    for refazer in {id(c.refazer): c.refazer for c in individuais}.values():
+        try:
+            refazer()
+            resumo['corrigidos'] += 1
+        except Exception as e:
+            resumo['falhas'] += 1
+            print(f"❌ Correção não aplicada: {type(e).__name__}: {e}")
+
+
+def reconciliar(db, desde, ate, janela=24 * 3600, lote=500, checkpoint=None, dry_run=False, conta=None):
+    conta = conta or contas.padrao
+    resumo = {'pagamentos': 0, 'conferidos': 0, 'corrigidos': 0, 'nao_encontrados': 0,
+              'ignorados': 0, 'falhas': 0, 'divergentes': 0}
+    inicio = desde
+    while inicio < ate:
+        fim = min(inicio + janela, ate)
+        pendentes = []
+
+        def processar(pagamentos):
+            correcoes = comparar(db, pagamentos, resumo)
+            resumo['divergentes'] += len(correcoes)
+            if correcoes and not dry_run:
+                aplicar(db, correcoes, resumo)
+
+        for payment_intent in listar_pagamentos(inicio, fim, conta):
+            resumo['pagamentos'] += 1
+            pendentes.append(payment_intent)
+            if len(pendentes) >= lote:
+                processar(pendentes)
+                pendentes = []
+        if pendentes:
+            processar(pendentes)
+
+        if checkpoint and not dry_run and resumo['falhas'] == 0:
+            gravar_checkpoint(checkpoint, fim)
+        print(f"Janela {datetime.fromtimestamp(inicio):%Y-%m-%d %H:%M} → {datetime.fromtimestamp(fim):%Y-%m-%d %H:%M}: "
+              f"{resumo['pagamentos']} pagamento(s), {resumo['divergentes']} divergência(s) até aqui")
+        inicio = fim
+
+    acao = 'a corrigir' if dry_run else 'corrigidas'
+    print(f"=== {resumo['pagamentos']} pagamento(s): {resumo['conferidos']} em dia, "
+          f"{resumo['divergentes']} divergência(s) {acao}, {resumo['nao_encontrados']} sem documento, "
+          f"{resumo['ignorados']} sem metadata conhecida, {resumo['falhas']} falha(s) ===")
+    return resumo
+
+
+def _data(valor):
+    return datetime.fromisoformat(valor).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcilia os pagamentos do Stripe com o Firestore')
+    parser.add_argument('--desde', help='AAAA-MM-DD[THH:MM]; padrão: o checkpoint, ou 7 dias atrás')
+    parser.add_argument('--ate', help=f'AAAA-MM-DD[THH:MM]; padrão: agora menos {MARGEM_SEGUNDOS // 60} minutos')
+    parser.add_argument('--janela', type=float, default=24, help='Horas por janela (um checkpoint por janela)')
+    parser.add_argument('--lote', type=int, default=500, help='Pagamentos comparados por leitura em lote')
+    parser.add_argument('--checkpoint', help=f'Arquivo do checkpoint; padrão: {CHECKPOINT_PADRAO} (um por conta)')
+    parser.add_argument('--dry-run', action='store_true', help='Só conta as divergências')
+    parser.add_argument('--conta', help='Conta Stripe (STRIPE_CONTAS); padrão: a conta principal')
+    args = parser.parse_args()
+
+    try:
+        conta = contas.obter(args.conta)
+    except ContaDesconhecida as e:
+        print(f"❌ {e}")
+        raise SystemExit(2)
+    if not args.checkpoint:
+        args.checkpoint = CHECKPOINT_PADRAO if conta.nome == CONTA_PADRAO else f'reconciliacao-{conta.nome}.json'
+
+    desde = _data(args.desde) if args.desde else ler_checkpoint(args.checkpoint)
+    if desde is None:
+        desde = (datetime.now() - timedelta(days=7)).timestamp()
+    ate = _data(args.ate) if args.ate else time.time() - MARGEM_SEGUNDOS
+
+    from services.firebase import inicializar_firestore
+    db = inicializar_firestore()
+    resumo = reconciliar(db, desde, ate, janela=args.janela * 3600, lote=args.lote,
+                         checkpoint=args.checkpoint, dry_run=args.dry_run, conta=conta)
+    raise SystemExit(1 if resumo['falhas'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # backend rápido é opcional
+    orjson = None
+
+_AUSENTE = object()
+
+
+def _padrao(obj):
+    # Mesmas conversões do provedor JSON padrão do Flask
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Objeto do tipo {type(obj).__name__} não é serializável em JSON')
+
+
+if orjson is not None:
+    # Datas passam por _padrao para manter o formato das respostas do Flask
+    _OPCOES = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj):
+        """Codifica em JSON compacto, UTF-8, já em bytes."""
+        return orjson.dumps(obj, default=_padrao, option=_OPCOES)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """Codifica em JSON compacto, UTF-8, já em bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_padrao).encode('utf-8')
+
+    loads = json.loads
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+class FragmentosConstantes:
+    """Pares chave/valor que se repetem em toda resposta, codificados uma única vez.
+
+    Um par só é aproveitado quando o dicionário da resposta tem exatamente o
+    objeto registrado (`is`), então respostas vindas do Redis ou montadas de
+    outro jeito continuam corretas, apenas sem o atalho.
+    """
+
+    def __init__(self):
+        self._pares = {}
+
+    def registrar(self, chave, valor):
+        """Registra o valor constante de `chave` e o retorna, para ser usado na montagem das respostas."""
+        self._pares[chave] = (valor, dumps(chave) + b':' + dumps(valor))
+        return valor
+
+    def codificar(self, dados):
+        if type(dados) is not dict or not self._pares:
+            return dumps(dados)
+        constantes = [
+            chave for chave, (valor, _) in self._pares.items() if dados.get(chave, _AUSENTE) is valor
+        ]
+        if not constantes:
+            return dumps(dados)
+
+        fragmento = b','.join(self._pares[chave][1] for chave in constantes)
+        variaveis = {chave: valor for chave, valor in dados.items() if chave not in constantes}
+        if not variaveis:
+            return b'{' + fragmento + b'}'
+        # Só a parte variável é codificada; o fragmento entra no lugar do "}" final
+        return dumps(variaveis)[:-1] + b',' + fragmento + b'}'
+
+
+fragmentos = FragmentosConstantes()
+
+
+def dumps_resposta(dados):
+    """Corpo de uma resposta JSON, reaproveitando os fragmentos constantes registrados."""
+    return fragmentos.codificar(dados)
+
+
+class ProvedorJSON(JSONProvider):
+    """`jsonify` e `request.get_json` pelo backend daqui, com os fragmentos constantes."""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_resposta(obj), mimetype=self.mimetype)
+
+
+def init_serializacao(app):
+    app.json = ProvedorJSON(app)
@@ -0,0 +1,97 @@
+import hashlib
+import logging
+
+from google.api_core.exceptions import NotFound
+from firebase_admin import firestore
+
+from services.firebase import medir_firestore
+
+COLECAO_INDICE = 'software_personalizado_indice'
+MAX_ESCRITAS_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+
+def chave_projeto(cliente_id, nome_projeto):
+    """Id determinístico do documento de índice para o par (clienteId, nomeProjeto)."""
+    return hashlib.sha256(f'{cliente_id}\x1f{nome_projeto}'.encode('utf-8')).hexdigest()
+
+
+def consultar_projetos(db, cliente_id, nome_projeto):
+    """Projetos do par pela consulta composta (sem o índice)."""
+    return db.collection('software_personalizado').where(
+        field_path='clienteId',
+        op_string='==',
+        value=cliente_id
+    ).where(
+        field_path='nomeProjeto',
+        op_string='==',
+        value=nome_projeto
+    ).get()
+
+
+def indexar(db, cliente_id, nome_projeto, doc_ids, batch=None, substituir=False):
+    """Grava os ids do par no índice: acrescenta (ArrayUnion) ou, com `substituir`, troca a lista inteira."""
+    ref = db.collection(COLECAO_INDICE).document(chave_projeto(cliente_id, nome_projeto))
+    dados = {
+        'clienteId': cliente_id,
+        'nomeProjeto': nome_projeto,
+        'docIds': list(doc_ids) if substituir else firestore.ArrayUnion(list(doc_ids))
+    }
+    if batch is not None:
+        batch.set(ref, dados, merge=not substituir)
+    else:
+        ref.set(dados, merge=not substituir)
+
+
+def criar_projeto(db, dados, doc_id=None):
+    """Cria um projeto já indexado: o documento e a entrada do índice vão no mesmo batch.
+
+    É assim que projetos novos devem ser gravados; os criados por fora entram
+    no índice pelo backfill (services.indexar_software) ou pela reconciliação.
+    """
+    colecao = db.collection('software_personalizado')
+    ref = colecao.document(doc_id) if doc_id else colecao.document()
+    batch = db.batch()
+    batch.create(ref, dados)
+    indexar(db, dados['clienteId'], dados['nomeProjeto'], [ref.id], batch=batch)
+    batch.commit()
+    return ref
+
+
+def _atualizar_em_lote(db, refs, dados):
+    for inicio in range(0, len(refs), MAX_ESCRITAS_BATCH):
+        batch = db.batch()
+        for ref in refs[inicio:inicio + MAX_ESCRITAS_BATCH]:
+            batch.update(ref, dados)
+        batch.commit()
+
+
+@medir_firestore('atualizar_projetos')
+def atualizar_projetos(db, cliente_id, nome_projeto, dados):
+    """Aplica os campos em todos os projetos do par (clienteId, nomeProjeto).
+
+    Caminho normal: uma leitura do índice e um batch de escrita. O índice é
+    mantido por criar_projeto, pelo backfill e pela reconciliação; só se ele
+    não existir ou apontar para um documento removido usa a consulta composta
+    e regrava o índice. Retorna quantos projetos foram atualizados.
+    """
+    indice_doc = db.collection(COLECAO_INDICE).document(chave_projeto(cliente_id, nome_projeto)).get()
+    doc_ids = (indice_doc.to_dict() or {}).get('docIds', []) if indice_doc.exists else []
+
+    if doc_ids:
+        refs = [db.collection('software_personalizado').document(doc_id) for doc_id in doc_ids]
+        try:
+            _atualizar_em_lote(db, refs, dados)
+            return len(refs)
+        except NotFound:
+            logger.warning('Índice desatualizado para %s/%s, refazendo', cliente_id, nome_projeto)
+    else:
+        logger.info('Índice não encontrado para %s/%s, usando consulta', cliente_id, nome_projeto)
+
+    refs = [doc.reference for doc in consultar_projetos(db, cliente_id, nome_projeto)]
+    if refs:
+        _atualizar_em_lote(db, refs, dados)
+    if refs or doc_ids:
+        indexar(db, cliente_id, nome_projeto, [ref.id for ref in refs], substituir=True)
+    return len(refs)
@@ -0,0 +1,37 @@
+import os
+import sqlite3
+import threading
+
+
+def conectar(caminho):
+    """Conexão SQLite em autocommit (transações com BEGIN explícito), WAL e synchronous=NORMAL."""
+    conn = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class ConexaoPorThread:
+    """Uma conexão por thread, aberta no primeiro uso e reaberta em processos filhos.
+
+    Conexões SQLite não podem ser herdadas por fork: depois dele o processo
+    filho descarta as do pai e abre as suas.
+    """
+
+    def __init__(self, caminho, row_factory=None):
+        self.caminho = caminho
+        self.row_factory = row_factory
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def obter(self):
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = conectar(self.caminho)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            self._local.conn = conn
+        return conn
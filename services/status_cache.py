@@ -0,0 +1,148 @@
+import json
+import logging
+from datetime import datetime
+
+from config import (
+    STATUS_CACHE_TTL,
+    STATUS_CACHE_TTL_PAGO,
+    STATUS_CACHE_MAX_ITENS,
+    STATUS_CACHE_REDIS_URL,
+    STATUS_CACHE_TTL_OBSOLETO,
+)
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:  # backend compartilhado é opcional
+    redis = None
+
+# Com backend compartilhado o cache local só absorve rajadas de polling,
+# para que a atualização feita por outro worker seja vista rapidamente
+TTL_LOCAL_COM_BACKEND = 2
+
+
+class RedisBackend:
+    def __init__(self, url, prefixo='status_boleto:'):
+        if redis is None:
+            raise RuntimeError("Pacote 'redis' não instalado, necessário para STATUS_CACHE_REDIS_URL")
+        self._cliente = redis.Redis.from_url(url)
+        self._prefixo = prefixo
+
+    def get(self, chave):
+        valor = self._cliente.get(self._prefixo + chave)
+        return json.loads(valor) if valor else None
+
+    def set(self, chave, valor, ttl):
+        self._cliente.setex(self._prefixo + chave, int(ttl), json.dumps(valor))
+
+    def delete(self, chave):
+        self._cliente.delete(self._prefixo + chave)
+
+
+class StatusCache:
+    """Cache de leitura do status de PaymentIntents, atualizado pelos webhooks.
+
+    Além da entrada com TTL curto, guarda o último status conhecido de cada
+    PaymentIntent por `ttl_obsoleto`, servido quando o Stripe está indisponível.
+    """
+
+    def __init__(self, ttl=60, ttl_pago=3600, max_itens=10000, backend=None, ttl_obsoleto=24 * 3600):
+        self.ttl = ttl
+        self.ttl_pago = ttl_pago
+        self.backend = backend
+        ttl_local = min(ttl, TTL_LOCAL_COM_BACKEND) if backend else ttl
+        self._local = TTLCache(max_itens=max_itens, ttl=ttl_local)
+        self._obsoletos = TTLCache(max_itens=max_itens, ttl=ttl_obsoleto)
+
+    def _ttl_para(self, dados):
+        return self.ttl_pago if dados.get('status') == 'succeeded' else self.ttl
+
+    def get(self, payment_intent_id):
+        dados = self._local.get(payment_intent_id)
+        if dados is not None or not self.backend:
+            return dados
+        try:
+            dados = self.backend.get(payment_intent_id)
+        except Exception as e:
+            logger.warning("Falha ao ler cache compartilhado: %s", str(e))
+            return None
+        if dados is not None:
+            self._local.set(payment_intent_id, dados)
+            self._obsoletos.set(payment_intent_id, dados)
+        return dados
+
+    def obsoleto(self, payment_intent_id):
+        """Último status conhecido, mesmo vencido ou invalidado; None se nunca visto por este processo."""
+        return self._obsoletos.get(payment_intent_id)
+
+    def set(self, payment_intent_id, dados):
+        ttl = self._ttl_para(dados)
+        # Só com backend compartilhado a cópia local é curta; sem ele, pagos ficam por ttl_pago
+        self._local.set(payment_intent_id, dados, ttl=min(ttl, self._local.ttl) if self.backend else ttl)
+        self._obsoletos.set(payment_intent_id, dados)
+        if self.backend:
+            try:
+                self.backend.set(payment_intent_id, dados, ttl)
+            except Exception as e:
+                logger.warning("Falha ao gravar cache compartilhado: %s", str(e))
+
+    def invalidar(self, payment_intent_id):
+        self._local.delete(payment_intent_id)
+        if self.backend:
+            try:
+                self.backend.delete(payment_intent_id)
+            except Exception as e:
+                logger.warning("Falha ao invalidar cache compartilhado: %s", str(e))
+
+    def aplicar_evento(self, event, chave=None):
+        """Atualiza ou invalida a entrada do PaymentIntent a partir de um evento payment_intent.*
+
+        `chave` é a entrada no cache (com o prefixo da conta); sem ela, o id do
+        PaymentIntent. Retorna o status novo quando a entrada foi atualizada, ou
+        None se foi invalidada.
+        """
+        tipo = event['type']
+        if not tipo.startswith('payment_intent.'):
+            return None
+
+        payment_intent = event['data']['object']
+        payment_intent_id = payment_intent.get('id')
+        if not payment_intent_id:
+            return None
+        chave = chave or payment_intent_id
+
+        dados = self.get(chave) if tipo == 'payment_intent.succeeded' else None
+        if dados is None:
+            self.invalidar(chave)
+            return None
+
+        # Usa a data da charge quando o evento a traz; senão a data do evento
+        charges = (payment_intent.get('charges') or {}).get('data') or []
+        aprovado_em = charges[0].get('created') if charges else None
+        aprovado_em = aprovado_em or event.get('created')
+
+        dados = dict(dados)
+        dados['status'] = 'succeeded'
+        if aprovado_em:
+            dados['data_aprovacao'] = datetime.fromtimestamp(aprovado_em).strftime('%Y-%m-%d %H:%M:%S')
+        dados['debug_info'] = {
+            **(dados.get('debug_info') or {}),
+            'payment_intent_status': 'succeeded',
+            'has_charges': True,
+            'charge_status': 'succeeded',
+            'is_paid': True
+        }
+        self.set(chave, dados)
+        logger.debug("Status em cache atualizado pelo webhook: %s", chave)
+        return dados
+
+
+status_cache = StatusCache(
+    ttl=STATUS_CACHE_TTL,
+    ttl_pago=STATUS_CACHE_TTL_PAGO,
+    max_itens=STATUS_CACHE_MAX_ITENS,
+    backend=RedisBackend(STATUS_CACHE_REDIS_URL) if STATUS_CACHE_REDIS_URL else None,
+    ttl_obsoleto=STATUS_CACHE_TTL_OBSOLETO
+)
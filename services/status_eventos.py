@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from config import STATUS_EVENTOS_REDIS_URL, SSE_MAX_CONEXOES
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:  # backend compartilhado é opcional
+    redis = None
+
+ESPERA_RECONEXAO_MAXIMA = 30
+
+
+class RedisPubSub:
+    """Repassa as mudanças de status entre workers por um canal do Redis."""
+
+    def __init__(self, url, canal='status_boleto_eventos'):
+        if redis is None:
+            raise RuntimeError("Pacote 'redis' não instalado, necessário para STATUS_EVENTOS_REDIS_URL")
+        self._cliente = redis.Redis.from_url(url)
+        self._canal = canal
+
+    def publicar(self, mensagem):
+        self._cliente.publish(self._canal, json.dumps(mensagem))
+
+    def escutar(self, entregar):
+        """Bloqueia lendo o canal e chama `entregar(mensagem)`; reconecta com backoff."""
+        espera = 1
+        while True:
+            try:
+                pubsub = self._cliente.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._canal)
+                espera = 1
+                for item in pubsub.listen():
+                    entregar(json.loads(item['data']))
+            except Exception as e:
+                logger.warning("Conexão com o pub/sub de status perdida: %s", str(e))
+                time.sleep(espera)
+                espera = min(espera * 2, ESPERA_RECONEXAO_MAXIMA)
+
+
+class Assinatura:
+    def __init__(self, boleto_id, entregar):
+        self.boleto_id = boleto_id
+        self.entregar = entregar
+
+
+class StatusHub:
+    """Fan-out em memória das mudanças de status dos boletos para as conexões SSE.
+
+    As assinaturas são por chave do boleto no cache de status (`conta.chave_cache`),
+    para eventos de uma conta não chegarem a quem acompanha outra. Cada
+    assinatura recebe `{'boleto_id', 'dados'}` pela função `entregar`, chamada
+    na thread de quem publica (ou na do pub/sub); `dados` é None quando o status
+    mudou mas não está em cache e precisa ser consultado de novo. Com backend, a
+    publicação passa pelo Redis para chegar às conexões de todos os workers.
+    """
+
+    def __init__(self, max_assinantes=1000, backend=None):
+        self.max_assinantes = max_assinantes
+        self.backend = backend
+        self._assinaturas = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _garantir_ouvinte(self):
+        # Uma thread por processo: workers criados por fork depois do import precisam da sua
+        if self.backend is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(
+            target=self.backend.escutar, args=(self._entregar,), name='status-eventos', daemon=True
+        ).start()
+
+    def inscrever(self, boleto_id, entregar):
+        """Retorna a Assinatura, ou None se o processo já atingiu o limite de conexões."""
+        self._garantir_ouvinte()
+        assinatura = Assinatura(boleto_id, entregar)
+        with self._lock:
+            if self._total >= self.max_assinantes:
+                return None
+            self._assinaturas.setdefault(boleto_id, set()).add(assinatura)
+            self._total += 1
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            assinaturas = self._assinaturas.get(assinatura.boleto_id)
+            if assinaturas is None or assinatura not in assinaturas:
+                return
+            assinaturas.discard(assinatura)
+            self._total -= 1
+            if not assinaturas:
+                del self._assinaturas[assinatura.boleto_id]
+
+    def publicar(self, boleto_id, dados=None):
+        mensagem = {'boleto_id': boleto_id, 'dados': dados}
+        if self.backend:
+            try:
+                self.backend.publicar(mensagem)
+                return
+            except Exception as e:
+                # Ao menos as conexões deste worker ficam sabendo
+                logger.warning("Falha ao publicar status no pub/sub: %s", str(e))
+        self._entregar(mensagem)
+
+    def _entregar(self, mensagem):
+        with self._lock:
+            assinaturas = list(self._assinaturas.get(mensagem.get('boleto_id'), ()))
+        for assinatura in assinaturas:
+            try:
+                assinatura.entregar(mensagem)
+            except Exception as e:
+                logger.warning("Falha ao entregar status do boleto %s: %s", assinatura.boleto_id, str(e))
+
+    def metricas(self):
+        with self._lock:
+            return {'conexoes': self._total, 'boletos': len(self._assinaturas)}
+
+
+status_hub = StatusHub(
+    max_assinantes=SSE_MAX_CONEXOES,
+    backend=RedisPubSub(STATUS_EVENTOS_REDIS_URL) if STATUS_EVENTOS_REDIS_URL else None
+)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from urllib.parse import quote
+
+import httpx
+import stripe
+
+from config import (
+    STRIPE_TIMEOUT_CONEXAO, STRIPE_TIMEOUT_LEITURA, STRIPE_MAX_RETRIES, STRIPE_ASYNC_POOL_MAX, STRIPE_API_BASE
+)
+from services.stripe_client import tempo_stripe, rota_metrica, reservar_taxa
+
+logger = logging.getLogger(__name__)
+
+# Mesmos limites de backoff da biblioteca do Stripe
+ESPERA_INICIAL = 0.5
+ESPERA_MAXIMA = 2
+MAX_RETRY_AFTER = 60
+
+
+def codificar(params, prefixo=None):
+    """Parâmetros no formato de formulário do Stripe (a[b][c]=v, lista[0]=v)."""
+    pares = []
+    for chave, valor in params.items():
+        nome = f'{prefixo}[{chave}]' if prefixo else chave
+        if valor is None:
+            continue
+        if isinstance(valor, dict):
+            pares.extend(codificar(valor, nome))
+        elif isinstance(valor, (list, tuple)):
+            for i, item in enumerate(valor):
+                if isinstance(item, dict):
+                    pares.extend(codificar(item, f'{nome}[{i}]'))
+                else:
+                    pares.append((f'{nome}[{i}]', _valor(item)))
+        else:
+            pares.append((nome, _valor(valor)))
+    return pares
+
+
+def _valor(valor):
+    if isinstance(valor, bool):
+        return 'true' if valor else 'false'
+    return str(valor)
+
+
+def _erro(resposta):
+    """Converte uma resposta de erro da API na exceção equivalente da biblioteca do Stripe."""
+    try:
+        corpo = resposta.json()
+    except ValueError:
+        corpo = {}
+    erro = corpo.get('error') or {}
+    mensagem = erro.get('message') or f'Erro {resposta.status_code} da API do Stripe'
+    detalhes = {
+        'http_body': resposta.text,
+        'http_status': resposta.status_code,
+        'json_body': corpo,
+        'headers': dict(resposta.headers)
+    }
+    status = resposta.status_code
+    if status == 429 or erro.get('code') == 'lock_timeout':
+        return stripe.error.RateLimitError(mensagem, code=erro.get('code'), **detalhes)
+    if erro.get('type') == 'idempotency_error':
+        return stripe.error.IdempotencyError(mensagem, code=erro.get('code'), **detalhes)
+    if status in (400, 404):
+        return stripe.error.InvalidRequestError(mensagem, erro.get('param'), erro.get('code'), **detalhes)
+    if status == 401:
+        return stripe.error.AuthenticationError(mensagem, code=erro.get('code'), **detalhes)
+    if status == 402:
+        return stripe.error.CardError(mensagem, erro.get('param'), erro.get('code'), **detalhes)
+    if status == 403:
+        return stripe.error.PermissionError(mensagem, code=erro.get('code'), **detalhes)
+    return stripe.error.APIError(mensagem, code=erro.get('code'), **detalhes)
+
+
+class StripeAsync:
+    """Chamadas à API REST do Stripe com httpx, para o modo ASGI.
+
+    Mesma política do cliente síncrono (services.stripe_client): pool de
+    conexões keep-alive, timeouts de conexão e leitura, retentativas com
+    backoff exponencial e jitter, latência registrada por tentativa e o mesmo
+    limite de taxa e disjuntor da conta.
+    """
+
+    def __init__(self, api_key, disjuntor, conta, stripe_account=None, taxa=None,
+                 max_network_retries=STRIPE_MAX_RETRIES, base=STRIPE_API_BASE):
+        self.api_key = api_key
+        self.taxa = taxa
+        self.disjuntor = disjuntor
+        self.conta = conta
+        self.stripe_account = stripe_account
+        self.max_network_retries = max_network_retries
+        self.base = base
+        self._cliente = None
+
+    @property
+    def cliente(self):
+        # Criado no primeiro uso, já dentro do event loop
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                base_url=self.base,
+                timeout=httpx.Timeout(STRIPE_TIMEOUT_LEITURA, connect=STRIPE_TIMEOUT_CONEXAO),
+                limits=httpx.Limits(
+                    max_connections=STRIPE_ASYNC_POOL_MAX, max_keepalive_connections=STRIPE_ASYNC_POOL_MAX
+                )
+            )
+        return self._cliente
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def _headers(self, metodo, idempotency_key):
+        if not self.api_key:
+            raise stripe.error.AuthenticationError('Chave secreta do Stripe não configurada')
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Stripe-Version': stripe.api_version,
+            'User-Agent': f'Stripe/v1 PythonBindings/{stripe.VERSION} httpx'
+        }
+        if self.stripe_account:
+            headers['Stripe-Account'] = self.stripe_account
+        if metodo == 'POST':
+            # POSTs repetidos precisam da mesma chave para não duplicar a operação
+            headers['Idempotency-Key'] = idempotency_key or str(uuid.uuid4())
+        return headers
+
+    def _deve_repetir(self, resposta, tentativa):
+        if tentativa > self.max_network_retries:
+            return False
+        if resposta is None:
+            return True
+        repetir = resposta.headers.get('stripe-should-retry')
+        if repetir is not None:
+            return repetir == 'true'
+        return resposta.status_code == 409 or resposta.status_code >= 500
+
+    def _espera(self, tentativa, resposta):
+        espera = min(ESPERA_INICIAL * 2 ** (tentativa - 1), ESPERA_MAXIMA)
+        espera = max(ESPERA_INICIAL, espera * 0.5 * (1 + random.random()))
+        try:
+            retry_after = float(resposta.headers.get('retry-after', 0)) if resposta is not None else 0
+        except ValueError:
+            retry_after = 0
+        if retry_after <= MAX_RETRY_AFTER:
+            espera = max(espera, retry_after)
+        return espera
+
+    async def requisitar(self, metodo, caminho, params=None, idempotency_key=None):
+        headers = self._headers(metodo, idempotency_key)
+        pares = codificar(params or {})
+        tentativa = 0
+        while True:
+            tentativa += 1
+            # A transação SQLite pode esperar o lock de outros workers: fora do event loop
+            espera = await asyncio.to_thread(reservar_taxa, self.taxa, self.conta) if self.taxa else 0
+            if espera:
+                await asyncio.sleep(espera)
+            sonda = self.disjuntor.admitir()
+            inicio = time.perf_counter()
+            resposta = None
+            status = 'erro'
+            falhou = None
+            try:
+                if metodo == 'GET':
+                    resposta = await self.cliente.get(caminho, params=pares, headers=headers)
+                else:
+                    resposta = await self.cliente.request(metodo, caminho, data=dict(pares), headers=headers)
+                status = resposta.status_code
+                falhou = status >= 500
+            except httpx.TransportError as e:
+                falhou = True
+                if not self._deve_repetir(None, tentativa):
+                    raise stripe.error.APIConnectionError(
+                        f'Erro de comunicação com o Stripe: {e.__class__.__name__}: {str(e)}'
+                    ) from e
+            finally:
+                # Cancelada (cliente desconectou) não conta nem como sucesso nem como falha
+                self.disjuntor.concluir(sonda, falhou)
+                tempo_stripe.observar(
+                    time.perf_counter() - inicio,
+                    conta=self.conta, metodo=metodo, rota=rota_metrica(caminho), status=str(status)
+                )
+
+            if resposta is not None and resposta.status_code < 400:
+                return resposta.json()
+            if resposta is not None and not self._deve_repetir(resposta, tentativa):
+                raise _erro(resposta)
+
+            espera = self._espera(tentativa, resposta)
+            logger.info('Repetindo %s %s em %.2fs (tentativa %d)', metodo, caminho, espera, tentativa)
+            await asyncio.sleep(espera)
+
+    async def criar_payment_intent(self, params, idempotency_key=None):
+        dados = await self.requisitar('POST', '/v1/payment_intents', params, idempotency_key)
+        return stripe.PaymentIntent.construct_from(dados, self.api_key)
+
+    async def obter_payment_intent(self, payment_intent_id, params=None):
+        dados = await self.requisitar('GET', f"/v1/payment_intents/{quote(payment_intent_id, safe='')}", params)
+        return stripe.PaymentIntent.construct_from(dados, self.api_key)
@@ -0,0 +1,99 @@
+import re
+import time
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+from config import (
+    STRIPE_TIMEOUT_CONEXAO, STRIPE_TIMEOUT_LEITURA, STRIPE_MAX_RETRIES, STRIPE_POOL_MAX, STRIPE_API_BASE
+)
+from services.limite import TaxaExcedida
+from services.metricas import registro
+
+tempo_stripe = registro.histograma(
+    'stripe_requisicao_segundos', 'Latência de cada tentativa de chamada à API do Stripe'
+)
+taxa_recusadas = registro.contador(
+    'stripe_taxa_recusadas_total', 'Chamadas ao Stripe recusadas por falta de folga no limite de requisições, por conta'
+)
+
+# /v1/payment_intents/pi_123 -> /v1/payment_intents/{id}: poucas séries no histograma
+_ID_REGEX = re.compile(r'/[a-z]+_(?=[a-z]*[A-Z0-9])[A-Za-z0-9]+(?=/|$)')
+
+
+def rota_metrica(url):
+    return _ID_REGEX.sub('/{id}', requests.utils.urlparse(url).path)
+
+
+def reservar_taxa(taxa, conta):
+    """Reserva uma requisição no limite da conta; retorna quantos segundos esperar antes de fazê-la."""
+    if taxa is None:
+        return 0
+    try:
+        return taxa.reservar()
+    except TaxaExcedida:
+        taxa_recusadas.incrementar(conta=conta)
+        raise
+
+
+class ClienteHTTPMedido(stripe.RequestsClient):
+    """RequestsClient que registra a latência de cada tentativa (as retentativas também contam).
+
+    Cada tentativa consome uma requisição do limite de taxa da conta (esperando
+    a vez, ou TaxaExcedida se a espera for longa demais) e passa pelo disjuntor
+    da conta: com ele aberto a chamada falha na hora com CircuitoAberto, sem
+    esperar os timeouts nem as retentativas.
+    """
+
+    def __init__(self, disjuntor, conta, taxa=None, **kwargs):
+        super().__init__(**kwargs)
+        self.disjuntor = disjuntor
+        self.conta = conta
+        self.taxa = taxa
+
+    def request(self, method, url, headers, post_data=None):
+        espera = reservar_taxa(self.taxa, self.conta)
+        if espera:
+            time.sleep(espera)
+        sonda = self.disjuntor.admitir()
+        inicio = time.perf_counter()
+        status = 'erro'
+        try:
+            resposta = super().request(method, url, headers, post_data)
+            status = resposta[1]
+            return resposta
+        finally:
+            self.disjuntor.concluir(sonda, status == 'erro' or status >= 500)
+            tempo_stripe.observar(
+                time.perf_counter() - inicio,
+                conta=self.conta, metodo=method.upper(), rota=rota_metrica(url), status=str(status)
+            )
+
+
+def _criar_sessao():
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=STRIPE_POOL_MAX)
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+    return sessao
+
+
+def criar_cliente(api_key, disjuntor, conta, stripe_account=None, taxa=None):
+    """StripeClient com uma sessão keep-alive própria; cada conta tem o seu."""
+    http_client = ClienteHTTPMedido(
+        disjuntor,
+        conta,
+        taxa=taxa,
+        session=_criar_sessao(),
+        timeout=(STRIPE_TIMEOUT_CONEXAO, STRIPE_TIMEOUT_LEITURA)
+    )
+    # O backoff entre tentativas (exponencial, com jitter e respeitando Retry-After) é o da biblioteca;
+    # POSTs repetidos reutilizam a mesma Idempotency-Key
+    return stripe.StripeClient(
+        api_key,
+        stripe_account=stripe_account,
+        http_client=http_client,
+        max_network_retries=STRIPE_MAX_RETRIES,
+        base_addresses={'api': STRIPE_API_BASE}
+    )
@@ -0,0 +1,230 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import WEBHOOK_FILA_PATH, WEBHOOK_WORKERS, WEBHOOK_MAX_TENTATIVAS
+from services import serializacao
+from services.logs import request_id
+from services.metricas import registro
+from services.sqlite_util import ConexaoPorThread
+
+logger = logging.getLogger(__name__)
+
+# Eventos em processamento há mais tempo que isso voltam para a fila
+# (o worker que os pegou provavelmente morreu)
+LEASE_SEGUNDOS = 300
+INTERVALO_OCIOSO = 0.5
+
+processados_fila = registro.contador(
+    'webhook_fila_processados_total',
+    'Eventos processados pela fila neste processo'
+)
+falhas_fila = registro.contador(
+    'webhook_fila_falhas_total',
+    'Tentativas de processamento que falharam neste processo'
+)
+
+
+class WebhookFila:
+    """Fila durável (SQLite) de eventos de webhook já verificados.
+
+    As rotas gravam o evento e respondem na hora; um pool de threads aplica
+    as alterações no Firestore em segundo plano.
+    """
+
+    def __init__(self, caminho, workers=4, max_tentativas=5):
+        self.caminho = caminho
+        self.workers = workers
+        self.max_tentativas = max_tentativas
+        self._processadores = {}
+        self._threads = []
+        self._pid = None
+        self._parar = threading.Event()
+        self._novo_evento = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_inicio = threading.Lock()
+        self._processados = 0
+        self._falhas = 0
+        self._ultimo_lag = 0.0
+        self._tabela_criada = False
+        self._conexoes = ConexaoPorThread(caminho)
+
+    def _conn(self):
+        self._criar_tabela()
+        return self._conexoes.obter()
+
+    def _criar_tabela(self):
+        if self._tabela_criada:
+            return
+        conn = self._conexoes.obter()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS eventos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                processador TEXT NOT NULL,
+                evento_id TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                recebido_em REAL NOT NULL,
+                disponivel_em REAL NOT NULL,
+                iniciado_em REAL,
+                erro TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_eventos_status ON eventos (status, disponivel_em)')
+        self._tabela_criada = True
+
+    def registrar(self, nome, processador):
+        """Associa um nome de fila a uma função processador(event) -> (resposta, status_code)."""
+        self._processadores[nome] = processador
+
+    def enfileirar(self, nome, evento_id, payload):
+        agora = time.time()
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        # Conexão da thread da requisição, aberta uma vez: o INSERT é o único custo por evento
+        self._conn().execute(
+            'INSERT INTO eventos (processador, evento_id, payload, recebido_em, disponivel_em) VALUES (?, ?, ?, ?, ?)',
+            (nome, evento_id, payload, agora, agora)
+        )
+        self._novo_evento.set()
+
+    def _reservar(self, conn):
+        agora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE eventos SET status = 'pendente' WHERE status = 'processando' AND iniciado_em < ?",
+                (agora - LEASE_SEGUNDOS,)
+            )
+            linha = conn.execute(
+                "SELECT id, processador, payload, tentativas, recebido_em FROM eventos "
+                "WHERE status = 'pendente' AND disponivel_em <= ? ORDER BY id LIMIT 1",
+                (agora,)
+            ).fetchone()
+            if linha:
+                conn.execute(
+                    "UPDATE eventos SET status = 'processando', iniciado_em = ?, tentativas = tentativas + 1 WHERE id = ?",
+                    (agora, linha[0])
+                )
+            conn.execute('COMMIT')
+            return linha
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _processar(self, conn, linha):
+        id_, nome, payload, tentativas, recebido_em = linha
+        tentativas += 1
+        erro = None
+        definitivo = False
+        # Nos logs do worker a correlação é feita pelo id do evento
+        token = request_id.set(id_)
+        try:
+            processador = self._processadores[nome]
+            resposta, status_code = processador(serializacao.loads(payload))
+            if status_code >= 400:
+                erro = f"status {status_code}: {(resposta or {}).get('erro', '')}".rstrip(': ')
+                # O Stripe já recebeu 200: um 4xx (cliente não encontrado, metadados incompletos)
+                # não melhora com retentativas e fica como 'falhou' para ser tratado à mão
+                definitivo = status_code < 500
+        except Exception as e:
+            erro = f'{e.__class__.__name__}: {str(e)}'
+            logger.exception('Erro ao processar evento da fila %s', id_)
+        finally:
+            request_id.reset(token)
+
+        if erro is None:
+            conn.execute('DELETE FROM eventos WHERE id = ?', (id_,))
+            with self._lock:
+                self._processados += 1
+                self._ultimo_lag = time.time() - recebido_em
+            processados_fila.incrementar()
+            return
+
+        with self._lock:
+            self._falhas += 1
+        falhas_fila.incrementar()
+        if definitivo or tentativas >= self.max_tentativas:
+            if definitivo:
+                logger.error('Evento %s recusado pelo handler, descartado: %s', id_, erro)
+            else:
+                logger.error('Evento %s descartado após %d tentativas: %s', id_, tentativas, erro)
+            conn.execute("UPDATE eventos SET status = 'falhou', erro = ? WHERE id = ?", (erro, id_))
+        else:
+            espera = min(2 ** tentativas, 300)
+            conn.execute(
+                "UPDATE eventos SET status = 'pendente', erro = ?, disponivel_em = ? WHERE id = ?",
+                (erro, time.time() + espera, id_)
+            )
+
+    def _loop(self):
+        conn = self._conn()
+        while not self._parar.is_set():
+            try:
+                linha = self._reservar(conn)
+            except sqlite3.OperationalError as e:
+                logger.warning('Fila de webhooks ocupada: %s', str(e))
+                linha = None
+            if linha is None:
+                self._novo_evento.wait(INTERVALO_OCIOSO)
+                self._novo_evento.clear()
+                continue
+            try:
+                self._processar(conn, linha)
+            except sqlite3.OperationalError as e:
+                # O evento continua como 'processando' e volta para a fila após o lease
+                logger.warning('Falha ao atualizar evento na fila: %s', str(e))
+
+    def iniciar(self):
+        # Chamado a cada requisição: só as primeiras (de cada processo) disputam o lock
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._lock_inicio:
+            if self._threads and self._pid == os.getpid():
+                return
+            # Threads não sobrevivem ao fork: num processo filho o pool é recriado
+            self._criar_tabela()
+            self._parar.clear()
+            threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._loop, name=f'webhook-fila-{i}', daemon=True)
+                thread.start()
+                threads.append(thread)
+            self._threads = threads
+            self._pid = os.getpid()
+        logger.info('Fila de webhooks iniciada com %d workers (%s)', self.workers, self.caminho)
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        self._novo_evento.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def metricas(self):
+        agora = time.time()
+        conn = self._conn()
+        pendentes, mais_antigo = conn.execute(
+            "SELECT COUNT(*), MIN(recebido_em) FROM eventos WHERE status IN ('pendente', 'processando')"
+        ).fetchone()
+        falhos = conn.execute("SELECT COUNT(*) FROM eventos WHERE status = 'falhou'").fetchone()[0]
+        with self._lock:
+            return {
+                'profundidade': pendentes,
+                'lag_segundos': round(agora - mais_antigo, 3) if mais_antigo else 0.0,
+                'ultimo_lag_processamento_segundos': round(self._ultimo_lag, 3),
+                'descartados': falhos,
+                'processados': self._processados,
+                'falhas': self._falhas,
+                'workers': len(self._threads)
+            }
+
+
+webhook_fila = WebhookFila(
+    WEBHOOK_FILA_PATH,
+    workers=WEBHOOK_WORKERS,
+    max_tentativas=WEBHOOK_MAX_TENTATIVAS
+)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+import pytest
+
+# Precisa vir antes de qualquer import da aplicação: config.py lê o ambiente no import.
+# Os arquivos SQLite ficam num diretório temporário e nada fala com serviços externos.
+_DIRETORIO = tempfile.mkdtemp(prefix='testes_')
+
+os.environ.update({
+    'STRIPE_SECRET_KEY': 'sk_test_testes',
+    'STRIPE_PUBLIC_KEY': 'pk_test_testes',
+    'STRIPE_WEBHOOK_SECRET_MENSAL': 'whsec_testes_mensal',
+    'STRIPE_CONTAS': '',
+    'STRIPE_API_BASE': 'http://127.0.0.1:9',
+    'IDEMPOTENCIA_BACKEND': 'memoria',
+    'STATUS_CACHE_REDIS_URL': '',
+    'STATUS_EVENTOS_REDIS_URL': '',
+    'WEBHOOK_ASYNC': 'false',
+    'NOTIFICACOES_SEGREDO': '',
+    'STRIPE_TAXA_PATH': os.path.join(_DIRETORIO, 'stripe_taxa.db'),
+    'IDEMPOTENCIA_PATH': os.path.join(_DIRETORIO, 'idempotencia.db'),
+    'LEDGER_PATH': os.path.join(_DIRETORIO, 'ledger.db'),
+    'WEBHOOK_FILA_PATH': os.path.join(_DIRETORIO, 'webhook_fila.db'),
+    'NOTIFICACOES_PATH': os.path.join(_DIRETORIO, 'notificacoes.db'),
+})
+
+
+class RelogioFalso:
+    """Substitui o módulo `time` de um módulo testado: o tempo só anda com avancar()."""
+
+    def __init__(self, inicio=1000.0):
+        self.agora = inicio
+
+    def monotonic(self):
+        return self.agora
+
+    def time(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio():
+    return RelogioFalso()
@@ -3,6 +3,7 @@ import stripe
 import time
 import traceback
 from datetime import datetime
+from services.contas_stripe import contas
 
 def init_payment_tests(app):
     @app.route('/simular-pagamento/<boleto_id>', methods=['POST'])
@@ -10,9 +11,10 @@ def init_payment_tests(app):
         try:
             print(f"=== SIMULANDO PAGAMENTO DO BOLETO {boleto_id} ===")
             
-            # Buscar o PaymentIntent no Stripe
+            # Buscar o PaymentIntent no Stripe, na conta da requisição
+            conta = contas.da_requisicao(request.headers)
             try:
-                payment_intent = stripe.PaymentIntent.retrieve(boleto_id)
+                payment_intent = conta.cliente.payment_intents.retrieve(boleto_id)
                 print(f"PaymentIntent encontrado: {payment_intent.id}")
             except stripe.error.StripeError as e:
                 print(f"Erro ao buscar PaymentIntent: {str(e)}")
@@ -46,7 +48,7 @@ def init_payment_tests(app):
                                 }
                             }
                         }
-                    }, stripe.api_key)
+                    }, conta.secret_key)
 
                     # Processar o evento como se fosse um webhook real
                     if event.type == 'payment_intent.succeeded':
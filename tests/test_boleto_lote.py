@@ -0,0 +1,59 @@
+import pytest
+import stripe
+
+from routes import boleto_lote
+from services.contas_stripe import contas
+from services.disjuntor import CircuitoAberto
+from services.limite import TaxaExcedida
+
+BOLETO = {'boleto_id': 'pi_1', 'status': 'requires_action'}
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    esperas = []
+    monkeypatch.setattr(boleto_lote.time, 'sleep', esperas.append)
+    return esperas
+
+
+def _gerador(monkeypatch, *falhas):
+    """Faz gerar_boleto_idempotente levantar as `falhas` em ordem e depois devolver BOLETO."""
+    chamadas = []
+
+    def gerar(chave, dados, conta):
+        chamadas.append(chave)
+        if len(chamadas) <= len(falhas):
+            raise falhas[len(chamadas) - 1]
+        return BOLETO, False
+    monkeypatch.setattr(boleto_lote, 'gerar_boleto_idempotente', gerar)
+    return chamadas
+
+
+def test_item_sem_vaga_no_limite_espera_o_retry_after(monkeypatch, esperas):
+    chamadas = _gerador(monkeypatch, TaxaExcedida('stripe', 0.25), TaxaExcedida('stripe', 0.5))
+    resultado = boleto_lote._gerar_item(0, 'chave', {}, contas.padrao)
+    assert resultado == {'indice': 0, 'status': 'ok', 'reaproveitado': False, 'boleto': BOLETO}
+    assert esperas == [0.25, 0.5]
+    assert len(chamadas) == 3
+
+
+def test_tentativas_de_taxa_sao_limitadas(monkeypatch, esperas):
+    _gerador(monkeypatch, *[TaxaExcedida('stripe', 1)] * boleto_lote.MAX_TENTATIVAS_RATE_LIMIT)
+    resultado = boleto_lote._gerar_item(3, 'chave', {}, contas.padrao)
+    assert resultado['status'] == 'erro'
+    assert resultado['indice'] == 3
+    assert len(esperas) == boleto_lote.MAX_TENTATIVAS_RATE_LIMIT - 1
+
+
+def test_rate_limit_do_stripe_repete_com_backoff(monkeypatch, esperas):
+    _gerador(monkeypatch, stripe.error.RateLimitError('Too many requests'))
+    assert boleto_lote._gerar_item(0, 'chave', {}, contas.padrao)['status'] == 'ok'
+    assert len(esperas) == 1 and 1 <= esperas[0] <= 2
+
+
+def test_disjuntor_aberto_falha_o_item_na_hora(monkeypatch, esperas):
+    chamadas = _gerador(monkeypatch, CircuitoAberto('stripe', 30))
+    resultado = boleto_lote._gerar_item(0, 'chave', {}, contas.padrao)
+    assert resultado['status'] == 'erro'
+    assert esperas == []
+    assert len(chamadas) == 1
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from services import boletos
+from services.boletos import boletos_gerados, chave_idempotencia, gerar_boleto_idempotente
+from services.contas_stripe import contas
+
+DADOS = {'cpf_limpo': '12345678909', 'valor': 150.0, 'metadata': {}}
+
+
+@pytest.fixture
+def criados(monkeypatch):
+    criados = []
+
+    def criar(chave, dados, conta):
+        criados.append(chave)
+        return {'boleto_id': f'pi_{len(criados)}'}
+    monkeypatch.setattr(boletos, 'criar_boleto', criar)
+    boletos_gerados.clear()
+    return criados
+
+
+def test_sem_chave_cada_requisicao_e_um_boleto(criados):
+    # Mesmo CPF, valor e metadata: sem Idempotency-Key são duas cobranças
+    primeira, segunda = chave_idempotencia(DADOS), chave_idempotencia(DADOS)
+    assert primeira != segunda
+    assert gerar_boleto_idempotente(primeira, DADOS, contas.padrao) == ({'boleto_id': 'pi_1'}, False)
+    assert gerar_boleto_idempotente(segunda, DADOS, contas.padrao) == ({'boleto_id': 'pi_2'}, False)
+    assert len(boletos_gerados) == 0
+
+
+def test_chave_do_cliente_reaproveita_o_boleto(criados):
+    chave = chave_idempotencia(DADOS, 'pedido-42')
+    assert chave == 'pedido-42'
+    assert gerar_boleto_idempotente(chave, DADOS, contas.padrao) == ({'boleto_id': 'pi_1'}, False)
+    assert gerar_boleto_idempotente(chave, DADOS, contas.padrao) == ({'boleto_id': 'pi_1'}, True)
+    assert criados == ['pedido-42']
+
+
+def test_modo_asgi_usa_o_mesmo_cache(criados, monkeypatch):
+    async def criar_async(chave, dados, conta):
+        raise AssertionError('a chave já foi usada no modo WSGI')
+    monkeypatch.setattr(boletos, 'criar_boleto_async', criar_async)
+
+    gerar_boleto_idempotente('pedido-42', DADOS, contas.padrao)
+    resultado = asyncio.run(boletos.gerar_boleto_idempotente_async('pedido-42', DADOS, contas.padrao))
+    assert resultado == ({'boleto_id': 'pi_1'}, True)
@@ -0,0 +1,74 @@
+import pytest
+
+from services import disjuntor as modulo
+from services.disjuntor import Disjuntor, CircuitoAberto, FECHADO, MEIO_ABERTO, ABERTO
+
+
+@pytest.fixture
+def relogio_do_disjuntor(relogio, monkeypatch):
+    monkeypatch.setattr(modulo, 'time', relogio)
+    return relogio
+
+
+def _falhar(disjuntor, vezes=1):
+    for _ in range(vezes):
+        disjuntor.concluir(disjuntor.admitir(), True)
+
+
+def test_abre_depois_de_falhas_seguidas(relogio_do_disjuntor):
+    disjuntor = Disjuntor('teste', limite_falhas=3, tempo_aberto=30)
+    _falhar(disjuntor, 2)
+    assert disjuntor.estado == FECHADO
+
+    _falhar(disjuntor)
+    assert disjuntor.estado == ABERTO
+    with pytest.raises(CircuitoAberto) as erro:
+        disjuntor.admitir()
+    assert erro.value.retry_after_header == '30'
+
+
+def test_sucesso_zera_a_contagem_de_falhas(relogio_do_disjuntor):
+    disjuntor = Disjuntor('teste', limite_falhas=3, tempo_aberto=30)
+    _falhar(disjuntor, 2)
+    disjuntor.concluir(disjuntor.admitir(), False)
+    _falhar(disjuntor, 2)
+    assert disjuntor.estado == FECHADO
+
+
+def test_resultado_indefinido_nao_conta(relogio_do_disjuntor):
+    disjuntor = Disjuntor('teste', limite_falhas=1, tempo_aberto=30)
+    disjuntor.concluir(disjuntor.admitir(), None)
+    assert disjuntor.estado == FECHADO
+
+
+def test_meio_aberto_deixa_passar_uma_sonda_que_fecha(relogio_do_disjuntor):
+    disjuntor = Disjuntor('teste', limite_falhas=1, tempo_aberto=30)
+    _falhar(disjuntor)
+    relogio_do_disjuntor.avancar(10)
+    with pytest.raises(CircuitoAberto) as erro:
+        disjuntor.admitir()
+    assert erro.value.retry_after_header == '20'
+
+    relogio_do_disjuntor.avancar(20)
+    assert disjuntor.estado == MEIO_ABERTO
+    sonda = disjuntor.admitir()
+    assert sonda is True
+    # Só uma sonda por vez
+    with pytest.raises(CircuitoAberto):
+        disjuntor.admitir()
+
+    disjuntor.concluir(sonda, False)
+    assert disjuntor.estado == FECHADO
+    assert disjuntor.admitir() is False
+
+
+def test_sonda_que_falha_abre_de_novo(relogio_do_disjuntor):
+    disjuntor = Disjuntor('teste', limite_falhas=5, tempo_aberto=30)
+    _falhar(disjuntor, 5)
+    relogio_do_disjuntor.avancar(30)
+    disjuntor.concluir(disjuntor.admitir(), True)
+    assert disjuntor.estado == ABERTO
+
+    relogio_do_disjuntor.avancar(29)
+    with pytest.raises(CircuitoAberto):
+        disjuntor.admitir()
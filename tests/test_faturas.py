@@ -0,0 +1,99 @@
+import pytest
+
+from benchmarks.firestore_falso import criar_db
+from services import faturas
+from services.faturas import (
+    CAMPO_MIGRADO, FATURA_ATUALIZADA, FATURA_JA_PAGA, CLIENTE_NAO_ENCONTRADO,
+    atualizar_fatura, faturas_ref, ler_faturas_migradas, listar_faturas
+)
+from services.faturas_lote import exportar
+from services.migrar_faturas import migrar_cliente
+
+PAGAMENTO = {'status': 'pago', 'paymentIntentId': 'pi_1'}
+
+
+@pytest.fixture
+def db():
+    db = criar_db()
+    db.collection('clientes').document('cli_1').set({'faturas': [
+        {'id': 'fat_1', 'status': 'pendente'},
+        {'id': 'fat_2', 'status': 'pendente'},
+    ]})
+    return db
+
+
+@pytest.fixture
+def modo_subcolecao(monkeypatch):
+    monkeypatch.setattr(faturas, 'FATURAS_MODO', 'subcolecao')
+
+
+def _cliente(db):
+    return db.collection('clientes').document('cli_1').get()
+
+
+def _status(faturas_lidas):
+    return {fatura['id']: fatura['status'] for fatura in faturas_lidas}
+
+
+def test_listar_faturas_nos_dois_formatos(db):
+    assert _status(listar_faturas(db, 'cli_1')) == {'fat_1': 'pendente', 'fat_2': 'pendente'}
+    assert listar_faturas(db, 'cli_inexistente') is None
+
+    migrar_cliente(db, _cliente(db))
+    # O array fica como estava: só a subcoleção recebe o pagamento
+    faturas_ref(db, 'cli_1').document('fat_1').update({'status': 'pago'})
+    assert _cliente(db).to_dict()[CAMPO_MIGRADO] is True
+    assert _status(listar_faturas(db, 'cli_1')) == {'fat_1': 'pago', 'fat_2': 'pendente'}
+    assert _status(listar_faturas(db, 'cli_1', pagina=1)) == {'fat_1': 'pago', 'fat_2': 'pendente'}
+
+
+def test_exportacao_le_a_subcolecao_dos_migrados(db, modo_subcolecao):
+    migrar_cliente(db, _cliente(db))
+    assert atualizar_fatura(db, 'cli_1', 'fat_2', PAGAMENTO) == FATURA_ATUALIZADA
+    assert _cliente(db).to_dict()['faturas'][1]['status'] == 'pendente'
+
+    exportadas = {f['fatura_id']: f['status'] for f in exportar(db, pagina=1)}
+    assert exportadas == {'fat_1': 'pendente', 'fat_2': 'pago'}
+
+
+def test_ler_faturas_migradas_ignora_clientes_do_array(db):
+    db.collection('clientes').document('cli_2').set({'faturas': [{'id': 'fat_9', 'status': 'pendente'}]})
+    migrar_cliente(db, _cliente(db))
+    clientes = {cliente_id: db.collection('clientes').document(cliente_id).get()
+                for cliente_id in ('cli_1', 'cli_2', 'cli_inexistente')}
+
+    lidas = ler_faturas_migradas(db, clientes, [
+        ('cli_1', 'fat_1'), ('cli_1', 'fat_inexistente'), ('cli_2', 'fat_9'), ('cli_inexistente', 'fat_1')
+    ])
+    assert set(lidas) == {('cli_1', 'fat_1'), ('cli_1', 'fat_inexistente')}
+    assert lidas[('cli_1', 'fat_1')].to_dict()['status'] == 'pendente'
+    assert lidas[('cli_1', 'fat_inexistente')] is None
+
+
+def test_subcolecao_cai_no_array_para_clientes_nao_migrados(db, modo_subcolecao):
+    assert atualizar_fatura(db, 'cli_1', 'fat_1', PAGAMENTO) == FATURA_ATUALIZADA
+    assert _status(listar_faturas(db, 'cli_1'))['fat_1'] == 'pago'
+    assert atualizar_fatura(db, 'cli_inexistente', 'fat_1', PAGAMENTO) == CLIENTE_NAO_ENCONTRADO
+
+
+@pytest.mark.parametrize('migrado', [False, True])
+def test_se_pendente_nao_toca_em_fatura_paga(db, modo_subcolecao, migrado):
+    if migrado:
+        migrar_cliente(db, _cliente(db))
+    atualizar_fatura(db, 'cli_1', 'fat_1', PAGAMENTO)
+
+    outro = {'status': 'pago', 'paymentIntentId': 'pi_2'}
+    assert atualizar_fatura(db, 'cli_1', 'fat_1', outro, se_pendente=True) == FATURA_JA_PAGA
+    fatura = next(f for f in listar_faturas(db, 'cli_1') if f['id'] == 'fat_1')
+    assert fatura['paymentIntentId'] == 'pi_1'
+
+
+def test_migracao_refeita_nao_desfaz_pagamento_da_subcolecao(db, modo_subcolecao):
+    cliente_doc = _cliente(db)
+    # Primeira tentativa interrompida: as faturas foram copiadas, a marcação do cliente não
+    for fatura in cliente_doc.to_dict()['faturas']:
+        faturas_ref(db, 'cli_1').document(fatura['id']).set(fatura)
+    atualizar_fatura(db, 'cli_1', 'fat_1', PAGAMENTO)
+
+    migrar_cliente(db, _cliente(db))
+    assert _status(listar_faturas(db, 'cli_1')) == {'fat_1': 'pago', 'fat_2': 'pendente'}
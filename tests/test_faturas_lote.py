@@ -0,0 +1,72 @@
+import pytest
+
+from benchmarks.firestore_falso import criar_db
+from services import faturas_lote
+from services.faturas import FATURA_JA_PAGA, FATURA_NAO_ENCONTRADA, atualizar_fatura, listar_faturas
+from services.faturas_lote import APLICADA, INVALIDA, importar, validar_linha
+from services.migrar_faturas import migrar_cliente
+
+WEBHOOK = {'status': 'pago', 'paymentIntentId': 'pi_webhook'}
+
+
+@pytest.fixture(params=['array', 'subcolecao'])
+def db(request):
+    db = criar_db()
+    db.collection('clientes').document('cli_1').set({'faturas': [
+        {'id': 'fat_1', 'status': 'pendente'},
+        {'id': 'fat_2', 'status': 'pago', 'paymentIntentId': 'pi_antigo'},
+    ]})
+    if request.param == 'subcolecao':
+        migrar_cliente(db, db.collection('clientes').document('cli_1').get())
+    return db
+
+
+def _linha(fatura_id='fat_1', valor_pago='150,00', cliente_id='cli_1'):
+    return {'cliente_id': cliente_id, 'fatura_id': fatura_id, 'valor_pago': valor_pago,
+            'data_pagamento': '2025-05-17'}
+
+
+def _fatura(db, fatura_id):
+    return next(f for f in listar_faturas(db, 'cli_1') if f['id'] == fatura_id)
+
+
+@pytest.mark.parametrize('valor_pago', ['nan', 'inf', '-inf', '-10', '0', 'abc', None])
+def test_valor_pago_invalido(valor_pago):
+    with pytest.raises(ValueError):
+        validar_linha(_linha(valor_pago=valor_pago))
+
+
+def test_linha_valida():
+    cliente_id, fatura_id, dados = validar_linha({**_linha(), 'referencia': 'ret-001'})
+    assert (cliente_id, fatura_id) == ('cli_1', 'fat_1')
+    assert dados == {'status': 'pago', 'dataPagamento': '17/05/2025', 'valorPago': 150.0,
+                     'origemPagamento': 'importacao', 'referenciaPagamento': 'ret-001'}
+
+
+def test_importacao_aplica_pendentes_e_pula_pagas(db):
+    resultados = list(importar(db, [_linha(), _linha('fat_2'), _linha(valor_pago='nan'), _linha('fat_9')]))
+    assert [r['resultado'] for r in resultados] == [APLICADA, FATURA_JA_PAGA, INVALIDA, FATURA_NAO_ENCONTRADA]
+    assert _fatura(db, 'fat_1')['valorPago'] == 150.0
+    assert _fatura(db, 'fat_2')['paymentIntentId'] == 'pi_antigo'
+
+
+def test_dry_run_nao_grava(db):
+    assert [r['resultado'] for r in importar(db, [_linha()], dry_run=True)] == [APLICADA]
+    assert _fatura(db, 'fat_1')['status'] == 'pendente'
+
+
+def test_webhook_entre_a_leitura_e_o_batch_vence(db, monkeypatch):
+    # O webhook paga a fatura logo depois de a importação ler o bloco: a precondição do batch
+    # falha e a linha refeita sozinha encontra a fatura paga
+    ler_original = faturas_lote.ler_faturas_migradas
+
+    def ler_e_pagar(*args, **kwargs):
+        lidas = ler_original(*args, **kwargs)
+        atualizar_fatura(db, 'cli_1', 'fat_1', WEBHOOK)
+        return lidas
+    monkeypatch.setattr(faturas_lote, 'ler_faturas_migradas', ler_e_pagar)
+
+    assert [r['resultado'] for r in importar(db, [_linha()])] == [FATURA_JA_PAGA]
+    fatura = _fatura(db, 'fat_1')
+    assert fatura['paymentIntentId'] == 'pi_webhook'
+    assert 'origemPagamento' not in fatura
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+from services.ledger import SQLiteLedger
+
+DADOS = {'email': 'Ana@Exemplo.com', 'cpf_limpo': '12345678909', 'nome': 'Ana', 'descricao': 'Mensalidade',
+         'metadata': {'cliente_id': 'cli_1', 'fatura_id': 'fat_1'}}
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return SQLiteLedger(str(tmp_path / 'ledger.db'))
+
+
+def _payment_intent(id='pi_1', status='requires_action', created=1000, **kwargs):
+    return {'id': id, 'status': status, 'amount': 15000, 'created': created,
+            'metadata': DADOS['metadata'], **kwargs}
+
+
+def _evento(status, created, **kwargs):
+    return {'created': created, 'data': {'object': _payment_intent(status=status, **kwargs)}}
+
+
+def test_registrar_grava_os_dados_do_pagador(ledger):
+    ledger.registrar(_payment_intent(), DADOS, 'pedido-42', 'secundaria')
+    boleto = ledger.obter('pi_1')
+    assert boleto['valor'] == 150.0
+    assert boleto['email'] == 'ana@exemplo.com'
+    assert (boleto['cliente_id'], boleto['fatura_id'], boleto['conta']) == ('cli_1', 'fat_1', 'secundaria')
+    assert boleto['data_pagamento'] is None
+
+
+def test_evento_fora_de_ordem_nao_volta_o_status(ledger):
+    ledger.registrar(_payment_intent(), DADOS)
+    ledger.aplicar_evento(_evento('succeeded', 2000, charges={'data': [{'created': 1900}]}))
+    ledger.aplicar_evento(_evento('processing', 1500))
+
+    boleto = ledger.obter('pi_1')
+    assert boleto['status'] == 'succeeded'
+    assert boleto['data_pagamento'] is not None
+    # O webhook não apaga o que a criação gravou
+    assert boleto['cpf'] == '12345678909'
+
+
+def test_evento_cria_a_linha_de_boleto_desconhecido(ledger):
+    ledger.aplicar_evento(_evento('requires_action', 1000, id='pi_fora'), 'secundaria')
+    assert ledger.obter('pi_fora')['conta'] == 'secundaria'
+
+
+def test_filtros_de_cpf_e_conta(ledger):
+    ledger.registrar(_payment_intent('pi_1'), DADOS)
+    ledger.registrar(_payment_intent('pi_2', created=2000), DADOS, conta='secundaria')
+
+    boletos, _ = ledger.consultar({'cpf': '123.456.789-09'})
+    assert [b['boleto_id'] for b in boletos] == ['pi_2', 'pi_1']
+    boletos, _ = ledger.consultar({'cpf': '123.456.789-09', 'conta': 'secundaria'})
+    assert [b['boleto_id'] for b in boletos] == ['pi_2']
+    with pytest.raises(ValueError):
+        ledger.consultar({'senha': 'x'})
+
+
+def test_paginacao_por_cursor(ledger):
+    for i in range(3):
+        ledger.registrar(_payment_intent(f'pi_{i}', created=1000 + i), DADOS)
+    primeira, cursor = ledger.consultar(limite=2)
+    segunda, fim = ledger.consultar(limite=2, cursor=cursor)
+    assert [b['boleto_id'] for b in primeira + segunda] == ['pi_2', 'pi_1', 'pi_0']
+    assert fim is None
+
+
+def test_ledger_antigo_ganha_a_coluna_conta(tmp_path):
+    caminho = str(tmp_path / 'ledger.db')
+    conn = sqlite3.connect(caminho)
+    conn.execute('''
+        CREATE TABLE boletos (
+            payment_intent_id TEXT PRIMARY KEY, status TEXT NOT NULL, valor_centavos INTEGER, email TEXT,
+            cpf TEXT, nome TEXT, descricao TEXT, cliente_id TEXT, fatura_id TEXT, metadata TEXT,
+            chave_idempotencia TEXT, criado_em REAL NOT NULL, pago_em REAL, atualizado_em REAL NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO boletos (payment_intent_id, status, criado_em, atualizado_em) "
+                 "VALUES ('pi_antigo', 'succeeded', 1000, 1000)")
+    conn.commit()
+    conn.close()
+
+    ledger = SQLiteLedger(caminho)
+    assert ledger.obter('pi_antigo')['conta'] == 'padrao'
+    boletos, _ = ledger.consultar({'conta': 'padrao'})
+    assert [b['boleto_id'] for b in boletos] == ['pi_antigo']
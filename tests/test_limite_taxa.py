@@ -0,0 +1,61 @@
+import pytest
+
+from services import limite
+from services.disjuntor import CircuitoAberto
+from services.limite import LimiteTaxaCompartilhado, TaxaExcedida
+
+
+@pytest.fixture
+def relogio_do_limite(relogio, monkeypatch):
+    monkeypatch.setattr(limite, 'time', relogio)
+    return relogio
+
+
+def _balde(tmp_path, chave='conta', **kwargs):
+    return LimiteTaxaCompartilhado(str(tmp_path / 'taxa.db'), chave, **kwargs)
+
+
+def test_rajada_passa_e_o_excesso_espera_a_vez(tmp_path, relogio_do_limite):
+    balde = _balde(tmp_path, por_segundo=10, rajada=5, espera_max=10)
+    assert [balde.reservar() for _ in range(5)] == [0] * 5
+    assert balde.reservar() == pytest.approx(0.1)
+    assert balde.reservar() == pytest.approx(0.2)
+    assert balde.disponivel() == pytest.approx(-2)
+
+    relogio_do_limite.avancar(1)
+    assert balde.disponivel() == pytest.approx(5)
+
+
+def test_espera_longa_demais_e_recusada_sem_reservar(tmp_path, relogio_do_limite):
+    balde = _balde(tmp_path, por_segundo=1, rajada=1, espera_max=0.5, nome='stripe')
+    assert balde.reservar() == 0
+    with pytest.raises(TaxaExcedida) as erro:
+        balde.reservar()
+    # Tratado pelas rotas como o disjuntor aberto: 503 com Retry-After
+    assert isinstance(erro.value, CircuitoAberto)
+    assert erro.value.retry_after_header == '1'
+    assert balde.disponivel() == pytest.approx(0)
+
+
+def test_processos_dividem_o_mesmo_balde(tmp_path, relogio_do_limite):
+    # Duas instâncias no mesmo arquivo fazem o papel de dois workers
+    primeiro = _balde(tmp_path, por_segundo=10, rajada=2)
+    segundo = _balde(tmp_path, por_segundo=10, rajada=2)
+    assert primeiro.reservar() == 0
+    assert segundo.reservar() == 0
+    assert primeiro.reservar() == pytest.approx(0.1)
+
+
+def test_contas_tem_baldes_separados(tmp_path, relogio_do_limite):
+    padrao = _balde(tmp_path, 'padrao', por_segundo=1, rajada=1)
+    marca_b = _balde(tmp_path, 'marca_b', por_segundo=1, rajada=1)
+    assert padrao.reservar() == 0
+    assert marca_b.reservar() == 0
+
+
+def test_construir_nao_toca_o_disco(tmp_path, relogio_do_limite):
+    caminho = tmp_path / 'taxa.db'
+    balde = LimiteTaxaCompartilhado(str(caminho), 'conta', por_segundo=10)
+    assert not caminho.exists()
+    assert balde.reservar() == 0
+    assert caminho.exists()
@@ -0,0 +1,51 @@
+from flask import Flask
+
+from routes.metricas import init_metricas
+from services.metricas import Registro, formatar_prometheus
+from services.webhook_fila import WebhookFila, processados_fila
+
+
+def test_formato_de_cada_tipo():
+    registro = Registro()
+    registro.contador('eventos_total', 'Eventos').incrementar(2, tipo='a')
+    registro.medidor('fila', 'Fila', lambda: 3)
+    registro.histograma('tempo_segundos', 'Tempo', buckets=(0.1, 1.0)).observar(0.5, rota='x')
+
+    texto = formatar_prometheus(registro)
+    assert '# TYPE eventos_total counter\neventos_total{tipo="a"} 2\n' in texto
+    assert '# TYPE fila gauge\nfila 3\n' in texto
+    assert 'tempo_segundos_bucket{rota="x",le="0.1"} 0\n' in texto
+    assert 'tempo_segundos_bucket{rota="x",le="+Inf"} 1\n' in texto
+    assert 'tempo_segundos_count{rota="x"} 1\n' in texto
+
+
+def test_instantaneo_le_uma_vez_por_coleta():
+    registro = Registro()
+    leituras = []
+    estado = registro.instantaneo(lambda: leituras.append(1) or {'a': 1, 'b': 2})
+    registro.medidor('a', 'A', lambda: estado()['a'])
+    registro.medidor('b', 'B', lambda: estado()['b'])
+
+    formatar_prometheus(registro)
+    formatar_prometheus(registro)
+    assert len(leituras) == 2
+
+
+def test_totais_da_fila_sao_contadores(tmp_path):
+    app = Flask(__name__)
+    init_metricas(app)
+    antes = sum(processados_fila.coletar().values())
+
+    fila = WebhookFila(str(tmp_path / 'fila.db'))
+    fila.registrar('mensalidade', lambda event: ({'mensagem': 'ok'}, 200))
+    fila.enfileirar('mensalidade', 'evt_1', '{}')
+    conn = fila._conn()
+    fila._processar(conn, fila._reservar(conn))
+
+    texto = app.test_client().get('/metrics').get_data(as_text=True)
+    assert '# TYPE webhook_fila_processados_total counter' in texto
+    assert '# TYPE webhook_fila_falhas_total counter' in texto
+    assert f'webhook_fila_processados_total {antes + 1}\n' in texto
+    # Os totais não aparecem mais como gauges
+    assert '# TYPE webhook_fila_processados gauge' not in texto
+    assert '# TYPE webhook_fila_profundidade gauge' in texto
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services import assinatura
+from services.notificacoes import Notificacoes
+
+SEGREDO = 'segredo_testes'
+EVENTO = {'id': 'evt_1', 'data': {'object': {'id': 'pi_1', 'amount': 15000, 'metadata': {'cliente_id': 'cli_1'}}}}
+
+
+class Destino:
+    """Sistema externo de mentira: guarda o que recebe e responde com `status`."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.recebidas = []
+        destino = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                corpo = self.rfile.read(int(self.headers['Content-Length']))
+                destino.recebidas.append((dict(self.headers), corpo))
+                self.send_response(destino.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.servidor.server_port}/pagamentos'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def destino():
+    destino = Destino()
+    yield destino
+    destino.servidor.shutdown()
+
+
+@pytest.fixture
+def fila(tmp_path, destino):
+    fila = Notificacoes(str(tmp_path / 'notificacoes.db'), SEGREDO, destinos={'mensalidade': destino.url},
+                        max_tentativas=3)
+    yield fila
+    fila.parar()
+
+
+def _esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_entrega_assinada(fila, destino):
+    notificacao_id = fila.enfileirar('mensalidade', 'fatura_paga', EVENTO, {'fatura_id': 'fat_1'})
+    # Reenvio do mesmo evento: mesma notificação, não duplica
+    assert fila.enfileirar('mensalidade', 'fatura_paga', EVENTO, {'fatura_id': 'fat_1'}) == notificacao_id
+    fila.iniciar()
+
+    assert _esperar(lambda: fila.metricas()['entregues'] == 1)
+    assert len(destino.recebidas) == 1
+    headers, corpo = destino.recebidas[0]
+    assert headers['X-Notificacao-Id'] == notificacao_id
+    # Levanta SignatureVerificationError se a assinatura não conferir
+    assinatura.verificar(corpo, headers['X-Notificacao-Assinatura'], SEGREDO)
+    dados = json.loads(corpo)
+    assert dados['tipo'] == 'mensalidade.fatura_paga'
+    assert dados['valor'] == 150.0
+    assert dados['dados'] == {'fatura_id': 'fat_1'}
+
+
+def test_4xx_vai_para_falhas_e_pode_ser_reenviada(fila, destino):
+    destino.status = 422
+    notificacao_id = fila.enfileirar('mensalidade', 'fatura_paga', EVENTO, {})
+    fila.iniciar()
+
+    assert _esperar(lambda: fila.metricas()['falhas'] == 1)
+    falhas = fila.listar_falhas()
+    assert [(f['id'], f['tentativas'], f['ultimo_status']) for f in falhas] == [(notificacao_id, 1, 422)]
+
+    destino.status = 200
+    assert fila.reenviar(notificacao_id) is True
+    assert fila.reenviar('ntf_inexistente') is False
+    assert _esperar(lambda: fila.metricas()['entregues'] == 1)
+    assert fila.listar_falhas() == []
+
+
+def test_sem_destino_nada_e_gravado(fila):
+    assert fila.enfileirar('opencode', 'plano_adicionado', EVENTO, {}) is None
+    assert fila.metricas()['pendentes'] == 0
+
+
+def test_inicio_concorrente_cria_uma_thread_de_entrega(fila):
+    barreira = threading.Barrier(8)
+
+    def iniciar():
+        barreira.wait()
+        fila.iniciar()
+    threads = [threading.Thread(target=iniciar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for thread in threading.enumerate() if thread.name == 'notificacoes') == 1
@@ -0,0 +1,97 @@
+import stripe
+
+from benchmarks.firestore_falso import criar_db
+from services.reconciliar import _comparar_software, aplicar
+from services.software_indice import (
+    COLECAO_INDICE, atualizar_projetos, chave_projeto, consultar_projetos, criar_projeto, indexar
+)
+
+PAGO = {'status_pagamento': 'Pago'}
+
+
+def _projeto(db, doc_id, cliente_id='cli_1', nome_projeto='Loja'):
+    db.collection('software_personalizado').document(doc_id).set({
+        'clienteId': cliente_id, 'nomeProjeto': nome_projeto, 'status_pagamento': 'Pendente'
+    })
+
+
+def _status(db, doc_id):
+    return db.collection('software_personalizado').document(doc_id).get().to_dict()['status_pagamento']
+
+
+def _indice(db, cliente_id='cli_1', nome_projeto='Loja'):
+    doc = db.collection(COLECAO_INDICE).document(chave_projeto(cliente_id, nome_projeto)).get()
+    return sorted(doc.to_dict()['docIds']) if doc.exists else None
+
+
+def test_criar_projeto_ja_entra_no_indice():
+    db = criar_db()
+    primeiro = criar_projeto(db, {'clienteId': 'cli_1', 'nomeProjeto': 'Loja'})
+    segundo = criar_projeto(db, {'clienteId': 'cli_1', 'nomeProjeto': 'Loja'}, doc_id='proj_2')
+    assert _indice(db) == sorted([primeiro.id, 'proj_2'])
+
+    assert atualizar_projetos(db, 'cli_1', 'Loja', PAGO) == 2
+    assert _status(db, primeiro.id) == _status(db, segundo.id) == 'Pago'
+
+
+def test_indice_e_confiado_sem_consulta(monkeypatch):
+    db = criar_db()
+    _projeto(db, 'proj_1')
+    _projeto(db, 'proj_2')
+    indexar(db, 'cli_1', 'Loja', ['proj_1'])
+
+    def consulta_proibida(*args, **kwargs):
+        raise AssertionError('o índice existe: a consulta não deveria rodar')
+    monkeypatch.setattr('services.software_indice.consultar_projetos', consulta_proibida)
+
+    assert atualizar_projetos(db, 'cli_1', 'Loja', PAGO) == 1
+    assert _status(db, 'proj_1') == 'Pago'
+    # Criado por fora e ainda não indexado: fica para o backfill ou a reconciliação
+    assert _status(db, 'proj_2') == 'Pendente'
+
+
+def test_sem_indice_usa_a_consulta_e_indexa():
+    db = criar_db()
+    _projeto(db, 'proj_1')
+    _projeto(db, 'proj_2')
+    _projeto(db, 'proj_3', nome_projeto='Outro')
+
+    assert atualizar_projetos(db, 'cli_1', 'Loja', PAGO) == 2
+    assert _indice(db) == ['proj_1', 'proj_2']
+    assert _status(db, 'proj_3') == 'Pendente'
+
+
+def test_indice_com_projeto_removido_e_regravado():
+    db = criar_db()
+    _projeto(db, 'proj_1')
+    indexar(db, 'cli_1', 'Loja', ['proj_1', 'proj_removido'])
+
+    assert atualizar_projetos(db, 'cli_1', 'Loja', PAGO) == 1
+    assert _status(db, 'proj_1') == 'Pago'
+    assert _indice(db) == ['proj_1']
+
+
+def test_par_sem_projetos():
+    db = criar_db()
+    assert atualizar_projetos(db, 'cli_1', 'Loja', PAGO) == 0
+    assert _indice(db) is None
+    assert consultar_projetos(db, 'cli_1', 'Loja') == []
+
+
+def test_reconciliacao_regrava_o_indice_e_corrige_os_projetos():
+    db = criar_db()
+    _projeto(db, 'proj_1')
+    _projeto(db, 'proj_2')
+    indexar(db, 'cli_1', 'Loja', ['proj_1', 'proj_removido'])
+    metadata = {'projectId': 'cli_1', 'projectName': 'Loja'}
+    payment_intent = stripe.PaymentIntent.construct_from(
+        {'id': 'pi_1', 'amount': 50000, 'created': 1747476000, 'metadata': metadata}, 'sk_test_testes'
+    )
+
+    resumo = {'conferidos': 0, 'corrigidos': 0, 'nao_encontrados': 0, 'falhas': 0}
+    correcoes = _comparar_software(db, [(payment_intent, metadata)], resumo)
+    aplicar(db, correcoes, resumo)
+
+    assert _indice(db) == ['proj_1', 'proj_2']
+    assert _status(db, 'proj_1') == _status(db, 'proj_2') == 'Pago'
+    assert resumo['falhas'] == 0
@@ -0,0 +1,91 @@
+import pytest
+
+from services import cache
+from services.status_cache import StatusCache, TTL_LOCAL_COM_BACKEND
+
+PENDENTE = {'status': 'requires_action', 'valor': 90.0}
+PAGO = {'status': 'succeeded', 'valor': 90.0}
+
+
+class BackendMemoria:
+    """Backend compartilhado em memória, no lugar do Redis; guarda o TTL pedido."""
+
+    def __init__(self):
+        self.itens = {}
+
+    def get(self, chave):
+        return self.itens.get(chave, (None, None))[0]
+
+    def set(self, chave, valor, ttl):
+        self.itens[chave] = (valor, ttl)
+
+    def delete(self, chave):
+        self.itens.pop(chave, None)
+
+
+@pytest.fixture(autouse=True)
+def relogio_do_cache(relogio, monkeypatch):
+    monkeypatch.setattr(cache, 'time', relogio)
+    return relogio
+
+
+def test_sem_backend_pago_fica_pelo_ttl_pago(relogio):
+    status = StatusCache(ttl=30, ttl_pago=3600)
+    status.set('pi_pendente', PENDENTE)
+    status.set('pi_pago', PAGO)
+
+    relogio.avancar(31)
+    assert status.get('pi_pendente') is None
+    assert status.get('pi_pago') == PAGO
+
+    relogio.avancar(3600)
+    assert status.get('pi_pago') is None
+
+
+def test_com_backend_copia_local_e_curta_e_o_backend_recebe_o_ttl_pago(relogio):
+    backend = BackendMemoria()
+    status = StatusCache(ttl=30, ttl_pago=3600, backend=backend)
+    status.set('pi_pago', PAGO)
+    assert backend.itens['pi_pago'] == (PAGO, 3600)
+
+    # A cópia local vence logo; a leitura seguinte vem do backend
+    backend.itens['pi_pago'] = ({**PAGO, 'valor': 100.0}, 3600)
+    relogio.avancar(TTL_LOCAL_COM_BACKEND + 1)
+    assert status.get('pi_pago')['valor'] == 100.0
+
+
+def test_obsoleto_sobrevive_a_expiracao_e_a_invalidacao(relogio):
+    status = StatusCache(ttl=30, ttl_pago=3600, ttl_obsoleto=600)
+    status.set('pi_1', PENDENTE)
+    status.invalidar('pi_1')
+    relogio.avancar(60)
+    assert status.get('pi_1') is None
+    assert status.obsoleto('pi_1') == PENDENTE
+
+    relogio.avancar(600)
+    assert status.obsoleto('pi_1') is None
+
+
+def _evento(tipo, payment_intent_id='pi_1'):
+    return {'type': tipo, 'created': 1747476000, 'data': {'object': {'id': payment_intent_id}}}
+
+
+def test_evento_de_pagamento_atualiza_a_entrada_da_chave():
+    status = StatusCache(ttl=30, ttl_pago=3600)
+    status.set('marca_b:pi_1', PENDENTE)
+    status.set('pi_1', PENDENTE)
+
+    dados = status.aplicar_evento(_evento('payment_intent.succeeded'), 'marca_b:pi_1')
+    assert dados['status'] == 'succeeded'
+    assert dados['debug_info']['is_paid'] is True
+    assert status.get('marca_b:pi_1') == dados
+    # A entrada de outra conta com o mesmo id não é tocada
+    assert status.get('pi_1') == PENDENTE
+
+
+def test_outros_eventos_invalidam_a_entrada():
+    status = StatusCache(ttl=30, ttl_pago=3600)
+    status.set('pi_1', PENDENTE)
+    assert status.aplicar_evento(_evento('payment_intent.processing')) is None
+    assert status.get('pi_1') is None
+    assert status.obsoleto('pi_1') == PENDENTE
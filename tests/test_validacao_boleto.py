@@ -0,0 +1,79 @@
+import pytest
+from flask import Flask
+
+from routes.boleto_lote import init_boleto_lote_routes
+from services.boletos import validar_boleto
+
+BOLETO = {
+    'valor': '150.00',
+    'email': 'cliente@exemplo.com',
+    'nome': 'Cliente de Teste',
+    'cpf': '123.456.789-09',
+    'endereco': {'cep': '01001-000', 'cidade': 'São Paulo'},
+    'metadata': {'cliente_id': 'cli_1', 'fatura_id': 'fat_1'},
+}
+
+
+def test_boleto_valido_e_normalizado():
+    dados, erro = validar_boleto(BOLETO)
+    assert erro is None
+    assert dados['cpf_limpo'] == '12345678909'
+    assert dados['cep_limpo'] == '01001000'
+    assert dados['cidade'] == 'São Paulo'
+    assert dados['rua'] == 'Rua não informada'
+    assert dados['metadata'] == BOLETO['metadata']
+
+
+def test_endereco_e_metadata_opcionais():
+    dados, erro = validar_boleto({k: v for k, v in BOLETO.items() if k not in ('endereco', 'metadata')})
+    assert erro is None
+    assert dados['cep_limpo'] == '00000000'
+    assert dados['metadata'] == {}
+
+
+@pytest.mark.parametrize('campo, mensagem', [
+    ('valor', 'Valor é obrigatório'),
+    ('email', 'Email é obrigatório'),
+    ('nome', 'Nome é obrigatório'),
+    ('cpf', 'CPF é obrigatório'),
+])
+def test_campos_obrigatorios(campo, mensagem):
+    assert validar_boleto({**BOLETO, campo: ''}) == (None, mensagem)
+
+
+@pytest.mark.parametrize('alteracao, mensagem', [
+    ({'valor': 'abc'}, 'Valor inválido'),
+    ({'valor': 'nan'}, 'Valor inválido'),
+    ({'valor': 'inf'}, 'Valor inválido'),
+    ({'valor': '-10'}, 'Valor inválido'),
+    ({'valor': [1]}, 'Valor inválido'),
+    ({'cpf': 12345678909}, 'CPF inválido'),
+    ({'endereco': 'Rua X'}, 'Endereço inválido'),
+    ({'endereco': {'cep': 1001000}}, 'CEP inválido'),
+    ({'metadata': ['cli_1']}, 'Metadata inválido'),
+])
+def test_campos_invalidos(alteracao, mensagem):
+    assert validar_boleto({**BOLETO, **alteracao}) == (None, mensagem)
+
+
+def test_dados_que_nao_sao_objeto():
+    assert validar_boleto(['nao', 'e', 'objeto']) == (None, 'Dados do boleto inválidos')
+
+
+@pytest.fixture
+def cliente_lote():
+    app = Flask(__name__)
+    init_boleto_lote_routes(app)
+    return app.test_client()
+
+
+def test_lote_invalido_lista_os_itens_sem_chamar_o_stripe(cliente_lote):
+    lote = [BOLETO, {**BOLETO, 'cpf': 123}, {**BOLETO, 'endereco': 'x'}, {**BOLETO, 'valor': 'inf'}, 'texto']
+    resposta = cliente_lote.post('/gerar-boletos/lote', json=lote)
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {'erro': 'Lote inválido', 'itens': [
+        {'indice': 1, 'erro': 'CPF inválido'},
+        {'indice': 2, 'erro': 'Endereço inválido'},
+        {'indice': 3, 'erro': 'Valor inválido'},
+        {'indice': 4, 'erro': 'Dados do boleto inválidos'},
+    ]}
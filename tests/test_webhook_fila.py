@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+
+import pytest
+
+from services import webhook_fila as modulo
+from services.webhook_fila import WebhookFila
+
+
+@pytest.fixture
+def fila(tmp_path):
+    fila = WebhookFila(str(tmp_path / 'webhook_fila.db'), workers=2, max_tentativas=3)
+    yield fila
+    fila.parar()
+
+
+@pytest.fixture
+def relogio_da_fila(relogio, monkeypatch):
+    monkeypatch.setattr(modulo, 'time', relogio)
+    return relogio
+
+
+def _eventos(fila):
+    return fila._conn().execute('SELECT evento_id, status, tentativas, erro FROM eventos ORDER BY id').fetchall()
+
+
+def _rodar_uma_vez(fila):
+    """Faz o papel de um worker: reserva e processa o próximo evento disponível."""
+    conn = fila._conn()
+    linha = fila._reservar(conn)
+    if linha is not None:
+        fila._processar(conn, linha)
+    return linha is not None
+
+
+def test_workers_processam_e_removem_o_evento(fila):
+    recebidos = []
+    fila.registrar('mensalidade', lambda event: recebidos.append(event) or ({'mensagem': 'ok'}, 200))
+    fila.iniciar()
+    fila.enfileirar('mensalidade', 'evt_1', json.dumps({'id': 'evt_1'}).encode('utf-8'))
+
+    limite = time.monotonic() + 5
+    while fila.metricas()['processados'] < 1 and time.monotonic() < limite:
+        time.sleep(0.02)
+    assert recebidos == [{'id': 'evt_1'}]
+    assert _eventos(fila) == []
+    assert fila.metricas()['profundidade'] == 0
+
+
+def test_erro_5xx_volta_para_a_fila_com_espera(fila, relogio_da_fila):
+    respostas = [({'erro': 'Firestore fora'}, 500), ({'mensagem': 'ok'}, 200)]
+    fila.registrar('mensalidade', lambda event: respostas.pop(0))
+    fila.enfileirar('mensalidade', 'evt_1', '{}')
+
+    assert _rodar_uma_vez(fila)
+    assert _eventos(fila) == [('evt_1', 'pendente', 1, 'status 500: Firestore fora')]
+    # Backoff de 2 segundos depois da primeira tentativa
+    assert not _rodar_uma_vez(fila)
+    relogio_da_fila.avancar(2)
+    assert _rodar_uma_vez(fila)
+    assert _eventos(fila) == []
+    assert fila.metricas()['falhas'] == 1
+
+
+def test_excecao_esgota_as_tentativas_e_fica_como_falhou(fila, relogio_da_fila):
+    def quebrar(event):
+        raise RuntimeError('handler quebrado')
+    fila.registrar('mensalidade', quebrar)
+    fila.enfileirar('mensalidade', 'evt_1', '{}')
+
+    for _ in range(3):
+        assert _rodar_uma_vez(fila)
+        relogio_da_fila.avancar(300)
+    assert _eventos(fila) == [('evt_1', 'falhou', 3, 'RuntimeError: handler quebrado')]
+    assert not _rodar_uma_vez(fila)
+    assert fila.metricas()['descartados'] == 1
+
+
+def test_4xx_e_descartado_sem_retentativa(fila, relogio_da_fila):
+    fila.registrar('mensalidade', lambda event: ({'erro': 'Cliente não encontrado'}, 404))
+    fila.enfileirar('mensalidade', 'evt_1', '{}')
+
+    assert _rodar_uma_vez(fila)
+    assert _eventos(fila) == [('evt_1', 'falhou', 1, 'status 404: Cliente não encontrado')]
+
+
+def test_evento_de_worker_morto_volta_depois_do_lease(fila, relogio_da_fila):
+    fila.registrar('mensalidade', lambda event: ({'mensagem': 'ok'}, 200))
+    fila.enfileirar('mensalidade', 'evt_1', '{}')
+    assert fila._reservar(fila._conn()) is not None
+
+    assert not _rodar_uma_vez(fila)
+    relogio_da_fila.avancar(modulo.LEASE_SEGUNDOS + 1)
+    assert _rodar_uma_vez(fila)
+    assert _eventos(fila) == []
+
+
+def test_inicio_concorrente_cria_um_pool(fila):
+    barreira = threading.Barrier(8)
+
+    def iniciar():
+        barreira.wait()
+        fila.iniciar()
+    threads = [threading.Thread(target=iniciar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for thread in threading.enumerate() if thread.name.startswith('webhook-fila-')) == 2
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from benchmarks.firestore_falso import criar_db
+from routes import mensalidade  # noqa: F401 - registra o handler de payment_intent.succeeded
+from routes.webhooks import receber_webhook
+from services import assinatura
+from services.idempotencia import criar_idempotencia_store
+
+SEGREDO = 'whsec_testes_mensal'
+
+
+@pytest.fixture
+def db():
+    return criar_db()
+
+
+@pytest.fixture
+def idempotencia(db):
+    return criar_idempotencia_store(db)
+
+
+def _cliente(db, cliente_id='cli_1'):
+    db.collection('clientes').document(cliente_id).set({
+        'nome': 'Cliente de Teste',
+        'faturas': [{'id': 'fat_1', 'status': 'pendente'}],
+    })
+
+
+def _fatura(db, cliente_id='cli_1'):
+    return db.collection('clientes').document(cliente_id).get().to_dict()['faturas'][0]
+
+
+def _entregar(db, idempotencia, evento_id, payment_intent_id='pi_1', cliente_id='cli_1'):
+    payload = json.dumps({
+        'id': evento_id, 'object': 'event', 'type': 'payment_intent.succeeded', 'created': 1747476000,
+        'data': {'object': {
+            'id': payment_intent_id, 'object': 'payment_intent', 'amount': 15000, 'status': 'succeeded',
+            'metadata': {'cliente_id': cliente_id, 'fatura_id': 'fat_1'},
+        }},
+    }).encode('utf-8')
+    cabecalho = assinatura.ler_cabecalho(assinatura.assinar(payload, SEGREDO))
+    return receber_webhook(db, idempotencia, 'mensalidade', payload, cabecalho)
+
+
+def test_reenvio_do_mesmo_evento_e_ignorado(db, idempotencia):
+    _cliente(db)
+    assert _entregar(db, idempotencia, 'evt_1') == ({'mensagem': 'Pagamento processado com sucesso'}, 200)
+    assert _fatura(db)['status'] == 'pago'
+
+    assert _entregar(db, idempotencia, 'evt_1') == ({'mensagem': 'Evento duplicado'}, 200)
+
+
+def test_outro_evento_do_mesmo_pagamento_e_ignorado(db, idempotencia):
+    _cliente(db)
+    _entregar(db, idempotencia, 'evt_1')
+    assert _entregar(db, idempotencia, 'evt_2') == ({'mensagem': 'Evento duplicado'}, 200)
+
+
+def test_recusa_libera_o_evento_para_o_reenvio(db, idempotencia):
+    resposta, status_code = _entregar(db, idempotencia, 'evt_1')
+    assert status_code == 404
+    assert resposta == {'erro': 'Cliente não encontrado'}
+
+    _cliente(db)
+    assert _entregar(db, idempotencia, 'evt_1') == ({'mensagem': 'Pagamento processado com sucesso'}, 200)
+    assert _fatura(db)['status'] == 'pago'
+
+
+def test_assinatura_de_outro_segredo_e_recusada(db, idempotencia):
+    payload = b'{"id": "evt_1", "type": "payment_intent.succeeded"}'
+    cabecalho = assinatura.ler_cabecalho(assinatura.assinar(payload, 'whsec_outro'))
+    assert receber_webhook(db, idempotencia, 'mensalidade', payload, cabecalho) == (
+        {'erro': 'Assinatura inválida'}, 400
+    )